@@ -0,0 +1,140 @@
+# MIT license
+"""Функции времени MicroPython (ticks_ms, sleep_ms и т.д.) для CPython, с реальными или виртуальными часами.
+Виртуальные часы идут только во время sleep_ms/sleep_us, поэтому 5 секунд измерения SCD4x на ПК длятся
+мгновенно, а результат детерминирован.
+MicroPython time functions (ticks_ms, sleep_ms, etc.) for CPython, with a real or virtual clock.
+The virtual clock advances only during sleep_ms/sleep_us, so 5 seconds of an SCD4x measurement on a PC take no time,
+and the result is deterministic.
+На MicroPython (например, порт Unix) модуль time встроенный и не изменяется: используйте patch, чтобы модули
+драйвера работали с этим модулем вместо time.
+On MicroPython (for example, the Unix port) the time module is built in and is not modified: use patch so that
+the driver modules work with this module instead of time."""
+
+import time as _time
+
+# период счетчиков ticks, как в большинстве портов MicroPython. ticks counters period, as in most MicroPython ports
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+_real_sleep = _time.sleep
+try:
+    _perf_counter = _time.perf_counter
+
+    def real_ticks_us() -> int:
+        """Реальное время, мкс, по модулю периода ticks. Real time, us, modulo the ticks period."""
+        return int(_perf_counter() * 1_000_000) & _TICKS_MAX
+
+    def real_ticks_diff(ticks1: int, ticks2: int) -> int:
+        return ticks_diff(ticks1, ticks2)
+except AttributeError:
+    # MicroPython: свой период ticks у каждого порта. MicroPython: each port has its own ticks period
+    real_ticks_us = _time.ticks_us
+    real_ticks_diff = _time.ticks_diff
+
+
+class _Clock:
+    # None - реальные часы, иначе - текущее виртуальное время, мкс. None - real clock, otherwise the current virtual
+    # time, us
+    virtual_us = None
+    # time() в момент включения виртуальных часов. time() at the moment the virtual clock was enabled
+    epoch = 0
+
+
+def use_virtual_clock(start_ms: int = 0):
+    """Включает виртуальные часы, начиная с start_ms. Enables the virtual clock starting from start_ms."""
+    _Clock.epoch = int(_time.time())
+    _Clock.virtual_us = 1000 * start_ms
+
+
+def use_real_clock():
+    _Clock.virtual_us = None
+
+
+def is_virtual() -> bool:
+    return _Clock.virtual_us is not None
+
+
+def advance_us(us: int):
+    """Продвигает виртуальные часы на us мкс (с реальными часами просто ждет).
+    Advances the virtual clock by us microseconds (with the real clock it just waits)."""
+    if us <= 0:
+        return
+    if _Clock.virtual_us is None:
+        _real_sleep(us / 1_000_000)
+    else:
+        _Clock.virtual_us += us
+
+
+def _now_us() -> int:
+    v = _Clock.virtual_us
+    return real_ticks_us() if v is None else v
+
+
+def ticks_us() -> int:
+    return _now_us() & _TICKS_MAX
+
+
+def ticks_ms() -> int:
+    return (_now_us() // 1000) & _TICKS_MAX
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def sleep_us(us: int):
+    advance_us(us)
+
+
+def sleep_ms(ms: int):
+    advance_us(1000 * ms)
+
+
+def sleep(seconds: float):
+    advance_us(int(1_000_000 * seconds))
+
+
+def time() -> int:
+    """Секунды от начала эпохи. С виртуальными часами идут вместе с ними.
+    Seconds since the epoch. With the virtual clock, they advance with it."""
+    v = _Clock.virtual_us
+    return int(_time.time()) if v is None else _Clock.epoch + v // 1_000_000
+
+
+def patch(*modules):
+    """Заменяет модуль time в модулях modules этим модулем. Replaces the time module in modules with this module."""
+    import sys
+    this = sys.modules[__name__]
+    for module in modules:
+        module.time = this
+
+
+def install():
+    """Добавляет отсутствующие функции MicroPython в модули time и asyncio CPython. Повторный вызов безопасен.
+    Adds the missing MicroPython functions to the CPython time and asyncio modules. A repeated call is safe."""
+    if hasattr(_time, "ticks_ms"):
+        return
+    _time.ticks_ms = ticks_ms
+    _time.ticks_us = ticks_us
+    _time.ticks_add = ticks_add
+    _time.ticks_diff = ticks_diff
+    _time.sleep_ms = sleep_ms
+    _time.sleep_us = sleep_us
+    try:
+        import asyncio
+    except ImportError:
+        return
+
+    async def _sleep_ms(ms: int):
+        if _Clock.virtual_us is None:
+            await asyncio.sleep(ms / 1000)
+        else:
+            advance_us(1000 * ms)
+            await asyncio.sleep(0)
+
+    asyncio.sleep_ms = _sleep_ms
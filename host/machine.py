@@ -0,0 +1,59 @@
+# MIT license
+"""Заглушка модуля machine для запуска драйверов на ПК (CPython). Настоящей шины нет: используйте имитатор
+(например, SCD4xSimulator из scd4x_sim), обмен через эти классы вызывает OSError.
+machine module stub for running the drivers on a PC (CPython). There is no real bus: use a simulator
+(for example, SCD4xSimulator from scd4x_sim), transfers through these classes raise OSError."""
+
+import host_time
+
+host_time.install()
+
+# MicroPython: ENODEV - устройство не ответило на адрес. MicroPython: ENODEV - the device did not acknowledge
+# the address
+_ENODEV = 19
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int = 0):
+        self.id = id
+        self._value = value
+
+    def value(self, x: int = None):
+        if x is None:
+            return self._value
+        self._value = x
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def __call__(self, x: int = None):
+        return self.value(x)
+
+
+class _NoBus:
+    """Шина без устройств. A bus without devices."""
+
+    def __init__(self, id=0, *args, **kwargs):
+        self.id = id
+
+    def _nodev(self, *args, **kwargs):
+        raise OSError(_ENODEV)
+
+
+class I2C(_NoBus):
+    def scan(self) -> list:
+        return []
+
+    writeto = readfrom = readfrom_into = writevto = _NoBus._nodev
+    readfrom_mem = readfrom_mem_into = writeto_mem = _NoBus._nodev
+
+
+class SPI(_NoBus):
+    write = read = readinto = write_readinto = _NoBus._nodev
@@ -0,0 +1,27 @@
+# MIT license
+"""Заглушка модуля micropython для запуска драйверов на ПК (CPython). Декораторы эмиттеров ничего не делают.
+Импорт модуля также добавляет функции времени MicroPython в модуль time (смотри host_time).
+Использование: PYTHONPATH=host:. python3 ...
+micropython module stub for running the drivers on a PC (CPython). Emitter decorators do nothing.
+Importing the module also adds the MicroPython time functions to the time module (see host_time).
+Usage: PYTHONPATH=host:. python3 ..."""
+
+import host_time
+
+host_time.install()
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def mem_info(*args):
+    pass
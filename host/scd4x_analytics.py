@@ -0,0 +1,182 @@
+# MIT license
+"""Анализ журналов SCD4x на ПК (CPython + NumPy). Журналы scd4x_log (записи по 16 байт) и записи сырых 9-ти байтных
+ответов датчика на read_measurement отображаются в память (numpy.memmap) как структурированные массивы, без
+копирования. Преобразование слов в ppm/°C/%, проверка CRC и сводки по окнам времени векторизованы: циклы Python
+идут только по байтам записи или по столбцам, а не по измерениям.
+Использование: PYTHONPATH=host:. python3 ...
+SCD4x log analysis on a PC (CPython + NumPy). scd4x_log logs (16-byte records) and captures of raw 9-byte sensor
+responses to read_measurement are memory-mapped (numpy.memmap) as structured arrays, without copying.
+Word to ppm/°C/% conversion, CRC checks and time window rollups are vectorized: Python loops run only over record
+bytes or columns, not over measurements.
+Usage: PYTHONPATH=host:. python3 ..."""
+
+import glob
+import os
+import numpy as np
+from sensor_pack_2.crc_mod import make_crc8_table
+from scd4x_sensirion import temperature_from_raw, humidity_from_raw
+from scd4x_log import RECORD_SIZE, FLAG_RHT_ONLY
+
+# запись scd4x_log (_RECORD_FORMAT ">IIHHHBB"). scd4x_log record (_RECORD_FORMAT ">IIHHHBB")
+LOG_DTYPE = np.dtype([("epoch", ">u4"), ("tick", ">u4"), ("co2", ">u2"), ("t_raw", ">u2"), ("rh_raw", ">u2"),
+                      ("flags", "u1"), ("crc", "u1")])
+# ответ датчика на read_measurement: три слова, каждое со своим CRC.
+# sensor response to read_measurement: three words, each with its own CRC.
+FRAME_DTYPE = np.dtype([("co2", ">u2"), ("co2_crc", "u1"), ("t_raw", ">u2"), ("t_crc", "u1"), ("rh_raw", ">u2"),
+                        ("rh_crc", "u1")])
+if LOG_DTYPE.itemsize != RECORD_SIZE:
+    raise ValueError(f"LOG_DTYPE does not match scd4x_log record size: {RECORD_SIZE}")
+
+# таблица CRC-8 Sensirion (полином 0x31) из crc_mod. Sensirion CRC-8 table (polynomial 0x31) from crc_mod
+_crc_table = np.frombuffer(make_crc8_table(0x31), dtype=np.uint8)
+
+
+def _map(source, dtype: np.dtype) -> np.ndarray:
+    """Отображает файл (путь) в память или создает представление буфера (bytes, bytearray, memoryview).
+    Неполная последняя запись отбрасывается.
+    Memory-maps a file (path) or creates a view of a buffer (bytes, bytearray, memoryview).
+    An incomplete last record is dropped."""
+    if isinstance(source, str):
+        count = os.path.getsize(source) // dtype.itemsize
+        if not count:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(source, dtype=dtype, mode="r", shape=(count,))
+    buf = memoryview(source)
+    count = buf.nbytes // dtype.itemsize
+    return np.frombuffer(buf, dtype=dtype, count=count)
+
+
+def load_log(source) -> np.ndarray:
+    """Записи журнала scd4x_log (файл сегмента или буфер) как массив LOG_DTYPE, без копирования.
+    scd4x_log records (segment file or buffer) as a LOG_DTYPE array, without copying."""
+    return _map(source, LOG_DTYPE)
+
+
+def load_log_segments(path_prefix: str) -> np.ndarray:
+    """Все сегменты журнала path_prefix (например, 'logs/scd' -> logs/scd0000.bin ...), по порядку, в одном массиве.
+    Внимание: массив - копия! Для очень больших журналов обрабатывайте сегменты по одному (load_log).
+    All segments of the path_prefix log (for example, 'logs/scd' -> logs/scd0000.bin ...), in order, in one array.
+    Warning: the array is a copy! For very large logs, process the segments one by one (load_log)."""
+    paths = sorted(glob.glob(glob.escape(path_prefix) + "[0-9][0-9][0-9][0-9].bin"))
+    parts = [load_log(path) for path in paths]
+    if not parts:
+        return np.empty(0, dtype=LOG_DTYPE)
+    # байты, а не записи: concatenate структурированных массивов меняет порядок байт полей на машинный.
+    # bytes, not records: concatenate of structured arrays changes the field byte order to the native one.
+    return np.concatenate([part.view(np.uint8) for part in parts]).view(LOG_DTYPE)
+
+
+def load_frames(source) -> np.ndarray:
+    """Записанные подряд 9-ти байтные ответы датчика (файл или буфер) как массив FRAME_DTYPE, без копирования.
+    Consecutive 9-byte sensor responses (file or buffer) as a FRAME_DTYPE array, without copying."""
+    return _map(source, FRAME_DTYPE)
+
+
+def _crc_columns(rows: np.ndarray, start: int, stop: int) -> np.ndarray:
+    """CRC-8 Sensirion байтов start..stop-1 каждой строки матрицы rows (uint8). Цикл - только по столбцам.
+    Sensirion CRC-8 of bytes start..stop-1 of each row of the rows matrix (uint8). The loop is over columns only."""
+    crc = np.full(rows.shape[0], 0xFF, dtype=np.uint8)
+    for column in range(start, stop):
+        crc = _crc_table[crc ^ rows[:, column]]
+    return crc
+
+
+def _as_rows(records: np.ndarray) -> np.ndarray:
+    """Байты записей как матрица (N, itemsize) без копирования. Record bytes as an (N, itemsize) matrix without
+    copying."""
+    return np.ascontiguousarray(records).view(np.uint8).reshape(-1, records.dtype.itemsize)
+
+
+def valid_log_mask(records: np.ndarray) -> np.ndarray:
+    """Маска записей LOG_DTYPE с верным CRC (записи, оборванные отключением питания, - False).
+    Mask of LOG_DTYPE records with a correct CRC (records torn by power loss are False)."""
+    rows = _as_rows(np.asarray(records, dtype=LOG_DTYPE))
+    size = LOG_DTYPE.itemsize
+    return _crc_columns(rows, 0, size - 1) == rows[:, size - 1]
+
+
+def valid_frame_mask(frames: np.ndarray) -> np.ndarray:
+    """Маска ответов FRAME_DTYPE, у которых верны CRC всех трех слов.
+    Mask of FRAME_DTYPE responses with correct CRCs of all three words."""
+    rows = _as_rows(np.asarray(frames, dtype=FRAME_DTYPE))
+    mask = np.ones(rows.shape[0], dtype=bool)
+    for offset in (0, 3, 6):
+        mask &= _crc_columns(rows, offset, offset + 2) == rows[:, offset + 2]
+    return mask
+
+
+def to_values(records: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """Преобразует сырые слова (поля co2, t_raw, rh_raw записей LOG_DTYPE или FRAME_DTYPE) в CO2 ppm, T °C и RH %,
+    по формулам get_measurement_value (FMT_FLOAT) из scd4x_sensirion. Возвращает структурированный массив с полями
+    CO2, T, RH.
+    Converts raw words (co2, t_raw, rh_raw fields of LOG_DTYPE or FRAME_DTYPE records) to CO2 ppm, T °C and RH %,
+    with the get_measurement_value (FMT_FLOAT) formulas from scd4x_sensirion. Returns a structured array with the
+    CO2, T, RH fields."""
+    result = np.empty(records.shape[0], dtype=[("CO2", "u2"), ("T", dtype), ("RH", dtype)])
+    result["CO2"] = records["co2"]
+    # функции преобразования драйвера работают и с массивами NumPy. the driver conversion functions also work
+    # with NumPy arrays
+    result["T"] = temperature_from_raw(records["t_raw"].astype(np.float64))
+    result["RH"] = humidity_from_raw(records["rh_raw"].astype(np.float64))
+    return result
+
+
+def unwrap_ticks(ticks: np.ndarray, period: int = 1 << 30) -> np.ndarray:
+    """Разворачивает переполнения ticks_ms (период period) в монотонное время, мс, от первой записи.
+    Unwraps ticks_ms overflows (period) into monotonic time, ms, from the first record."""
+    if not ticks.size:
+        return np.empty(0, dtype=np.int64)
+    steps = np.diff(ticks.astype(np.int64))
+    half = period // 2
+    steps = (steps + half) % period - half
+    result = np.empty(ticks.size, dtype=np.int64)
+    result[0] = 0
+    np.cumsum(steps, out=result[1:])
+    return result
+
+
+def rollup(times: np.ndarray, values: np.ndarray, window: int, valid: np.ndarray = None) -> np.ndarray:
+    """Сводка по окнам времени длиной window (в единицах times, например секунды epoch): начало окна, количество,
+    min, max, mean. Окна без значений не выводятся. valid - необязательная маска учитываемых значений (например,
+    верный CRC и не FLAG_RHT_ONLY для CO2).
+    Rollup over time windows of window length (in times units, for example epoch seconds): window start, count,
+    min, max, mean. Windows without values are not output. valid - an optional mask of the values to count
+    (for example, a correct CRC and not FLAG_RHT_ONLY for CO2)."""
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if valid is not None:
+        times = times[valid]
+        values = values[valid]
+    out_dtype = [("start", "i8"), ("count", "i8"), ("min", "f8"), ("max", "f8"), ("mean", "f8")]
+    if not times.size:
+        return np.empty(0, dtype=out_dtype)
+    bins = times // window
+    if np.any(bins[1:] < bins[:-1]):
+        # время не монотонно (например, установка часов): сортировка. time is not monotonic (for example, clock
+        # setting): sorting
+        order = np.argsort(bins, kind="stable")
+        bins = bins[order]
+        values = values[order]
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    counts = np.diff(np.r_[starts, bins.size])
+    result = np.empty(starts.size, dtype=out_dtype)
+    result["start"] = bins[starts] * window
+    result["count"] = counts
+    result["min"] = np.minimum.reduceat(values, starts)
+    result["max"] = np.maximum.reduceat(values, starts)
+    result["mean"] = np.add.reduceat(values, starts) / counts
+    return result
+
+
+def rollup_log(records: np.ndarray, window: int = 3600) -> dict:
+    """Сводки CO2, T и RH журнала по окнам window секунд (по полю epoch). Учитываются только записи с верным CRC,
+    CO2 - только полные измерения. Возвращает {'CO2': ..., 'T': ..., 'RH': ...}.
+    CO2, T and RH rollups of the log over window-second windows (by the epoch field). Only records with a correct CRC
+    are counted, CO2 - only full measurements. Returns {'CO2': ..., 'T': ..., 'RH': ...}."""
+    valid = valid_log_mask(records)
+    values = to_values(records)
+    epoch = records["epoch"]
+    co2_valid = valid & ((records["flags"] & FLAG_RHT_ONLY) == 0)
+    return {"CO2": rollup(epoch, values["CO2"], window, co2_valid),
+            "T": rollup(epoch, values["T"], window, valid),
+            "RH": rollup(epoch, values["RH"], window, valid)}
@@ -0,0 +1,200 @@
+"""SCD4x Sensirion asyncio module.
+Асинхронный вариант драйвера. Ожидание обработки команды датчиком не блокирует интерпретатор!
+Asynchronous driver variant. Waiting for the sensor to process a command does not block the interpreter!"""
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+from sensor_pack_2 import base_sensor
+from scd4x_sensirion import SCD4xSensirion, serial_number_scd4x, measured_values_scd4x, measured_raw_scd4x, \
+    t_offset_to_raw, t_offset_from_raw, CMD_SAVE_CONFIG, CMD_GET_ID, CMD_SOFT_RESET, CMD_SELF_TEST, CMD_REINIT, \
+    CMD_SET_T_OFFSET, CMD_GET_T_OFFSET, CMD_SET_ALTITUDE, CMD_GET_ALTITUDE, CMD_SET_PRESSURE, \
+    CMD_FORCED_RECALIBRATION, CMD_GET_ASC, CMD_SET_ASC, CMD_READ_MEASUREMENT, CMD_GET_DATA_STATUS, \
+    CMD_WAKE_UP, CMD_POWER_DOWN, CMD_SINGLE_SHOT_RHT, CMD_SINGLE_SHOT, _commands
+
+
+class AsyncSCD4xSensirion(SCD4xSensirion):
+    """Асинхронный драйвер SCD4x. Кодирование команд, разбор ответов и повторы общие с SCD4xSensirion.
+    Для методов, обращающихся к датчику, есть сопрограммы с суффиксом _async (get_id_async, set_altitude_async, ...),
+    ожидающие обработки команды датчиком через asyncio.sleep_ms. Унаследованные методы без суффикса, transaction()
+    и синхронная итерация остаются блокирующими, поэтому класс можно использовать вместо SCD4xSensirion.
+    Чтение измерений: async for value in sensor: ...
+    Asynchronous SCD4x driver. Command encoding, response parsing and retries are shared with SCD4xSensirion.
+    Methods that access the sensor have coroutines with the _async suffix (get_id_async, set_altitude_async, ...),
+    which wait for the sensor to process a command via asyncio.sleep_ms. Inherited methods without the suffix,
+    transaction() and synchronous iteration remain blocking, so the class can be used in place of SCD4xSensirion.
+    Reading measurements: async for value in sensor: ..."""
+
+    def __init__(self, *args, poll_period: int = 500, **kwargs):
+        """poll_period - период опроса готовности данных в async for, мс. Остальные параметры, как у SCD4xSensirion.
+        poll_period - data ready polling period in async for, ms. Other parameters are the same as SCD4xSensirion."""
+        super().__init__(*args, **kwargs)
+        self.poll_period = poll_period
+
+    async def _send_command_async(self, cmd_id: int, value: [int, bytes, None] = None) -> [memoryview, None]:
+        """Асинхронный аналог _send_command, пауза перед повтором тоже не блокирует.
+        Asynchronous analogue of _send_command, the pause before a retry does not block either."""
+        desc = _commands[cmd_id]
+        # неверный аргумент - ValueError до цикла повторов. an invalid argument is a ValueError before the retry loop
+        tx = self._get_tx_buf(desc, value)
+        attempt = 1
+        while True:
+            try:
+                self._connection.write(tx)
+                wait_time = desc.wait_time
+                if wait_time:
+                    await asyncio.sleep_ms(wait_time)
+                return self._read_response(desc)
+            except (OSError, ValueError) as e:
+                delay = self._get_retry_delay(cmd_id, attempt, e)
+            await asyncio.sleep_ms(delay)
+            attempt += 1
+
+    async def _read_word_async(self, cmd_id: int, value: [int, bytes, None] = None) -> int:
+        """Асинхронный аналог _read_word. Asynchronous analogue of _read_word."""
+        return self._decode_word(cmd_id, await self._send_command_async(cmd_id, value))
+
+    async def _read_config_async(self, cmd_id: int) -> int:
+        """Асинхронный аналог _read_config. Asynchronous analogue of _read_config."""
+        raw = self._get_cached(cmd_id)
+        if raw is None:
+            raw = await self._read_word_async(cmd_id)
+            self._put_cached(cmd_id, raw, written=False)
+        return raw
+
+    # Advanced features
+    async def save_config_async(self, force: bool = False) -> bool:
+        """Смотри SCD4xSensirion.save_config. See SCD4xSensirion.save_config."""
+        if not force and not self.is_config_dirty():
+            return False
+        await self._send_command_async(CMD_SAVE_CONFIG)
+        self._config_saved()
+        return True
+
+    async def get_id_async(self) -> serial_number_scd4x:
+        """Return 3 words of unique serial number."""
+        return self._decode_id(await self._send_command_async(CMD_GET_ID))
+
+    async def soft_reset_async(self):
+        """Смотри SCD4xSensirion.soft_reset. See SCD4xSensirion.soft_reset."""
+        await self._send_command_async(CMD_SOFT_RESET)
+        self._config_reloaded(factory=True)
+
+    async def exec_self_test_async(self) -> bool:
+        """Другие задачи выполняются, пока датчик проводит самотестирование (10 секунд)!
+        Other tasks run while the sensor performs a self test (10 seconds)!"""
+        return 0 == await self._read_word_async(CMD_SELF_TEST)
+
+    async def reinit_async(self):
+        """Смотри SCD4xSensirion.reinit. See SCD4xSensirion.reinit."""
+        await self._send_command_async(CMD_REINIT)
+        self._config_reloaded(factory=False)
+
+    # On-chip output signal compensation
+    async def set_temperature_offset_async(self, offset: float):
+        """Метод нужно вызывать только в IDLE режиме датчика! The method should be called only in IDLE sensor mode!"""
+        raw = t_offset_to_raw(offset)
+        await self._send_command_async(CMD_SET_T_OFFSET, raw)
+        self._put_cached(CMD_GET_T_OFFSET, raw, written=True)
+
+    async def get_temperature_offset_async(self) -> float:
+        """Метод нужно вызывать только в IDLE режиме датчика! The method should be called only in IDLE sensor mode!"""
+        return t_offset_from_raw(await self._read_config_async(CMD_GET_T_OFFSET))
+
+    async def set_altitude_async(self, masl: int):
+        """Метод нужно вызывать только в IDLE режиме датчика! The method should be called only in IDLE sensor mode!"""
+        await self._send_command_async(CMD_SET_ALTITUDE, masl)
+        self._put_cached(CMD_GET_ALTITUDE, masl, written=True)
+
+    async def get_altitude_async(self) -> int:
+        """Метод нужно вызывать только в IDLE режиме датчика! The method should be called only in IDLE sensor mode!"""
+        return await self._read_config_async(CMD_GET_ALTITUDE)
+
+    async def set_ambient_pressure_async(self, pressure: float):
+        """pressure - давление в Паскалях! pressure - pressure in Pascals!"""
+        await self._send_command_async(CMD_SET_PRESSURE, int(pressure // 100))     # Pascal // 100
+
+    # Field calibration
+    async def force_recalibration_async(self, target_co2_concentration: int) -> int:
+        """Please read '3.7.1 perform_forced_recalibration'. target_co2_concentration [ppm CO2]"""
+        base_sensor.check_value(target_co2_concentration, range(2**16),
+                                f"Invalid target CO2 concentration: {target_co2_concentration} ppm")
+        return await self._read_word_async(CMD_FORCED_RECALIBRATION, target_co2_concentration)
+
+    async def is_auto_calibration_async(self) -> bool:
+        """Please read '3.7.3 get_automatic_self_calibration_enabled'"""
+        return 0 != await self._read_config_async(CMD_GET_ASC)
+
+    async def set_auto_calibration_async(self, value: bool):
+        """Please read '3.7.2 set_automatic_self_calibration_enabled'"""
+        await self._send_command_async(CMD_SET_ASC, int(value))
+        self._put_cached(CMD_GET_ASC, int(value), written=True)
+
+    async def start_measurement_async(self, start: bool, single_shot: bool = False, rht_only: bool = False):
+        """Смотри SCD4xSensirion.start_measurement. See SCD4xSensirion.start_measurement."""
+        if single_shot:
+            return await self._single_shot_meas_async(rht_only)
+        return await self._periodic_measurement_async(start)
+
+    # Basic Commands
+    async def _periodic_measurement_async(self, start: bool):
+        await self._send_command_async(self._get_periodic_cmd_id(start))
+        self._set_mode(continuous=start, single_shot=False, rht_only=False)
+
+    async def get_measurement_value_async(self, value_index: int = 0) -> [None, measured_values_scd4x,
+                                                                          measured_raw_scd4x]:
+        """Смотри SCD4xSensirion.get_measurement_value. See SCD4xSensirion.get_measurement_value."""
+        return self._decode_measurement(await self._send_command_async(CMD_READ_MEASUREMENT))
+
+    async def read_measurement_into_async(self, out):
+        """Смотри SCD4xSensirion.read_measurement_into. See SCD4xSensirion.read_measurement_into."""
+        b = await self._send_command_async(CMD_READ_MEASUREMENT)
+        self._store_measurement(b)
+        out[0] = (b[0] << 8) | b[1]
+        out[1] = (b[3] << 8) | b[4]
+        out[2] = (b[6] << 8) | b[7]
+        return out
+
+    async def get_data_status_async(self) -> bool:
+        """Return data ready status. Возвращает Истина, когда данные готовы для считывания."""
+        return 0 != (await self._read_word_async(CMD_GET_DATA_STATUS) & 0x7FF)
+
+    # SCD41 only
+    async def set_power_async(self, value: bool):
+        """Please read '3.10.3 power_down' and '3.10.4 wake_up'"""
+        if not self._isSCD41:
+            return
+        if value:
+            self._powered_down = False
+        await self._send_command_async(CMD_WAKE_UP if value else CMD_POWER_DOWN)
+        self._powered_down = not value
+
+    async def _single_shot_meas_async(self, rht_only: bool = False):
+        """Only for SCD41. Смотри SCD4xSensirion._single_shot_meas. See SCD4xSensirion._single_shot_meas."""
+        if not self._isSCD41:
+            return
+        await self._send_command_async(CMD_SINGLE_SHOT_RHT if rht_only else CMD_SINGLE_SHOT)
+        self._set_mode(continuous=False, single_shot=True, rht_only=rht_only)
+
+    # Iterator
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> [measured_values_scd4x, measured_raw_scd4x]:
+        """В режиме периодических измерений ожидает готовности данных, опрашивая датчик с периодом poll_period,
+        и возвращает измерение. В режиме однократных измерений ожидает время преобразования, возвращает измерение
+        и запускает следующее. Иначе завершает итерацию.
+        In periodic measurement mode, waits for data ready, polling the sensor with poll_period,
+        and returns the measurement. In single shot mode, waits for the conversion time, returns the measurement
+        and starts the next one. Otherwise, stops the iteration."""
+        if self.is_continuously_mode():
+            while not await self.get_data_status_async():
+                await asyncio.sleep_ms(self.poll_period)
+            return await self.get_measurement_value_async()
+        if self.is_single_shot_mode():
+            await asyncio.sleep_ms(self.get_conversion_cycle_time())
+            result = await self.get_measurement_value_async()
+            await self._single_shot_meas_async(self.is_rht_only())
+            return result
+        raise StopAsyncIteration
@@ -0,0 +1,450 @@
+"""SCD4x Sensirion benchmark module.
+Тесты производительности драйвера на имитаторе датчика (scd4x_sim) с виртуальными часами: время работы Python-кода
+без обязательных ожиданий датчика, выделенная память и количество обменов по шине, на вызов метода и в сквозных
+сценариях. Результаты - строки JSON, по одной на тест, в stdout и в файл, если он указан.
+CPython:              PYTHONPATH=host:. python3 scd4x_bench.py [bench_output.txt]
+MicroPython Unix:     MICROPYPATH=host:. micropython scd4x_bench.py [bench_output.txt]
+Память: на MicroPython - разность gc.mem_alloc без памяти имитатора, на CPython - пик tracemalloc без пика внутри
+имитатора (отдельным проходом, так как tracemalloc замедляет код). В обоих случаях вычитается собственная память
+измерителя, откалиброванная на пустом участке. На CPython целые числа больше 256 и float всегда создаются в куче,
+поэтому нулевое выделение памяти проверяется только на MicroPython.
+Driver benchmarks on the sensor simulator (scd4x_sim) with the virtual clock: Python code time without mandatory
+sensor waits, allocated memory and number of bus transfers, per method call and in end-to-end scenarios.
+The results are JSON lines, one per benchmark, to stdout and to a file if given.
+Memory: on MicroPython - gc.mem_alloc difference without the simulator memory, on CPython - tracemalloc peak
+without the peak inside the simulator (in a separate pass, since tracemalloc slows the code down). In both cases,
+the meter's own memory, calibrated on an empty section, is subtracted. On CPython, integers above 256 and floats are
+always heap objects, so zero allocation is only verified on MicroPython."""
+
+from array import array
+import gc
+import json
+import os
+import sys
+import host_time
+from sensor_pack_2 import bus_service
+import scd4x_sensirion
+import scd4x_scheduler
+import scd4x_mixed
+import scd4x_multi
+import scd4x_sim
+import scd4x_log
+from scd4x_sensirion import SCD4xSensirion, FMT_FLOAT, FMT_RAW, FMT_FIXED
+from scd4x_scheduler import DataReadyScheduler
+from scd4x_mixed import MixedRateScheduler
+from scd4x_multi import MultiSensorPoller
+from scd4x_sim import SCD4xSimulator
+from scd4x_log import MeasurementLog, get_segments
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None      # MicroPython
+
+# модули драйвера работают с виртуальными часами. the driver modules work with the virtual clock
+host_time.patch(bus_service, scd4x_sensirion, scd4x_scheduler, scd4x_mixed, scd4x_multi, scd4x_sim, scd4x_log)
+_mem_alloc = getattr(gc, "mem_alloc", None)
+
+# количество вызовов в тестах методов. number of calls in method benchmarks
+_CALLS = 200
+# длительность сквозных сценариев, мс. end-to-end scenario duration, ms
+_HOUR_MS = 3_600_000
+# каталог журнала измерений в тесте MeasurementLog, удаляется после теста.
+# measurement log directory of the MeasurementLog benchmark, removed after the benchmark.
+_LOG_DIR = "bench_log"
+
+
+class _Totals:
+    """Суммы по всем имитаторам: обмены, время и память внутри имитатора.
+    Totals over all simulators: transfers, time and memory inside the simulator."""
+    bus_calls = 0
+    adapter_us = 0
+    adapter_alloc = 0
+    # CPython: пик tracemalloc кода драйвера до входа в имитатор. CPython: tracemalloc peak of the driver code before
+    # entering the simulator
+    driver_peak = 0
+
+
+class _CountingSimulator(SCD4xSimulator):
+    """Имитатор, считающий вызовы адаптера (write_then_read_into - один вызов) и время и память внутри себя.
+    Simulator counting adapter calls (write_then_read_into is one call) and the time and memory inside itself."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("bus_freq", 0)
+        super().__init__(*args, **kwargs)
+        self._depth = 0
+        self._t0 = 0
+        self._a0 = 0
+
+    def _enter(self):
+        if not self._depth:
+            _Totals.bus_calls += 1
+            if _mem_alloc:
+                self._a0 = _mem_alloc()
+            elif tracemalloc is not None and tracemalloc.is_tracing():
+                _Totals.driver_peak = max(_Totals.driver_peak, tracemalloc.get_traced_memory()[1])
+            self._t0 = host_time.real_ticks_us()
+        self._depth += 1
+
+    def _exit(self):
+        self._depth -= 1
+        if not self._depth:
+            _Totals.adapter_us += host_time.real_ticks_diff(host_time.real_ticks_us(), self._t0)
+            if _mem_alloc:
+                _Totals.adapter_alloc += _mem_alloc() - self._a0
+            elif tracemalloc is not None and tracemalloc.is_tracing():
+                # пик внутри имитатора не учитывается. the peak inside the simulator is not counted
+                tracemalloc.reset_peak()
+
+    def write(self, device_addr, buf: bytes):
+        self._enter()
+        try:
+            return super().write(device_addr, buf)
+        finally:
+            self._exit()
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        self._enter()
+        try:
+            return super().read_to_buf(device_addr, buf)
+        finally:
+            self._exit()
+
+    def write_then_read_into(self, device_addr, out_buf, in_buf, delay_us: int = 0):
+        self._enter()
+        try:
+            return super().write_then_read_into(device_addr, out_buf, in_buf, delay_us)
+        finally:
+            self._exit()
+
+
+class _Meter:
+    """Измеряет участки кода драйвера между start и stop. alloc - измерять память. Из памяти каждого участка
+    вычитается overhead - память, которую выделяет сам _Meter (смотри _calibrate).
+    Measures driver code sections between start and stop. alloc - measure memory. overhead, the memory allocated by
+    _Meter itself (see _calibrate), is subtracted from the memory of each section."""
+    # байт на участок, None - еще не откалибровано. bytes per section, None - not calibrated yet
+    overhead = None
+
+    def __init__(self, alloc: bool):
+        self.alloc = alloc and (_mem_alloc is not None or tracemalloc is not None)
+        self.calls = 0
+        self.py_us = 0
+        self.bytes = 0
+        self.bus_calls = 0
+
+    def start(self):
+        if self.alloc:
+            if _mem_alloc:
+                gc.disable()
+                self._a0 = _mem_alloc()
+            else:
+                tracemalloc.reset_peak()
+                self._a0 = tracemalloc.get_traced_memory()[0]
+                _Totals.driver_peak = 0
+            self._adapter_alloc = _Totals.adapter_alloc
+        self._bus = _Totals.bus_calls
+        self._adapter_us = _Totals.adapter_us
+        self._t0 = host_time.real_ticks_us()
+
+    def stop(self):
+        dt = host_time.real_ticks_diff(host_time.real_ticks_us(), self._t0)
+        self.py_us += dt - (_Totals.adapter_us - self._adapter_us)
+        self.bus_calls += _Totals.bus_calls - self._bus
+        self.calls += 1
+        if self.alloc:
+            if _mem_alloc:
+                n = _mem_alloc() - self._a0 - (_Totals.adapter_alloc - self._adapter_alloc)
+                gc.enable()
+            else:
+                n = max(_Totals.driver_peak, tracemalloc.get_traced_memory()[1]) - self._a0
+            n -= _Meter.overhead or 0
+            self.bytes += n if n > 0 else 0
+
+
+def _make_sensor(output_format: int = FMT_FLOAT, cache_config: bool = True, **kwargs) -> SCD4xSensirion:
+    """Новый имитатор и датчик в IDLE, виртуальные часы с нуля.
+    A new simulator and a sensor in IDLE, the virtual clock from zero."""
+    host_time.use_virtual_clock()
+    sen = SCD4xSensirion(_CountingSimulator(**kwargs), output_format=output_format, cache_config=cache_config)
+    sen.start_measurement(start=False)
+    return sen
+
+
+# тесты методов: функция получает _Meter, возвращает количество измерений.
+# method benchmarks: a function takes a _Meter, returns the number of measurements.
+def _measurement_value(output_format: int):
+    def bench(meter: _Meter) -> int:
+        sen = _make_sensor(output_format)
+        sen.start_measurement(start=True)
+        for _ in range(_CALLS):
+            host_time.sleep_ms(5000)
+            meter.start()
+            sen.get_measurement_value()
+            meter.stop()
+        return _CALLS
+    return bench
+
+
+def _bench_read_measurement_into(meter: _Meter) -> int:
+    sen = _make_sensor()
+    sen.start_measurement(start=True)
+    out = array("H", (0, 0, 0))
+    for _ in range(_CALLS):
+        host_time.sleep_ms(5000)
+        meter.start()
+        sen.read_measurement_into(out)
+        meter.stop()
+    return _CALLS
+
+
+def _bench_data_status(meter: _Meter) -> int:
+    sen = _make_sensor()
+    sen.start_measurement(start=True)
+    for _ in range(_CALLS):
+        meter.start()
+        sen.get_data_status()
+        meter.stop()
+    return 0
+
+
+def _bench_set_ambient_pressure(meter: _Meter) -> int:
+    sen = _make_sensor()
+    sen.start_measurement(start=True)
+    for i in range(_CALLS):
+        meter.start()
+        sen.set_ambient_pressure(100_000 + 100 * (i & 7))
+        meter.stop()
+    return 0
+
+
+def _idle_method(name: str, cache_config: bool = True, arg=None):
+    def bench(meter: _Meter) -> int:
+        sen = _make_sensor(cache_config=cache_config)
+        method = getattr(sen, name)
+        for _ in range(_CALLS):
+            if arg is None:
+                meter.start()
+                method()
+            else:
+                meter.start()
+                method(arg)
+            meter.stop()
+        return 0
+    return bench
+
+
+def _bench_state_roundtrip(meter: _Meter) -> int:
+    """get_state и resume_from после отклоненного отрицательного смещения температуры. Заодно проверка: снимок
+    восстанавливается без изменений, а кэш совпадает со словом в датчике, иначе ValueError.
+    get_state and resume_from after a rejected negative temperature offset. Also a check: the snapshot is restored
+    unchanged and the cache matches the word in the sensor, otherwise ValueError."""
+    sen = _make_sensor()
+    adapter = sen._connection.adapter
+    sen.set_temperature_offset(4.5)
+    try:
+        sen.set_temperature_offset(-1.0)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Negative temperature offset accepted!")
+    sen.start_measurement(start=False, single_shot=True)
+    host_time.sleep_ms(sen.get_conversion_cycle_time())
+    sen.get_measurement_value()
+    for _ in range(_CALLS):
+        meter.start()
+        state = sen.get_state()
+        resumed = SCD4xSensirion.resume_from(adapter, state)
+        meter.stop()
+        if resumed.get_state() != state or resumed.get_temperature_offset() != sen.get_temperature_offset():
+            raise ValueError("State snapshot does not round-trip!")
+        if resumed._get_cached(scd4x_sensirion.CMD_GET_T_OFFSET) != adapter._config[0]:
+            raise ValueError("Cached temperature offset differs from the sensor!")
+    return 0
+
+
+def _bench_log_append(meter: _Meter) -> int:
+    """Добавление записей в MeasurementLog с ротацией сегментов. Заодно проверка: после ротации остается ровно
+    max_segments сегментов, иначе ValueError.
+    Appending records to a MeasurementLog with segment rotation. Also a check: exactly max_segments segments remain
+    after rotation, otherwise ValueError."""
+    prefix = _LOG_DIR + "/scd"
+    try:
+        os.mkdir(_LOG_DIR)
+    except OSError:
+        pass
+    max_segments = 5
+    try:
+        log = MeasurementLog(prefix, page_size=64, segment_pages=1, max_segments=max_segments)
+        for i in range(_CALLS):
+            meter.start()
+            log.append(600, 26214, 32768, i, 0)
+            meter.stop()
+            if log.page_writes > max_segments and max_segments != len(get_segments(prefix)):
+                raise ValueError(f"Log rotation kept {len(get_segments(prefix))} segments, expected {max_segments}!")
+    finally:
+        for index in get_segments(prefix):
+            os.remove("%s%04d.bin" % (prefix, index))
+        os.rmdir(_LOG_DIR)
+    return _CALLS
+
+
+# сквозные сценарии. end-to-end scenarios
+def _bench_periodic_scheduler(meter: _Meter) -> int:
+    """Час периодических измерений, чтение по DataReadyScheduler. An hour of periodic measurements, DataReadyScheduler."""
+    sen = _make_sensor(period_ms=5050)
+    sen.start_measurement(start=True)
+    sched = DataReadyScheduler(sen)
+    samples = 0
+    while host_time.ticks_ms() < _HOUR_MS:
+        meter.start()
+        value = sched.service()
+        meter.stop()
+        if value is not None:
+            samples += 1
+        host_time.sleep_ms(sched.time_to_next() or 1)
+    return samples
+
+
+def _bench_periodic_poll(meter: _Meter) -> int:
+    """Час периодических измерений, опрос готовности каждые 100 мс. An hour of periodic measurements, ready status
+    polling every 100 ms."""
+    sen = _make_sensor(period_ms=5050)
+    sen.start_measurement(start=True)
+    samples = 0
+    while host_time.ticks_ms() < _HOUR_MS:
+        meter.start()
+        value = sen.get_measurement_value() if sen.get_data_status() else None
+        meter.stop()
+        if value is not None:
+            samples += 1
+        host_time.sleep_ms(100)
+    return samples
+
+
+def _bench_single_shot(meter: _Meter) -> int:
+    """100 однократных измерений. 100 single shots."""
+    sen = _make_sensor()
+    for _ in range(100):
+        meter.start()
+        sen.start_measurement(start=False, single_shot=True)
+        meter.stop()
+        host_time.sleep_ms(sen.get_conversion_cycle_time())
+        meter.start()
+        sen.get_measurement_value()
+        meter.stop()
+    return 100
+
+
+def _bench_mixed(meter: _Meter) -> int:
+    """10 минут: T/RH раз в секунду, CO2 раз в 30 секунд. 10 minutes: T/RH once a second, CO2 once every 30 seconds."""
+    sen = _make_sensor()
+    sched = MixedRateScheduler(sen, 1000, 30_000)
+    samples = 0
+    while host_time.ticks_ms() < 600_000:
+        meter.start()
+        value = sched.service()
+        meter.stop()
+        if value is not None:
+            samples += 1
+        host_time.sleep_ms(sched.time_to_next() or 1)
+    return samples
+
+
+def _bench_multi(meter: _Meter) -> int:
+    """Час опроса четырех датчиков на разных шинах. An hour of polling four sensors on different buses."""
+    host_time.use_virtual_clock()
+    poller = MultiSensorPoller()
+    for i in range(4):
+        adapter = _CountingSimulator(period_ms=4990 + 10 * i)
+        sen = SCD4xSensirion(adapter)
+        sen.start_measurement(start=False)
+        poller.add(adapter, sen)
+    poller.start()
+    samples = 0
+    while host_time.ticks_ms() < _HOUR_MS:
+        meter.start()
+        samples += poller.service()
+        meter.stop()
+        host_time.sleep_ms(poller.time_to_next() or 1)
+    return samples
+
+
+_benchmarks = (
+    ("get_measurement_value.float", _measurement_value(FMT_FLOAT)),
+    ("get_measurement_value.raw", _measurement_value(FMT_RAW)),
+    ("get_measurement_value.fixed", _measurement_value(FMT_FIXED)),
+    ("read_measurement_into", _bench_read_measurement_into),
+    ("get_data_status", _bench_data_status),
+    ("get_id", _idle_method("get_id")),
+    ("get_temperature_offset.cached", _idle_method("get_temperature_offset")),
+    ("get_temperature_offset", _idle_method("get_temperature_offset", cache_config=False)),
+    ("set_temperature_offset", _idle_method("set_temperature_offset", arg=4.5)),
+    ("get_altitude", _idle_method("get_altitude", cache_config=False)),
+    ("set_altitude", _idle_method("set_altitude", arg=160)),
+    ("is_auto_calibration", _idle_method("is_auto_calibration", cache_config=False)),
+    ("set_auto_calibration", _idle_method("set_auto_calibration", arg=False)),
+    ("set_ambient_pressure", _bench_set_ambient_pressure),
+    ("get_state.resume_from", _bench_state_roundtrip),
+    ("MeasurementLog.append", _bench_log_append),
+    ("scenario.periodic_1h_scheduler", _bench_periodic_scheduler),
+    ("scenario.periodic_1h_poll_100ms", _bench_periodic_poll),
+    ("scenario.single_shot_100", _bench_single_shot),
+    ("scenario.mixed_rate_10min", _bench_mixed),
+    ("scenario.multi_sensor_4x_1h", _bench_multi),
+)
+
+
+def _calibrate() -> int:
+    """Память, выделяемая самим _Meter на пустом участке, байт на участок. На CPython вызывается при включенном
+    tracemalloc.
+    Memory allocated by _Meter itself on an empty section, bytes per section. On CPython, called with tracemalloc
+    enabled."""
+    _Meter.overhead = 0
+    meter = _Meter(alloc=True)
+    for _ in range(_CALLS):
+        meter.start()
+        meter.stop()
+    return meter.bytes // meter.calls
+
+
+def run_benchmark(name: str, func) -> dict:
+    """Выполняет один тест. На CPython память измеряется вторым проходом.
+    Runs one benchmark. On CPython, memory is measured by a second pass."""
+    gc.collect()
+    if _mem_alloc is not None and _Meter.overhead is None:
+        _Meter.overhead = _calibrate()
+    meter = _Meter(alloc=_mem_alloc is not None)
+    samples = func(meter)
+    alloc = meter.bytes
+    if _mem_alloc is None and tracemalloc is not None:
+        tracemalloc.start()
+        if _Meter.overhead is None:
+            _Meter.overhead = _calibrate()
+        alloc_meter = _Meter(alloc=True)
+        func(alloc_meter)
+        tracemalloc.stop()
+        alloc = alloc_meter.bytes
+    calls = meter.calls or 1
+    return {"name": name, "impl": sys.implementation.name, "calls": meter.calls, "samples": samples,
+            "py_us": meter.py_us, "py_us_per_call": round(meter.py_us / calls, 2), "alloc_bytes": alloc,
+            "alloc_per_call": round(alloc / calls, 1), "bus_calls": meter.bus_calls,
+            "bus_calls_per_call": round(meter.bus_calls / calls, 3)}
+
+
+def main(path: str = None):
+    out = None if path is None else open(path, "w")
+    try:
+        for name, func in _benchmarks:
+            line = json.dumps(run_benchmark(name, func))
+            print(line)
+            if out is not None:
+                out.write(line + "\n")
+    finally:
+        if out is not None:
+            out.close()
+        host_time.use_real_clock()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,124 @@
+"""SCD4x measurement history module.
+Кольцевой буфер сырых измерений SCD4x фиксированной емкости.
+Fixed-capacity ring buffer of raw SCD4x measurements."""
+
+from array import array
+from sensor_pack_2.base_sensor import Iterator
+from scd4x_sensirion import measured_raw_scd4x
+import micropython
+import time
+
+
+class MeasurementRing(Iterator):
+    """Кольцевой буфер измерений: три сырых слова (CO2, T, RH) в array('H') и метка времени (ticks_ms) в array('I').
+    Около 10 байт на измерение, вся память выделяется в конструкторе!
+    Measurement ring buffer: three raw words (CO2, T, RH) in array('H') and a timestamp (ticks_ms) in array('I').
+    About 10 bytes per measurement, all memory is allocated in the constructor!"""
+
+    def __init__(self, capacity: int, overwrite: bool = True):
+        """capacity - емкость буфера (количество измерений).
+        overwrite - если Истина, то при заполнении буфера самое старое измерение перезаписывается, иначе новое
+        измерение отбрасывается.
+        capacity - buffer capacity (number of measurements).
+        overwrite - if True, the oldest measurement is overwritten when the buffer is full, otherwise the new
+        measurement is dropped."""
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}")
+        self._capacity = capacity
+        self.overwrite = overwrite
+        self._co2 = array("H", (0 for _ in range(capacity)))
+        self._t = array("H", (0 for _ in range(capacity)))
+        self._rh = array("H", (0 for _ in range(capacity)))
+        self._ticks = array("I", (0 for _ in range(capacity)))
+        # индекс для следующей записи и количество измерений. index for the next write and number of measurements
+        self._head = 0
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._count
+
+    def is_full(self) -> bool:
+        return self._count == self._capacity
+
+    def clear(self):
+        """Очищает буфер. Clears the buffer."""
+        self._head = 0
+        self._count = 0
+
+    @micropython.native
+    def append(self, co2: int, t_raw: int, rh_raw: int, tick: int) -> bool:
+        """Добавляет измерение. Возвращает Ложь, если буфер заполнен и перезапись запрещена.
+        Adds a measurement. Returns False if the buffer is full and overwriting is disabled."""
+        cap = self._capacity
+        if self._count == cap:
+            if not self.overwrite:
+                return False
+        else:
+            self._count += 1
+        i = self._head
+        self._co2[i] = co2
+        self._t[i] = t_raw
+        self._rh[i] = rh_raw
+        self._ticks[i] = tick
+        i += 1
+        self._head = 0 if i == cap else i
+        return True
+
+    @micropython.native
+    def append_frame(self, buf, tick: int = -1) -> bool:
+        """Добавляет измерение прямо из 9-ти байтного буфера приема датчика (слова по смещениям 0, 3, 6).
+        Если tick < 0, то используется time.ticks_ms(). Память не выделяется!
+        Adds a measurement directly from the 9-byte sensor receive buffer (words at offsets 0, 3, 6).
+        If tick < 0, time.ticks_ms() is used. No memory allocation!"""
+        if tick < 0:
+            tick = time.ticks_ms()
+        return self.append((buf[0] << 8) | buf[1], (buf[3] << 8) | buf[4], (buf[6] << 8) | buf[7], tick)
+
+    def _physical(self, index: int) -> int:
+        """Возвращает индекс в массивах по логическому индексу (0 - самое старое, -1 - самое новое измерение).
+        Returns the array index by logical index (0 - the oldest, -1 - the newest measurement)."""
+        cnt = self._count
+        if index < 0:
+            index += cnt
+        if not 0 <= index < cnt:
+            raise IndexError(f"Invalid index: {index}")
+        return (self._head - cnt + index) % self._capacity
+
+    def get_words(self, index: int) -> tuple:
+        """Возвращает сырые слова (CO2, T, RH) и метку времени измерения с логическим индексом index.
+        Returns the raw words (CO2, T, RH) and the timestamp of the measurement with logical index index."""
+        i = self._physical(index)
+        return self._co2[i], self._t[i], self._rh[i], self._ticks[i]
+
+    def get_tick(self, index: int) -> int:
+        """Возвращает метку времени (ticks_ms) измерения. Returns the measurement timestamp (ticks_ms)."""
+        return self._ticks[self._physical(index)]
+
+    def __getitem__(self, index: int) -> measured_raw_scd4x:
+        i = self._physical(index)
+        return measured_raw_scd4x(self._co2[i], self._t[i], self._rh[i])
+
+    def latest(self, n: int):
+        """Генератор последних n измерений, от более старого к самому новому.
+        Generator of the latest n measurements, from older to the newest."""
+        cnt = self._count
+        if n > cnt:
+            n = cnt
+        for index in range(cnt - n, cnt):
+            yield self[index]
+
+    # Iterator
+    def __iter__(self):
+        """Все измерения, от самого старого к самому новому. All measurements, from the oldest to the newest."""
+        return self.latest(self._count)
+
+    def __next__(self) -> [None, measured_raw_scd4x]:
+        """Возвращает самое новое измерение или None, если буфер пуст.
+        Returns the newest measurement or None if the buffer is empty."""
+        if not self._count:
+            return None
+        return self[-1]
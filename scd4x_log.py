@@ -0,0 +1,227 @@
+"""SCD4x Sensirion measurement log module.
+Журнал измерений SCD4x во флэш-памяти: записи фиксированного размера, только добавление, запись целыми страницами
+в файлы-сегменты, CRC каждой записи для обнаружения записей, оборванных отключением питания.
+SCD4x measurement log in flash memory: fixed-size records, append only, writes in whole pages into segment files,
+CRC of each record to detect records torn by power loss."""
+
+from collections import namedtuple
+from micropython import const
+from sensor_pack_2.crc_mod import crc8_31
+from scd4x_sensirion import SCD4xSensirion
+import micropython
+import os
+import struct
+import time
+
+# запись журнала: time.time(), ticks_ms, сырые слова CO2, T, RH, флаги, CRC. 16 байт.
+# log record: time.time(), ticks_ms, raw CO2, T, RH words, flags, CRC. 16 bytes.
+_RECORD_FORMAT = ">IIHHHBB"
+RECORD_SIZE = const(16)
+
+# флаги записи. Биты 4..7 - для приложения (смотри MeasurementLog.user_flags).
+# record flags. Bits 4..7 are for the application (see MeasurementLog.user_flags).
+FLAG_RHT_ONLY = const(0x01)         # CO2 не измерялся. CO2 was not measured
+FLAG_SINGLE_SHOT = const(0x02)
+FLAG_LOW_POWER = const(0x04)
+
+log_record_scd4x = namedtuple("log_record_scd4x", "epoch tick co2 t_raw rh_raw flags")
+
+
+def _split_prefix(path_prefix: str) -> tuple:
+    """'/log/scd' -> ('/log', 'scd')"""
+    i = path_prefix.rfind("/")
+    if i < 0:
+        return ".", path_prefix
+    return path_prefix[:i] or "/", path_prefix[i + 1:]
+
+
+def _segment_path(path_prefix: str, index: int) -> str:
+    return "%s%04d.bin" % (path_prefix, index)
+
+
+def get_segments(path_prefix: str) -> list:
+    """Возвращает отсортированные номера существующих сегментов журнала path_prefix.
+    Returns the sorted numbers of the existing segments of the path_prefix log."""
+    directory, name = _split_prefix(path_prefix)
+    result = []
+    for entry in os.listdir(directory):
+        if entry.startswith(name) and entry.endswith(".bin"):
+            digits = entry[len(name):-4]
+            if 4 == len(digits) and digits.isdigit():
+                result.append(int(digits))
+    result.sort()
+    return result
+
+
+def _file_size(path: str) -> int:
+    return os.stat(path)[6]
+
+
+class MeasurementLog:
+    """Журнал измерений. Записи копируются в страницу ОЗУ, выделенную в конструкторе; заполненная страница
+    дописывается в текущий сегмент одной операцией записи. Сегмент содержит segment_pages страниц, затем начинается
+    новый; при max_segments > 0 самые старые сегменты удаляются. page_size лучше сделать равным размеру блока
+    файловой системы (или его доле), это уменьшает износ флэш-памяти.
+    Может использоваться как history датчика (смотри attach): измерения добавляются прямо из буфера приема.
+    Measurement log. Records are copied into a RAM page allocated in the constructor; a full page is appended to the
+    current segment with one write operation. A segment holds segment_pages pages, then a new one starts;
+    with max_segments > 0 the oldest segments are removed. Making page_size equal to the file system block size
+    (or a fraction of it) reduces flash wear.
+    Can be used as the sensor history (see attach): measurements are added directly from the receive buffer."""
+
+    def __init__(self, path_prefix: str, page_size: int = 512, segment_pages: int = 64, max_segments: int = 0):
+        """path_prefix - путь и начало имени файлов сегментов, например '/log/scd' -> /log/scd0000.bin.
+        page_size - размер страницы, байт, кратен RECORD_SIZE.
+        path_prefix - path and file name start of the segments, for example '/log/scd' -> /log/scd0000.bin.
+        page_size - page size, bytes, a multiple of RECORD_SIZE."""
+        if page_size < RECORD_SIZE or page_size % RECORD_SIZE:
+            raise ValueError(f"Invalid page size: {page_size}")
+        self.path_prefix = path_prefix
+        self.segment_pages = segment_pages
+        self.max_segments = max_segments
+        self._page = bytearray(page_size)
+        self._mv = memoryview(self._page)
+        # позиция следующей записи и начало еще не записанной части страницы.
+        # next record position and the start of the not yet written part of the page.
+        self._pos = 0
+        self._written = 0
+        self._sensor = None
+        # флаги приложения (биты 4..7), добавляемые к каждой записи. application flags (bits 4..7) added to each record
+        self.user_flags = 0
+        # счетчики. counters
+        self.records = 0
+        self.page_writes = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        """Продолжает последний сегмент или начинает новый. Сегмент с оборванной записью не продолжается.
+        Continues the last segment or starts a new one. A segment with a torn record is not continued."""
+        segments = get_segments(self.path_prefix)
+        if not segments:
+            self._segment = 0
+            self._segment_bytes = 0
+            return
+        last = segments[-1]
+        size = _file_size(_segment_path(self.path_prefix, last))
+        if size % RECORD_SIZE or size >= self.segment_pages * len(self._page):
+            self._segment = last + 1
+            self._segment_bytes = 0
+        else:
+            self._segment = last
+            self._segment_bytes = size
+
+    def attach(self, sensor: SCD4xSensirion):
+        """Подключает журнал к датчику: каждое считанное измерение записывается в журнал с флагами режима датчика.
+        Attaches the log to the sensor: each read measurement is logged with the sensor mode flags."""
+        self._sensor = sensor
+        sensor.history = self
+
+    def _get_flags(self) -> int:
+        flags = self.user_flags & 0xF0
+        sen = self._sensor
+        if sen is not None:
+            if sen.is_single_shot_mode():
+                flags |= FLAG_SINGLE_SHOT
+                if sen.is_rht_only():
+                    flags |= FLAG_RHT_ONLY
+            elif sen.is_low_power_mode():
+                flags |= FLAG_LOW_POWER
+        return flags
+
+    @micropython.native
+    def append(self, co2: int, t_raw: int, rh_raw: int, tick: int, flags: int = -1) -> bool:
+        """Добавляет запись. Если flags < 0, флаги берутся из режима подключенного датчика. Возвращает Истина.
+        Adds a record. If flags < 0, the flags are taken from the attached sensor mode. Returns True."""
+        if flags < 0:
+            flags = self._get_flags()
+        pos = self._pos
+        page = self._page
+        struct.pack_into(_RECORD_FORMAT, page, pos, int(time.time()) & 0xFFFFFFFF, tick & 0xFFFFFFFF, co2, t_raw,
+                         rh_raw, flags, 0)
+        page[pos + RECORD_SIZE - 1] = crc8_31(page, pos, pos + RECORD_SIZE - 1)
+        pos += RECORD_SIZE
+        self._pos = pos
+        self.records += 1
+        if pos == len(page):
+            self._write_page()
+        return True
+
+    @micropython.native
+    def append_frame(self, buf, tick: int = -1) -> bool:
+        """Добавляет измерение прямо из 9-ти байтного буфера приема датчика. Если tick < 0, то используется
+        time.ticks_ms(). Совместим с scd4x_history.MeasurementRing.append_frame.
+        Adds a measurement directly from the 9-byte sensor receive buffer. If tick < 0, time.ticks_ms() is used.
+        Compatible with scd4x_history.MeasurementRing.append_frame."""
+        if tick < 0:
+            tick = time.ticks_ms()
+        return self.append((buf[0] << 8) | buf[1], (buf[3] << 8) | buf[4], (buf[6] << 8) | buf[7], tick)
+
+    def _write_page(self):
+        """Дописывает незаписанную часть страницы в сегмент. Appends the unwritten part of the page to the segment."""
+        start, end = self._written, self._pos
+        if start == end:
+            return
+        if not self._segment_bytes and self.max_segments > 0:
+            self._remove_old()
+        with open(_segment_path(self.path_prefix, self._segment), "ab") as f:
+            f.write(self._mv[start:end])
+        self.page_writes += 1
+        self._segment_bytes += end - start
+        if end == len(self._page):
+            self._pos = self._written = 0
+        else:
+            self._written = end
+        if self._segment_bytes >= self.segment_pages * len(self._page):
+            self._segment += 1
+            self._segment_bytes = 0
+
+    def _remove_old(self):
+        """Удаляет самые старые сегменты перед созданием нового. Removes the oldest segments before creating a new one."""
+        segments = get_segments(self.path_prefix)
+        # новый сегмент будет max_segments-м. the new segment will be the max_segments-th
+        for index in segments[:max(0, len(segments) + 1 - self.max_segments)]:
+            os.remove(_segment_path(self.path_prefix, index))
+
+    def flush(self):
+        """Записывает неполную страницу (например, перед сном или выключением). Увеличивает износ, не злоупотребляйте!
+        Writes an incomplete page (for example, before sleep or power off). Increases wear, do not overuse!"""
+        self._write_page()
+
+    def pending(self) -> int:
+        """Количество записей, еще не записанных во флэш-память. Number of records not yet written to flash."""
+        return (self._pos - self._written) // RECORD_SIZE
+
+
+class LogReader:
+    """Ленивое чтение журнала MeasurementLog: генератор records читает сегменты по порядку, блоками по chunk_size байт.
+    Записи с неверным CRC (оборванные отключением питания) пропускаются и подсчитываются в bad_records.
+    Lazy reading of a MeasurementLog: the records generator reads the segments in order, in blocks of chunk_size
+    bytes. Records with a wrong CRC (torn by power loss) are skipped and counted in bad_records."""
+
+    def __init__(self, path_prefix: str, chunk_size: int = 512):
+        self.path_prefix = path_prefix
+        self.chunk_size = chunk_size - chunk_size % RECORD_SIZE or RECORD_SIZE
+        self.bad_records = 0
+
+    def records(self, first_segment: int = 0):
+        """Генератор log_record_scd4x. first_segment - номер первого читаемого сегмента.
+        Generator of log_record_scd4x. first_segment - number of the first segment to read."""
+        buf = bytearray(self.chunk_size)
+        mv = memoryview(buf)
+        for index in get_segments(self.path_prefix):
+            if index < first_segment:
+                continue
+            with open(_segment_path(self.path_prefix, index), "rb") as f:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    for pos in range(0, n - RECORD_SIZE + 1, RECORD_SIZE):
+                        if crc8_31(mv, pos, pos + RECORD_SIZE - 1) != buf[pos + RECORD_SIZE - 1]:
+                            self.bad_records += 1
+                            continue
+                        epoch, tick, co2, t, rh, flags, _ = struct.unpack_from(_RECORD_FORMAT, buf, pos)
+                        yield log_record_scd4x(epoch=epoch, tick=tick, co2=co2, t_raw=t, rh_raw=rh, flags=flags)
+                    if n % RECORD_SIZE:
+                        self.bad_records += 1   # оборванная последняя запись. torn last record
+                        break
@@ -0,0 +1,168 @@
+"""SCD4x Sensirion mixed-rate module.
+Планировщик однократных измерений SCD41 с разными периодами для T/RH (быстрые измерения только T и RH) и для CO2.
+SCD41 single shot scheduler with different periods for T/RH (fast T and RH only shots) and for CO2."""
+
+from collections import namedtuple
+from micropython import const
+from sensor_pack_2.base_sensor import Iterator
+from scd4x_sensirion import SCD4xSensirion
+import time
+
+# Объединенное измерение. CO2 - последнее измеренное значение CO2 (None, пока его нет), co2_age - его возраст, мс;
+# T, RH - свежие значения; tick - время чтения (ticks_ms).
+# Merged measurement. CO2 - the last measured CO2 value (None until there is one), co2_age - its age, ms;
+# T, RH - fresh values; tick - read time (ticks_ms).
+mixed_values_scd4x = namedtuple("mixed_values_scd4x", "CO2 T RH co2_age tick")
+
+# вид текущего измерения. current shot kind
+_SHOT_NONE = const(0)
+_SHOT_RHT = const(1)
+_SHOT_CO2 = const(2)
+
+# время однократных измерений, мс. single shot times, ms
+_SHOT_MS = const(5000)
+_SHOT_RHT_MS = const(50)
+
+
+class MixedRateScheduler(Iterator):
+    """Выполняет однократные измерения только T и RH (около 50 мс) с периодом rht_interval, а между ними, с периодом
+    co2_interval, полные измерения с CO2 (около 5 с). Полное измерение запускается так, чтобы его результат пришелся
+    на очередной момент измерения T/RH: полное измерение тоже дает T и RH и заменяет собой измерение T/RH.
+    Пока идет полное измерение, датчик не принимает других команд, поэтому моменты T/RH внутри него пропускаются.
+    Результаты объединяются в один поток mixed_values_scd4x. Только SCD41! Датчик должен быть в режиме IDLE.
+    Неблокирующий: вызывайте service, когда истечет time_to_next.
+    Runs T and RH only single shots (about 50 ms) with the rht_interval period, and between them, with the co2_interval
+    period, full shots with CO2 (about 5 s). A full shot is started so that its result falls on the next T/RH moment:
+    a full shot also gives T and RH and replaces the T/RH shot.
+    While a full shot is running, the sensor does not accept other commands, so the T/RH moments inside it are skipped.
+    The results are merged into one mixed_values_scd4x stream. SCD41 only! The sensor must be in IDLE mode.
+    Non-blocking: call service when time_to_next expires."""
+
+    def __init__(self, sensor: SCD4xSensirion, rht_interval: int = 1000, co2_interval: int = 30_000,
+                 margin_ms: int = 10):
+        """rht_interval - период измерения T/RH, мс. co2_interval - период измерения CO2, мс.
+        margin_ms - запас после времени преобразования перед чтением, мс.
+        rht_interval - T/RH measurement period, ms. co2_interval - CO2 measurement period, ms.
+        margin_ms - margin after the conversion time before reading, ms."""
+        if not sensor._isSCD41:
+            raise ValueError("Single shot measurements are available only for SCD41!")
+        if co2_interval < rht_interval:
+            raise ValueError(f"Invalid CO2 interval: {co2_interval}")
+        self.sensor = sensor
+        self.rht_interval = rht_interval
+        self.co2_interval = co2_interval
+        self.margin_ms = margin_ms
+        # счетчики. counters
+        self.rht_samples = 0
+        self.co2_samples = 0
+        self.skipped = 0
+        self.lost = 0
+        self.reset()
+
+    def reset(self):
+        """Начинает расписание заново, первое измерение CO2 - немедленно. Restarts the schedule, the first CO2
+        measurement is immediate."""
+        now = time.ticks_ms()
+        self._kind = _SHOT_NONE
+        self._deadline = now
+        self._next_slot = now
+        self._co2_due = now
+        self._co2 = None
+        self._co2_tick = now
+
+    def _get_co2_start(self, now: int) -> int:
+        """Момент запуска полного измерения: его результат должен быть готов одновременно с результатом измерения T/RH,
+        запущенного в первый момент T/RH не раньше срока CO2.
+        Full shot start moment: its result should be ready at the same time as the result of a T/RH shot started
+        at the first T/RH moment not earlier than the CO2 due time."""
+        slot = self._next_slot
+        lag = time.ticks_diff(self._co2_due, slot)
+        if lag > 0:
+            step = self.rht_interval
+            slot = time.ticks_add(slot, (lag + step - 1) // step * step)
+        return time.ticks_add(slot, _SHOT_RHT_MS - _SHOT_MS)
+
+    def _start(self, now: int, kind: int):
+        sen = self.sensor
+        sen.start_measurement(start=False, single_shot=True, rht_only=_SHOT_RHT == kind)
+        self._kind = kind
+        self._deadline = time.ticks_add(now, sen.get_conversion_cycle_time() + self.margin_ms)
+
+    def _skip_slots(self, until: int):
+        """Пропускает моменты T/RH до until включительно. Skips T/RH moments up to and including until."""
+        step = self.rht_interval
+        while time.ticks_diff(self._next_slot, until) <= 0:
+            self._next_slot = time.ticks_add(self._next_slot, step)
+            self.skipped += 1
+
+    def time_to_next(self) -> int:
+        """Время в мс до следующего действия. Time in ms until the next action."""
+        now = time.ticks_ms()
+        if _SHOT_NONE != self._kind:
+            target = self._deadline
+        else:
+            target = self._next_slot
+            co2_start = self._get_co2_start(now)
+            if time.ticks_diff(co2_start, target) < 0:
+                target = co2_start
+        diff = time.ticks_diff(target, now)
+        return diff if diff > 0 else 0
+
+    def service(self) -> [None, mixed_values_scd4x]:
+        """Один неблокирующий шаг. Возвращает объединенное измерение или None. Никогда не ждет!
+        One non-blocking step. Returns a merged measurement or None. Never waits!"""
+        now = time.ticks_ms()
+        kind = self._kind
+        if _SHOT_NONE != kind:
+            if time.ticks_diff(now, self._deadline) < 0:
+                return None
+            self._kind = _SHOT_NONE
+            try:
+                value = self.sensor.get_measurement_value()
+            except ValueError:
+                # ошибка CRC: буфер датчика уже очищен, измерение потеряно. CRC error: the sensor buffer is
+                # already emptied, the measurement is lost
+                self.lost += 1
+                return None
+            if _SHOT_CO2 == kind:
+                self._co2 = value.CO2
+                self._co2_tick = now
+                self.co2_samples += 1
+            else:
+                self.rht_samples += 1
+            co2_age = None if self._co2 is None else time.ticks_diff(now, self._co2_tick)
+            return mixed_values_scd4x(CO2=self._co2, T=value.T, RH=value.RH, co2_age=co2_age, tick=now)
+        co2_start = self._get_co2_start(now)
+        if time.ticks_diff(now, co2_start) >= 0:
+            self._start(now, _SHOT_CO2)
+            # моменты T/RH до окончания полного измерения пропускаются. T/RH moments until the end of the full shot
+            # are skipped
+            self._skip_slots(self._deadline)
+            self._co2_due = time.ticks_add(self._co2_due, self.co2_interval)
+            if time.ticks_diff(self._co2_due, now) <= 0:
+                self._co2_due = time.ticks_add(now, self.co2_interval)
+            return None
+        if time.ticks_diff(now, self._next_slot) < 0:
+            return None
+        self._skip_slots(now)
+        self.skipped -= 1   # текущий момент не пропущен. the current moment is not skipped
+        # измерение T/RH, которое не успеет закончиться до полного, не запускается
+        # a T/RH shot that would not finish before the full shot is not started
+        if time.ticks_diff(co2_start, time.ticks_add(now, _SHOT_RHT_MS + self.margin_ms)) < 0:
+            self.skipped += 1
+            return None
+        self._start(now, _SHOT_RHT)
+        return None
+
+    def wait_next(self) -> mixed_values_scd4x:
+        """Блокирующее ожидание следующего измерения. Blocking wait for the next measurement."""
+        while True:
+            value = self.service()
+            if value is not None:
+                return value
+            wt = self.time_to_next()
+            time.sleep_ms(wt if wt > 0 else 1)
+
+    # Iterator
+    def __next__(self) -> [None, mixed_values_scd4x]:
+        return self.service()
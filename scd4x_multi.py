@@ -0,0 +1,225 @@
+"""SCD4x Sensirion multi-sensor module.
+Опрос многих SCD4x на нескольких шинах и за мультиплексорами I2C (например, TCA9548A).
+Все SCD4x имеют один адрес 0x62, поэтому на одной шине без мультиплексора может быть только один датчик!
+Polling of many SCD4x on several buses and behind I2C multiplexers (for example, TCA9548A).
+All SCD4x have the same address 0x62, so there can be only one sensor on a bus without a multiplexer!"""
+
+from sensor_pack_2 import bus_service
+from sensor_pack_2.base_sensor import DeviceEx
+from scd4x_sensirion import SCD4xSensirion
+from scd4x_scheduler import DataReadyScheduler
+import time
+
+
+class I2cMux:
+    """Мультиплексор шины I2C типа TCA9548A/PCA9548A. Канал выбирается записью одного байта (1 << channel).
+    Текущий канал запоминается, поэтому повторный выбор того же канала не обращается к шине.
+    I2C bus multiplexer like TCA9548A/PCA9548A. A channel is selected by writing one byte (1 << channel).
+    The current channel is remembered, so selecting the same channel again does not access the bus."""
+
+    def __init__(self, adapter: bus_service.BusAdapter, address: int = 0x70, channels: int = 8):
+        self._connection = DeviceEx(adapter=adapter, address=address, big_byte_order=True)
+        self.channels = channels
+        self._buf = bytearray(1)
+        # None - неизвестно, -1 - все каналы отключены. None - unknown, -1 - all channels are disabled
+        self._channel = None
+        # количество переключений каналов. number of channel switches
+        self.switches = 0
+
+    @property
+    def adapter(self) -> bus_service.BusAdapter:
+        return self._connection.adapter
+
+    def select(self, channel: int):
+        """Подключает канал channel (0..channels-1) или отключает все каналы, если channel < 0.
+        Connects channel (0..channels-1) or disconnects all channels if channel < 0."""
+        if channel == self._channel:
+            return
+        if channel >= self.channels:
+            raise ValueError(f"Invalid channel: {channel}")
+        self._buf[0] = 0 if channel < 0 else 1 << channel
+        self._connection.write(self._buf)
+        self._channel = channel
+        self.switches += 1
+
+
+class _Entry:
+    """Датчик в составе MultiSensorPoller. Sensor as part of MultiSensorPoller."""
+
+    def __init__(self, adapter: bus_service.BusAdapter, sensor: SCD4xSensirion, mux: [I2cMux, None], channel: int):
+        self.adapter = adapter
+        self.sensor = sensor
+        self.mux = mux
+        self.channel = channel
+        self.scheduler = DataReadyScheduler(sensor)
+        # время запуска периодических измерений (ticks_ms) или None. periodic measurement start time or None
+        self.start_at = None
+        self.started = False
+        self.value = None
+        self.tick = 0
+        # Истина, если value получено после последнего снимка. True if value was received after the last snapshot
+        self.fresh = False
+        self.errors = 0
+
+
+class MultiSensorPoller:
+    """Менеджер многих SCD4x. Каждый датчик описывается тройкой (BusAdapter, канал мультиплексора, SCD4xSensirion).
+    Запуски периодических измерений разнесены по периоду, поэтому моменты готовности данных датчиков равномерно
+    распределены по 5-ти секундному циклу. Чтение каждого датчика планирует DataReadyScheduler (одна транзакция на
+    измерение). Датчики обходятся в порядке шина/мультиплексор/канал, что минимизирует переключения каналов.
+    Manager of many SCD4x. Each sensor is described by a triple (BusAdapter, multiplexer channel, SCD4xSensirion).
+    Periodic measurement starts are spread over the period, so the data ready moments of the sensors are evenly
+    distributed over the 5 second cycle. Reading of each sensor is planned by DataReadyScheduler (one transaction per
+    measurement). Sensors are visited in bus/multiplexer/channel order, which minimizes channel switches."""
+
+    def __init__(self, period: int = 5000):
+        """period - период обновления данных датчиков, мс. 5000 для обычного и 30000 для экономичного режима.
+        period - sensor data update period, ms. 5000 for normal and 30000 for low power mode."""
+        self.period = period
+        self._entries = []
+        # порядок обхода датчиков. sensor visiting order
+        self._order = []
+        # мультиплексор с подключенным каналом (или None) по адаптеру шины. Перед выбором канала другого
+        # мультиплексора той же шины каналы этого отключаются, иначе на шине окажутся два датчика с адресом 0x62!
+        # multiplexer with a connected channel (or None) by bus adapter. Before selecting a channel of another
+        # multiplexer on the same bus, this one's channels are disconnected, otherwise two sensors with address 0x62
+        # would be on the bus!
+        self._active_mux = dict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, adapter: bus_service.BusAdapter, sensor: SCD4xSensirion, mux: I2cMux = None,
+            channel: int = -1) -> int:
+        """Добавляет датчик. Датчик должен находиться в режиме IDLE! Возвращает индекс датчика в снимке.
+        Adds a sensor. The sensor must be in IDLE mode! Returns the sensor index in the snapshot."""
+        if mux is not None and mux.adapter is not adapter:
+            raise ValueError("The multiplexer must be on the same bus as the sensor!")
+        entry = _Entry(adapter, sensor, mux, channel)
+        self._entries.append(entry)
+        self._order = self._visit_order()
+        return len(self._entries) - 1
+
+    def _select(self, entry: _Entry):
+        """Подключает датчик entry к шине: отключает каналы другого мультиплексора этой шины и выбирает канал.
+        Connects the entry sensor to the bus: disconnects the channels of another multiplexer on this bus and selects
+        the channel."""
+        mux = entry.mux
+        active = self._active_mux.get(entry.adapter)
+        if active is not None and active is not mux:
+            active.select(-1)
+            self._active_mux[entry.adapter] = None
+        if mux is not None:
+            mux.select(entry.channel)
+            self._active_mux[entry.adapter] = mux
+
+    def _visit_order(self) -> list:
+        """Порядок обхода: шина, мультиплексор, канал. Visiting order: bus, multiplexer, channel."""
+        return sorted(self._entries, key=lambda e: (id(e.adapter), 0 if e.mux is None else id(e.mux), e.channel))
+
+    def start(self, stagger: bool = True):
+        """Назначает моменты запуска периодических измерений. Если stagger Истина, то запуски разнесены на
+        period / N мс. Сами запуски выполняет service, поэтому метод не блокирует!
+        Assigns periodic measurement start moments. If stagger is True, the starts are period / N ms apart.
+        The starts themselves are performed by service, so the method does not block!"""
+        now = time.ticks_ms()
+        step = self.period // len(self._entries) if stagger and self._entries else 0
+        for index, entry in enumerate(self._entries):
+            entry.start_at = time.ticks_add(now, index * step)
+            entry.started = False
+
+    def stop(self):
+        """Останавливает периодические измерения всех датчиков. Блокирует на 500 мс на каждый датчик!
+        Stops periodic measurements of all sensors. Blocks for 500 ms per sensor!"""
+        for entry in self._order:
+            self._select(entry)
+            entry.sensor.start_measurement(start=False)
+            entry.started = False
+            entry.start_at = None
+
+    def service(self) -> int:
+        """Один неблокирующий проход по всем датчикам, в порядке шина/мультиплексор/канал. Запускает датчики, чей
+        момент запуска наступил, и читает датчики, чьи данные готовы. Возвращает количество новых измерений.
+        One non-blocking pass over all sensors, in bus/multiplexer/channel order. Starts the sensors whose start
+        moment has come and reads the sensors whose data is ready. Returns the number of new measurements."""
+        now = time.ticks_ms()
+        count = 0
+        for entry in self._order:
+            if not entry.started:
+                if entry.start_at is None or time.ticks_diff(now, entry.start_at) < 0:
+                    continue
+                try:
+                    self._select(entry)
+                    entry.sensor.start_measurement(start=True)
+                except OSError:
+                    # датчик (или мультиплексор) не ответил: повтор через период, остальные датчики опрашиваются
+                    # the sensor (or multiplexer) did not respond: retry after a period, the other sensors are polled
+                    entry.errors += 1
+                    entry.start_at = time.ticks_add(now, self.period)
+                    continue
+                entry.scheduler.reset()
+                entry.started = True
+                continue
+            sched = entry.scheduler
+            if sched.time_to_next():
+                continue
+            try:
+                self._select(entry)
+                value = sched.service()
+            except (OSError, ValueError):
+                # ошибка шины или CRC: измерение потеряно, датчик будет прочитан в следующем цикле
+                # bus or CRC error: the measurement is lost, the sensor will be read in the next cycle
+                entry.errors += 1
+                continue
+            if value is not None:
+                entry.value = value
+                entry.tick = now
+                entry.fresh = True
+                count += 1
+        return count
+
+    def time_to_next(self) -> int:
+        """Время в мс до ближайшего действия. Time in ms until the nearest action."""
+        now = time.ticks_ms()
+        result = self.period
+        for entry in self._entries:
+            if not entry.started:
+                if entry.start_at is None:
+                    continue
+                wt = time.ticks_diff(entry.start_at, now)
+            else:
+                wt = entry.scheduler.time_to_next()
+            if wt < result:
+                result = wt
+        return result if result > 0 else 0
+
+    def snapshot(self) -> tuple:
+        """Возвращает последние измерения всех датчиков (None, если измерения еще нет), в порядке добавления.
+        Сбрасывает признак новизны.
+        Returns the latest measurements of all sensors (None if there is no measurement yet), in the order of addition.
+        Resets the freshness flag."""
+        for entry in self._entries:
+            entry.fresh = False
+        return tuple(entry.value for entry in self._entries)
+
+    def is_complete(self) -> bool:
+        """Истина, если после последнего снимка получены новые измерения всех датчиков.
+        True if new measurements of all sensors have been received since the last snapshot."""
+        for entry in self._entries:
+            if not entry.fresh:
+                return False
+        return True
+
+    def poll_cycle(self, timeout: int = -1) -> tuple:
+        """Блокирующий опрос до получения нового измерения от каждого датчика (или до истечения timeout мс, если
+        timeout >= 0). Между действиями спит. Возвращает снимок.
+        Blocking polling until a new measurement from each sensor is received (or until timeout ms expires, if
+        timeout >= 0). Sleeps between actions. Returns a snapshot."""
+        t0 = time.ticks_ms()
+        while not self.is_complete():
+            self.service()
+            if 0 <= timeout <= time.ticks_diff(time.ticks_ms(), t0):
+                break
+            wt = self.time_to_next()
+            time.sleep_ms(wt if wt > 0 else 1)
+        return self.snapshot()
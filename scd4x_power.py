@@ -0,0 +1,261 @@
+"""SCD4x Sensirion low power module.
+Выбор самого экономичного режима работы SCD4x для заданного интервала измерений и его выполнение.
+Модель тока основана на документе Sensirion "SCD4x Low Power Operation" (версия 1.0, июль 2022).
+Choosing the most economical SCD4x operation mode for a given measurement interval and running it.
+The current model is based on the Sensirion document "SCD4x Low Power Operation" (version 1.0, July 2022)."""
+
+from collections import namedtuple
+from micropython import const
+from scd4x_sensirion import SCD4xSensirion, measured_values_scd4x, measured_raw_scd4x
+from scd4x_scheduler import DataReadyScheduler
+import time
+
+# стратегии. strategies
+# периодические измерения, 5 с. periodic measurements, 5 s
+STRATEGY_PERIODIC = const(0)
+# экономичные периодические измерения, 30 с. low power periodic measurements, 30 s
+STRATEGY_LOW_POWER = const(1)
+# однократные измерения, между ними датчик в IDLE. single shots, the sensor is IDLE between them (SCD41)
+STRATEGY_SINGLE_SHOT = const(2)
+# однократные измерения, между ними датчик выключен командой power_down. single shots, the sensor is powered down
+# between them (SCD41)
+STRATEGY_POWER_CYCLED = const(3)
+# однократные измерения только T и RH, 50 мс. single shots of T and RH only, 50 ms (SCD41)
+STRATEGY_RHT_ONLY = const(4)
+
+# оценка среднего тока стратегии при интервале измерений interval (мс), мкА.
+# estimated average current of the strategy at the measurement interval (ms), uA.
+power_estimate = namedtuple("power_estimate", "strategy interval current_ua")
+
+# время пробуждения (wake_up) и однократного измерения, мс. wake up and single shot times, ms
+_WAKE_UP_MS = const(20)
+_SHOT_MS = const(5000)
+_SHOT_RHT_MS = const(50)
+
+# состояния цикла однократных измерений. single shot cycle states
+_ST_SLEEP = const(0)
+_ST_WAKING = const(1)
+_ST_STABILIZING = const(2)
+_ST_MEASURING = const(3)
+
+
+class EnergyModel:
+    """Модель среднего тока SCD4x, таблицы 1, 3 и уравнения 1, 2 "SCD4x Low Power Operation".
+    Заряд однократного измерения только T и RH в документе не приводится, q_rht_uc - оценка сверху, уточните ее
+    измерением!
+    SCD4x average current model, tables 1, 3 and equations 1, 2 of "SCD4x Low Power Operation".
+    The charge of a T and RH only single shot is not given in the document, q_rht_uc is an upper estimate, refine it
+    by measurement!"""
+
+    def __init__(self, supply_5v: bool = False, q_rht_uc: int = 500):
+        """supply_5v - напряжение питания 5 В (иначе 3.3 В). q_rht_uc - заряд одного измерения только T и RH, мкКл.
+        supply_5v - 5 V supply voltage (otherwise 3.3 V). q_rht_uc - charge of one T and RH only shot, uC."""
+        if supply_5v:
+            self.i_periodic_ua, self.i_low_power_ua, self.i_idle_ua = 11_000, 2800, 170
+            self.q_single_shot_uc, self.q_power_cycled_uc = 54_000, 108_000
+        else:
+            self.i_periodic_ua, self.i_low_power_ua, self.i_idle_ua = 15_000, 3200, 200
+            self.q_single_shot_uc, self.q_power_cycled_uc = 77_000, 154_000
+        self.q_rht_uc = q_rht_uc
+
+    @staticmethod
+    def get_min_interval(strategy: int) -> int:
+        """Наименьший интервал измерений стратегии, мс. The smallest measurement interval of the strategy, ms."""
+        if STRATEGY_PERIODIC == strategy or STRATEGY_SINGLE_SHOT == strategy:
+            return _SHOT_MS
+        if STRATEGY_LOW_POWER == strategy:
+            return 30_000
+        if STRATEGY_POWER_CYCLED == strategy:
+            # пробуждение и два измерения: первое после включения отбрасывается
+            # wake up and two shots: the first one after power up is discarded
+            return _WAKE_UP_MS + 2 * _SHOT_MS
+        return _SHOT_RHT_MS
+
+    def get_current_ua(self, strategy: int, interval: int) -> int:
+        """Средний ток датчика при интервале измерений interval мс, мкА. мкКл / с = мкА.
+        Average sensor current at the measurement interval of interval ms, uA. uC / s = uA."""
+        if STRATEGY_PERIODIC == strategy:
+            return self.i_periodic_ua
+        if STRATEGY_LOW_POWER == strategy:
+            return self.i_low_power_ua
+        if STRATEGY_SINGLE_SHOT == strategy:
+            return self.i_idle_ua + 1000 * self.q_single_shot_uc // interval        # уравнение 1. equation 1
+        if STRATEGY_POWER_CYCLED == strategy:
+            return 1000 * self.q_power_cycled_uc // interval                       # уравнение 2. equation 2
+        return self.i_idle_ua + 1000 * self.q_rht_uc // interval
+
+    def get_estimates(self, interval: int, need_co2: bool = True, scd41: bool = True) -> tuple:
+        """Возвращает оценки (power_estimate) всех стратегий, допустимых для интервала interval мс, от самой
+        экономичной. Без SCD41 доступны только периодические режимы.
+        Returns estimates (power_estimate) of all strategies valid for the interval of interval ms, from the most
+        economical one. Without SCD41, only periodic modes are available."""
+        if scd41:
+            candidates = (STRATEGY_PERIODIC, STRATEGY_LOW_POWER, STRATEGY_SINGLE_SHOT, STRATEGY_POWER_CYCLED)
+            if not need_co2:
+                candidates += (STRATEGY_RHT_ONLY,)
+        else:
+            candidates = (STRATEGY_PERIODIC, STRATEGY_LOW_POWER)
+        result = [power_estimate(strategy=s, interval=interval, current_ua=self.get_current_ua(s, interval))
+                  for s in candidates if interval >= self.get_min_interval(s)]
+        result.sort(key=lambda e: e.current_ua)
+        return tuple(result)
+
+
+class DutyCycleOrchestrator:
+    """Выполняет измерения с заданным интервалом самым экономичным способом: периодические измерения (обычные или
+    экономичные), однократные измерения с датчиком в IDLE или выключенным между ними (power_down/wake_up), или
+    однократные измерения только T и RH. Неблокирующий: вызывайте service, когда истечет time_to_next.
+    Runs measurements at a given interval in the most economical way: periodic measurements (normal or low power),
+    single shots with the sensor IDLE or powered down between them (power_down/wake_up), or T and RH only single shots.
+    Non-blocking: call service when time_to_next expires."""
+
+    def __init__(self, sensor: SCD4xSensirion, interval: int, need_co2: bool = True, model: EnergyModel = None):
+        """interval - требуемый интервал измерений, мс. need_co2 - Ложь, если нужны только T и RH.
+        model - модель тока (по умолчанию EnergyModel для 3.3 В).
+        interval - required measurement interval, ms. need_co2 - False if only T and RH are needed.
+        model - current model (EnergyModel for 3.3 V by default)."""
+        self.sensor = sensor
+        self.interval = interval
+        self.need_co2 = need_co2
+        self.model = EnergyModel() if model is None else model
+        estimates = self.model.get_estimates(interval, need_co2, sensor._isSCD41)
+        if not estimates:
+            raise ValueError(f"Invalid interval: {interval}")
+        self.plan = estimates[0]
+        self._scheduler = None
+        self._state = _ST_SLEEP
+        self._deadline = 0
+        self._cycle_start = 0
+        self._next_at = 0
+        self._started = False
+        # счетчики. counters
+        self.samples = 0
+        # суммарное время работы датчика между wake_up и power_down, мс. total sensor awake time between wake_up
+        # and power_down, ms
+        self.awake_ms = 0
+        self._wake_at = 0
+
+    @property
+    def strategy(self) -> int:
+        return self.plan.strategy
+
+    @property
+    def current_ua(self) -> int:
+        """Оценка среднего тока датчика выбранной стратегии, мкА. Estimated average sensor current of the chosen
+        strategy, uA."""
+        return self.plan.current_ua
+
+    def start(self):
+        """Переводит датчик в выбранный режим. Датчик должен быть в режиме IDLE!
+        Puts the sensor into the chosen mode. The sensor must be in IDLE mode!"""
+        sen = self.sensor
+        strategy = self.strategy
+        now = time.ticks_ms()
+        self._next_at = now
+        self._started = True
+        if STRATEGY_PERIODIC == strategy or STRATEGY_LOW_POWER == strategy:
+            sen.set_low_power_mode(STRATEGY_LOW_POWER == strategy)
+            sen.start_measurement(start=True)
+            self._scheduler = DataReadyScheduler(sen)
+            return
+        self._scheduler = None
+        self._state = _ST_SLEEP
+        self._deadline = now
+
+    def stop(self):
+        """Возвращает датчик в IDLE. Блокирует на 500 мс в периодических режимах!
+        Returns the sensor to IDLE. Blocks for 500 ms in periodic modes!"""
+        sen = self.sensor
+        if self._scheduler is not None:
+            sen.start_measurement(start=False)
+            self._scheduler = None
+        elif STRATEGY_POWER_CYCLED == self.strategy and _ST_SLEEP != self._state:
+            # датчик проснулся, но выключен не был. the sensor woke up but was not powered down
+            self._power_down(time.ticks_ms())
+        self._state = _ST_SLEEP
+        self._started = False
+
+    def _shot(self, now: int, state: int):
+        rht_only = STRATEGY_RHT_ONLY == self.strategy
+        self.sensor.start_measurement(start=False, single_shot=True, rht_only=rht_only)
+        self._state = state
+        self._deadline = time.ticks_add(now, _SHOT_RHT_MS if rht_only else _SHOT_MS)
+
+    def _power_down(self, now: int):
+        self.sensor.set_power(False)
+        self.awake_ms += time.ticks_diff(now, self._wake_at)
+
+    def time_to_next(self) -> int:
+        """Время в мс до следующего действия. Time in ms until the next action."""
+        if self._scheduler is not None:
+            return self._scheduler.time_to_next()
+        if not self._started:
+            return self.interval
+        diff = time.ticks_diff(self._deadline, time.ticks_ms())
+        return diff if diff > 0 else 0
+
+    def service(self) -> [None, measured_values_scd4x, measured_raw_scd4x]:
+        """Один неблокирующий шаг. Возвращает измерение или None.
+        One non-blocking step. Returns a measurement or None."""
+        if not self._started:
+            return None
+        now = time.ticks_ms()
+        sched = self._scheduler
+        if sched is not None:
+            # датчик измеряет сам, лишние измерения пропускаются. the sensor measures by itself, extra measurements
+            # are skipped
+            value = sched.service()
+            if value is None or time.ticks_diff(now, self._next_at) < 0:
+                return None
+            self._next_at = time.ticks_add(now, self.interval - sched.period // 2)
+            self.samples += 1
+            return value
+        if time.ticks_diff(now, self._deadline) < 0:
+            return None
+        state = self._state
+        if _ST_SLEEP == state:
+            self._cycle_start = now
+            if STRATEGY_POWER_CYCLED == self.strategy:
+                self._wake_at = now
+                try:
+                    self.sensor.set_power(True)
+                except OSError:
+                    pass    # датчик не подтверждает команду wake_up. the sensor does not acknowledge wake_up
+                self._state = _ST_WAKING
+                self._deadline = time.ticks_add(now, _WAKE_UP_MS)
+                return None
+            self._shot(now, _ST_MEASURING)
+            return None
+        if _ST_WAKING == state:
+            # первое измерение после включения служит для стабилизации и не читается
+            # the first shot after power up is for stabilization and is not read
+            self._shot(now, _ST_STABILIZING)
+            return None
+        if _ST_STABILIZING == state:
+            self._shot(now, _ST_MEASURING)
+            return None
+        # _ST_MEASURING
+        self._state = _ST_SLEEP
+        nxt = time.ticks_add(self._cycle_start, self.interval)
+        self._deadline = nxt if time.ticks_diff(nxt, now) > 0 else now
+        try:
+            value = self.sensor.get_measurement_value()
+        except ValueError:
+            value = None    # ошибка CRC, измерение потеряно. CRC error, the measurement is lost
+        finally:
+            if STRATEGY_POWER_CYCLED == self.strategy:
+                self._power_down(now)
+        if value is not None:
+            self.samples += 1
+        return value
+
+    def wait_next(self) -> [measured_values_scd4x, measured_raw_scd4x]:
+        """Блокирующее ожидание следующего измерения. Blocking wait for the next measurement."""
+        if not self._started:
+            raise ValueError("Orchestrator is not started!")
+        while True:
+            value = self.service()
+            if value is not None:
+                return value
+            wt = self.time_to_next()
+            time.sleep_ms(wt if wt > 0 else 1)
@@ -0,0 +1,99 @@
+"""SCD4x Sensirion pressure compensation module.
+Компенсация давления окружающей среды по показаниям барометра с зоной нечувствительности.
+Ambient pressure compensation from barometer readings with a dead band."""
+
+from scd4x_sensirion import SCD4xSensirion
+import time
+
+# допустимый диапазон давления SCD4x, гПа. SCD4x valid pressure range, hPa
+_pressure_range_hpa = range(700, 1201)
+
+
+class PressureFeeder:
+    """Читает давление из источника source, сглаживает его и передает датчику (set_ambient_pressure) только при
+    изменении не менее чем на dead_band_hpa гПа и не чаще, чем раз в min_interval мс. Датчик принимает давление
+    с разрешением 1 гПа (Паскали // 100), поэтому запись, которую датчик округлил бы до уже установленного
+    значения, не выполняется никогда. Значения вне допустимого диапазона датчика (700..1200 гПа) отбрасываются.
+    source - функция без параметров, возвращающая давление в Паскалях или None (например, метод барометра
+    из sensor_pack_2).
+    Reads the pressure from the source, smooths it and passes it to the sensor (set_ambient_pressure) only when it
+    changes by at least dead_band_hpa hPa and no more often than once every min_interval ms. The sensor takes
+    the pressure with 1 hPa resolution (Pascals // 100), so a write that the sensor would round to the already set
+    value is never made. Values outside the sensor valid range (700..1200 hPa) are rejected.
+    source - a function without parameters returning the pressure in Pascals or None (for example, a method of
+    a sensor_pack_2 barometer)."""
+
+    def __init__(self, sensor: SCD4xSensirion, source, dead_band_hpa: int = 2, min_interval: int = 60_000,
+                 filter_shift: int = 2):
+        """dead_band_hpa - зона нечувствительности, гПа (не менее 1). min_interval - наименьший интервал между
+        записями давления в датчик, мс. filter_shift - сглаживание: экспоненциальное среднее с коэффициентом
+        1 / 2**filter_shift, 0 - без сглаживания.
+        dead_band_hpa - dead band, hPa (at least 1). min_interval - the smallest interval between pressure writes
+        to the sensor, ms. filter_shift - smoothing: exponential average with the 1 / 2**filter_shift factor,
+        0 - no smoothing."""
+        if dead_band_hpa < 1:
+            raise ValueError(f"Invalid dead band: {dead_band_hpa} hPa")
+        self.sensor = sensor
+        self.source = source
+        self.dead_band_hpa = dead_band_hpa
+        self.min_interval = min_interval
+        self.filter_shift = filter_shift
+        # счетчики. counters
+        self.writes = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает фильтр и последнее записанное значение. Следующее допустимое значение будет записано сразу.
+        Вызывайте после сброса или выключения питания датчика, так как он забывает давление!
+        Resets the filter and the last written value. The next valid value will be written at once.
+        Call after a sensor reset or power off, since it forgets the pressure!"""
+        # сглаженное давление в Па, умноженное на 2**filter_shift. None - нет данных.
+        # smoothed pressure in Pa multiplied by 2**filter_shift. None - no data.
+        self._filtered = None
+        # последнее записанное в датчик давление, гПа. the last pressure written to the sensor, hPa
+        self.written_hpa = None
+        self._written_at = 0
+
+    def get_pressure(self) -> [int, None]:
+        """Сглаженное давление, Па, или None. Smoothed pressure, Pa, or None."""
+        f = self._filtered
+        return None if f is None else f >> self.filter_shift
+
+    def _filter(self, pressure: int) -> int:
+        shift = self.filter_shift
+        f = self._filtered
+        if f is None:
+            f = pressure << shift
+        else:
+            f += pressure - (f >> shift)
+        self._filtered = f
+        return f >> shift
+
+    def update(self) -> bool:
+        """Читает источник и при необходимости записывает давление в датчик. Возвращает Истина, если запись была.
+        Может вызываться во время периодических измерений.
+        Reads the source and writes the pressure to the sensor if needed. Returns True if there was a write.
+        Can be called during periodic measurements."""
+        raw = self.source()
+        if raw is None:
+            return False
+        pressure = int(raw)
+        if pressure // 100 not in _pressure_range_hpa:
+            self.rejected += 1      # сбой барометра или не Паскали. barometer glitch or not Pascals
+            return False
+        hpa = self._filter(pressure) // 100
+        last = self.written_hpa
+        now = time.ticks_ms()
+        if last is not None:
+            # то же значение после округления, зона нечувствительности, слишком рано
+            # the same value after rounding, dead band, too early
+            if abs(hpa - last) < self.dead_band_hpa or time.ticks_diff(now, self._written_at) < self.min_interval:
+                self.skipped += 1
+                return False
+        self.sensor.set_ambient_pressure(100 * hpa)
+        self.written_hpa = hpa
+        self._written_at = now
+        self.writes += 1
+        return True
@@ -0,0 +1,243 @@
+"""SCD4x Sensirion scheduler module.
+Планировщик чтения, предсказывающий момент готовности данных датчика.
+Read scheduler predicting the moment when the sensor data is ready."""
+
+from sensor_pack_2.base_sensor import Iterator
+from scd4x_sensirion import SCD4xSensirion, measured_values_scd4x, measured_raw_scd4x
+import micropython
+import time
+
+
+class DataReadyScheduler(Iterator):
+    """Запоминает время каждого успешного чтения, оценивает реальный период обновления данных датчика и его фазу
+    и читает данные сразу после предсказанного момента готовности, одной транзакцией на шине. Опрос готовности
+    (get_data_status) выполняется только внутри небольшого защитного окна: до синхронизации, после NACK и раз в
+    resync_every измерений, чтобы уточнить фазу.
+    В режиме однократных измерений планировщик сам запускает следующее измерение после чтения.
+    Timestamps each successful read, estimates the real sensor update period and its phase, and reads the data right
+    after the predicted ready moment, with one bus transaction. Ready status polling (get_data_status) is done only
+    inside a small guard window: before synchronization, after a NACK and once every resync_every measurements,
+    to refine the phase.
+    In single shot mode, the scheduler starts the next measurement itself after reading."""
+
+    def __init__(self, sensor: SCD4xSensirion, guard_ms: int = 30, margin_ms: int = 20, poll_ms: int = 15,
+                 resync_every: int = 16):
+        """guard_ms - защитное окно до предсказанного момента готовности, в котором опрашивается готовность, мс.
+        margin_ms - запас после предсказанного момента готовности перед чтением без опроса, мс.
+        poll_ms - период опроса готовности внутри защитного окна, мс.
+        resync_every - через сколько измерений уточнять фазу опросом готовности.
+        guard_ms - guard window before the predicted ready moment in which the ready status is polled, ms.
+        margin_ms - margin after the predicted ready moment before reading without polling, ms.
+        poll_ms - ready status polling period inside the guard window, ms.
+        resync_every - how many measurements between phase refinements by polling."""
+        self.sensor = sensor
+        self.guard_ms = guard_ms
+        self.margin_ms = margin_ms
+        self.poll_ms = poll_ms
+        self.resync_every = resync_every
+        # счетчики транзакций на шине. bus transaction counters
+        self.status_polls = 0
+        self.reads = 0
+        self.samples = 0
+        # измерения, потерянные из-за ошибки CRC. measurements lost due to a CRC error
+        self.crc_errors = 0
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает синхронизацию. Вызывайте после изменения режима измерения датчика!
+        Resets synchronization. Call after changing the sensor measurement mode!"""
+        # опорный момент: время последней готовности данных (периодический режим) или время запуска
+        # однократного измерения. None - нет синхронизации.
+        # reference moment: the last data ready time (periodic mode) or the single shot start time.
+        # None - no synchronization.
+        self._ref = None
+        self._nominal = self.sensor.get_conversion_cycle_time()
+        # оценка периода в 1/16 мс, чтобы медленный дрейф не терялся при округлении.
+        # period estimate in 1/16 ms, so that slow drift is not lost in rounding.
+        self._period16 = self._nominal << 4
+        self._next_poll = time.ticks_ms()
+        # Истина - в следующем окне уточнить фазу опросом. True - refine the phase by polling in the next window
+        self._probe = True
+        # Истина, если в текущем окне опрос уже вернул "не готово", то есть момент готовности ограничен с двух сторон.
+        # True if polling in the current window has already returned "not ready", i.e. the ready moment is bounded
+        # on both sides.
+        self._missed = False
+        self._since_sync = 0
+        # момент последней готовности данных, обнаруженной опросом с точностью poll_ms (периодический режим).
+        # the last data ready moment detected by polling with poll_ms accuracy (periodic mode).
+        self._anchor = None
+        # сдвиг опорного момента, если данные готовы уже в начале окна. Удваивается, пока момент готовности не будет
+        # ограничен с двух сторон.
+        # reference moment shift if the data is ready already at the window start. Doubles until the ready moment
+        # is bounded on both sides.
+        self._shift = self.guard_ms
+
+    @property
+    def period(self) -> int:
+        """Оценка периода обновления данных датчика, мс. Estimated sensor data update period, ms."""
+        return self._period16 >> 4
+
+    def _status(self) -> bool:
+        self.status_polls += 1
+        return self.sensor.get_data_status()
+
+    def _read(self) -> [None, measured_values_scd4x, measured_raw_scd4x]:
+        """Читает измерение. При ошибке CRC возвращает None: буфер датчика уже очищен чтением, поэтому повторное
+        чтение бессмысленно, и следующее измерение будет прочитано в следующем цикле готовности, как обычно.
+        Reads a measurement. Returns None on a CRC error: the sensor buffer has already been emptied by the read,
+        so re-reading is pointless, and the next measurement will be read in the next ready cycle, as usual."""
+        self.reads += 1
+        try:
+            value = self.sensor.get_measurement_value()
+        except ValueError:
+            self.crc_errors += 1
+            return None
+        self.samples += 1
+        return value
+
+    def _start_shot(self):
+        """Запускает однократное измерение и делает его начало опорным моментом.
+        Starts a single shot measurement and makes its start the reference moment."""
+        sen = self.sensor
+        sen.start_measurement(start=False, single_shot=True, rht_only=sen.is_rht_only())
+        self._ref = time.ticks_ms()
+
+    @micropython.native
+    def _observe(self, now: int):
+        """Переход готовности данных обнаружен опросом в момент now. Уточняет период и фазу.
+        The data ready transition was detected by polling at the moment now. Refines the period and the phase."""
+        # в режиме однократных измерений период отсчитывается от запуска измерения
+        # in single shot mode, the period is counted from the measurement start
+        anchor = self._ref if self.sensor.is_single_shot_mode() else self._anchor
+        if anchor is not None:
+            period = self.period
+            measured = time.ticks_diff(now, anchor)
+            cycles = (measured + period // 2) // period
+            if cycles > 0:
+                sample = measured // cycles
+                nominal = self._nominal
+                # выбросы (более 25% от номинала) отбрасываются. outliers (more than 25% of nominal) are rejected
+                if abs(sample - nominal) <= nominal // 4:
+                    # оценка по многим периодам точнее, и ее вес больше. an estimate over many periods is more
+                    # accurate, and its weight is greater.
+                    self._period16 += ((sample << 4) - self._period16) * cycles // (cycles + 3)
+        self._anchor = now
+        self._ref = now
+        self._shift = self.guard_ms
+        self._probe = False
+        self._since_sync = 0
+
+    def _advance(self):
+        """Вызывается после успешного чтения. Called after a successful read."""
+        if self.sensor.is_single_shot_mode():
+            self._start_shot()
+        self._missed = False
+        self._since_sync += 1
+        if self._since_sync >= self.resync_every:
+            self._probe = True
+
+    def _predicted(self) -> int:
+        return time.ticks_add(self._ref, self.period)
+
+    def time_to_next(self) -> int:
+        """Возвращает время в мс до следующего действия планировщика. Столько можно спать до вызова service.
+        Returns the time in ms until the next scheduler action. You can sleep this long before calling service."""
+        now = time.ticks_ms()
+        if self._ref is None:
+            target = self._next_poll
+        else:
+            predicted = self._predicted()
+            if self._probe:
+                target = time.ticks_add(predicted, -self.guard_ms)
+                if time.ticks_diff(now, target) >= 0:
+                    target = self._next_poll
+            else:
+                target = time.ticks_add(predicted, self.margin_ms)
+        diff = time.ticks_diff(target, now)
+        return diff if diff > 0 else 0
+
+    def service(self) -> [None, measured_values_scd4x, measured_raw_scd4x]:
+        """Один неблокирующий шаг планировщика. Возвращает измерение или None, если данные еще не готовы (или
+        измерение потеряно из-за ошибки CRC). Никогда не ждет!
+        One non-blocking scheduler step. Returns a measurement or None if the data is not ready yet (or the measurement
+        was lost due to a CRC error). Never waits!"""
+        sen = self.sensor
+        if not (sen.is_continuously_mode() or sen.is_single_shot_mode()):
+            return None
+        now = time.ticks_ms()
+        if self._ref is None:
+            self._probe = True
+            self._missed = False
+            if sen.is_single_shot_mode():
+                self._start_shot()
+                return None
+            # нет синхронизации: редкий опрос готовности. no synchronization: infrequent ready status polling
+            if time.ticks_diff(now, self._next_poll) < 0:
+                return None
+            self._next_poll = time.ticks_add(now, self._nominal // 20)
+            if not self._status():
+                return None
+            # известна только верхняя граница момента готовности, опорный момент сдвигается раньше, чтобы
+            # следующее окно опроса началось до реального момента готовности.
+            # only the upper bound of the ready moment is known, the reference moment is shifted earlier so that
+            # the next polling window starts before the real ready moment.
+            self._ref = time.ticks_add(now, -self.guard_ms)
+            value = self._read()
+            self._advance()
+            return value
+        predicted = self._predicted()
+        dt = time.ticks_diff(now, predicted)
+        if self._probe:
+            if dt < -self.guard_ms or time.ticks_diff(now, self._next_poll) < 0:
+                return None
+            self._next_poll = time.ticks_add(now, self.poll_ms)
+            if not self._status():
+                self._missed = True
+                if dt > self.period // 2:
+                    self._ref = None    # синхронизация потеряна. synchronization lost
+                return None
+            if self._missed:
+                self._observe(now)
+            else:
+                # данные готовы уже в начале окна: момент готовности раньше предсказанного.
+                # the data is ready already at the window start: the ready moment is earlier than predicted.
+                shift = self._shift
+                self._ref = time.ticks_add(now, -shift)
+                if sen.is_single_shot_mode() and self.period > self._nominal - self._nominal // 4:
+                    self._period16 -= shift << 4
+                if shift < self._nominal // 4:
+                    self._shift = 2 * shift
+            value = self._read()
+            self._advance()
+            return value
+        if dt < self.margin_ms:
+            return None
+        # чтение без опроса готовности. reading without ready status polling
+        try:
+            value = self._read()
+        except OSError:
+            # NACK: данных еще нет, фаза уточняется опросом. NACK: no data yet, the phase is refined by polling
+            self._probe = True
+            self._missed = True
+            self._next_poll = now
+            return None
+        self._ref = predicted
+        self._advance()
+        return value
+
+    def wait_next(self) -> [measured_values_scd4x, measured_raw_scd4x]:
+        """Блокирующее ожидание следующего измерения. Спит до предсказанного момента готовности.
+        Blocking wait for the next measurement. Sleeps until the predicted ready moment."""
+        sen = self.sensor
+        if not (sen.is_continuously_mode() or sen.is_single_shot_mode()):
+            raise ValueError("Measurement is not started!")
+        while True:
+            value = self.service()
+            if value is not None:
+                return value
+            wt = self.time_to_next()
+            time.sleep_ms(wt if wt > 0 else 1)
+
+    # Iterator
+    def __next__(self) -> [None, measured_values_scd4x, measured_raw_scd4x]:
+        return self.service()
@@ -4,36 +4,248 @@ from collections import namedtuple
 from sensor_pack_2 import bus_service
 from sensor_pack_2.base_sensor import IBaseSensorEx, Iterator, DeviceEx
 from sensor_pack_2 import base_sensor
-from sensor_pack_2.crc_mod import crc8
+from sensor_pack_2.crc_mod import crc8_31, verify_words
 import micropython
+from micropython import const
+import struct
 import time
 
 
 def _calc_crc(sequence) -> int:
     """Обертка для короткого вызова.
     Wrapper for a short call."""
-    return crc8(sequence, polynomial=0x31, init_value=0xFF)
+    return crc8_31(sequence)
 
 
 serial_number_scd4x = namedtuple("serial_number_scd4x", "word_0 word_1 word_2")
 measured_values_scd4x = namedtuple("measured_values_scd4x", "CO2 T RH")
+# Неизменяемый дескриптор команды датчика.
+# code - код команды; raw - код команды в виде готовых к передаче байт; wait_time - время обработки команды датчиком, мс;
+# read_len - длина ответа датчика в байтах; words - количество слов в ответе; signed - слова ответа со знаком;
+# retry_safe - команду можно безопасно повторить при ошибке (смотри RetryPolicy).
+# Immutable sensor command descriptor.
+# code - command code; raw - command code as bytes ready for transmission; wait_time - command execution time, ms;
+# read_len - sensor response length in bytes; words - number of words in the response; signed - signed response words;
+# retry_safe - the command can be safely retried on an error (see RetryPolicy).
+command_scd4x = namedtuple("command_scd4x", "code raw wait_time read_len words signed retry_safe")
+
+
+def _command(code: int, wait_time: int = 0, words: int = 0, signed: bool = False,
+             retry_safe: bool = True) -> command_scd4x:
+    """Создает дескриптор команды. Вызывается только при импорте модуля!
+    Creates a command descriptor. Called only on module import!"""
+    return command_scd4x(code=code, raw=code.to_bytes(2, "big"), wait_time=wait_time,
+                         read_len=3 * words, words=words, signed=signed, retry_safe=retry_safe)
+
+
+# идентификаторы команд (индексы в таблице _commands). command IDs (indexes in the _commands table)
+CMD_SAVE_CONFIG = const(0)
+CMD_GET_ID = const(1)
+CMD_SOFT_RESET = const(2)
+CMD_SELF_TEST = const(3)
+CMD_REINIT = const(4)
+CMD_SET_T_OFFSET = const(5)
+CMD_GET_T_OFFSET = const(6)
+CMD_SET_ALTITUDE = const(7)
+CMD_GET_ALTITUDE = const(8)
+CMD_SET_PRESSURE = const(9)
+CMD_FORCED_RECALIBRATION = const(10)
+CMD_GET_ASC = const(11)
+CMD_SET_ASC = const(12)
+CMD_START_LP_PERIODIC = const(13)
+CMD_START_PERIODIC = const(14)
+CMD_STOP_PERIODIC = const(15)
+CMD_READ_MEASUREMENT = const(16)
+CMD_GET_DATA_STATUS = const(17)
+CMD_WAKE_UP = const(18)
+CMD_POWER_DOWN = const(19)
+CMD_SINGLE_SHOT_RHT = const(20)
+CMD_SINGLE_SHOT = const(21)
+
+# Таблица команд датчика. Новая команда добавляется одной строкой таблицы и одним идентификатором!
+# Sensor command table. A new command is added with one table row and one identifier!
+# Не повторяются: запись в EEPROM, сброс, самотест, калибровка и чтение измерения (буфер датчика очищается чтением).
+# Not retried: EEPROM write, reset, self test, calibration and measurement read (the sensor buffer is emptied on read).
+_commands = (
+    _command(0x3615, 800, retry_safe=False),        # save_config
+    _command(0x3682, 0, words=3),                   # get_serial_number
+    _command(0x3632, 1200, retry_safe=False),       # perform_factory_reset
+    _command(0x3639, 10_000, words=1, retry_safe=False),    # perform_self_test. да, 10 секунд! yes, 10 seconds!
+    _command(0x3646, 20),                           # reinit
+    _command(0x241D, 1),                            # set_temperature_offset
+    _command(0x2318, 1, words=1),                   # get_temperature_offset
+    _command(0x2427, 1),                            # set_sensor_altitude
+    _command(0x2322, 1, words=1),                   # get_sensor_altitude
+    _command(0xE000, 1),                            # set_ambient_pressure
+    _command(0x362F, 400, words=1, signed=True, retry_safe=False),  # perform_forced_recalibration
+    _command(0x2313, 1, words=1),                   # get_automatic_self_calibration_enabled
+    _command(0x2416, 1),                            # set_automatic_self_calibration_enabled
+    _command(0x21AC),                               # start_low_power_periodic_measurement
+    _command(0x21B1),                               # start_periodic_measurement
+    _command(0x3F86, 500),                          # stop_periodic_measurement
+    _command(0xEC05, 1, words=3, retry_safe=False),  # read_measurement
+    _command(0xE4B8, 1, words=1),                   # get_data_ready_status
+    _command(0x36F6, 20),                           # wake_up
+    _command(0x36E0, 1),                            # power_down
+    _command(0x2196),                               # measure_single_shot_rht_only
+    _command(0x219D),                               # measure_single_shot
+)
+
+# команды с ответом и ожиданием не более этого, мс, выполняются одним вызовом write_then_read_into.
+# commands with a response and a wait of no more than this, ms, are executed by a single write_then_read_into call.
+_SHORT_WAIT_MS = const(1)
+
+# формат снимка состояния драйвера (смотри get_state): версия, флаги режима, маска известных настроек, 3 слова настроек,
+# 3 слова сохраненных в EEPROM настроек, серийный номер (3 слова), время последнего измерения и запуска однократного
+# измерения (time.time()), CRC.
+# driver state snapshot format (see get_state): version, mode flags, known settings mask, 3 settings words,
+# 3 words of settings saved in EEPROM, serial number (3 words), time of the last measurement and of the single shot
+# start (time.time()), CRC.
+_STATE_FORMAT = ">BBB6H3HIIB"
+_STATE_VERSION = const(1)
+# настройки снимка, по порядку. snapshot settings, in order
+_STATE_CONFIG = (CMD_GET_T_OFFSET, CMD_GET_ALTITUDE, CMD_GET_ASC)
+
+# формат результата get_measurement_value. get_measurement_value result format
+# measured_values_scd4x, T и RH в float. measured_values_scd4x, T and RH as float
+FMT_FLOAT = const(0)
+# measured_raw_scd4x, сырые слова датчика, преобразование в float при обращении к полю.
+# measured_raw_scd4x, raw sensor words, conversion to float on field access.
+FMT_RAW = const(1)
+# measured_values_scd4x, T в сотых долях °C, RH в сотых долях %, только целые числа.
+# measured_values_scd4x, T in hundredths of °C, RH in hundredths of %, integers only.
+FMT_FIXED = const(2)
+
+
+@micropython.viper
+def temperature_centi(raw: int) -> int:
+    """Преобразует сырое слово температуры в сотые доли °C. Только целочисленная арифметика!
+    175 / 65535 приближено 4375 / 2**14 (погрешность меньше 0.01 °C), произведение помещается в small int.
+    Converts a raw temperature word to hundredths of °C. Integer arithmetic only!
+    175 / 65535 is approximated by 4375 / 2**14 (error less than 0.01 °C), the product fits in a small int."""
+    return ((raw * 4375 + 8192) >> 14) - 4500
+
+
+@micropython.viper
+def humidity_centi(raw: int) -> int:
+    """Преобразует сырое слово относительной влажности в сотые доли %. Только целочисленная арифметика!
+    Converts a raw relative humidity word to hundredths of %. Integer arithmetic only!"""
+    return (raw * 625 + 2048) >> 12
+
+
+def _check_word(value: int) -> int:
+    """Возвращает value, если это слово датчика (0..0xFFFF), иначе возбуждает ValueError.
+    Returns value if it is a sensor word (0..0xFFFF), otherwise raises ValueError."""
+    if value < 0 or value > 0xFFFF:
+        raise ValueError(f"Invalid sensor word: {value}!")
+    return value
+
+
+def t_offset_to_raw(offset: float) -> int:
+    """Преобразует смещение температуры в °C в слово датчика. Converts a temperature offset in °C to a sensor word."""
+    return int(374.49142857 * offset)
+
+
+def t_offset_from_raw(raw: int) -> float:
+    """Преобразует слово датчика в смещение температуры в °C. Converts a sensor word to a temperature offset in °C."""
+    return 0.0026702880859375 * raw
+
+
+def temperature_from_raw(raw: int) -> float:
+    """Преобразует сырое слово температуры в °C. Converts a raw temperature word to °C."""
+    return -45 + 0.0026703288 * raw
+
+
+def humidity_from_raw(raw: int) -> float:
+    """Преобразует сырое слово относительной влажности в %. Converts a raw relative humidity word to %."""
+    return 0.0015259022 * raw
+
+
+class measured_raw_scd4x:
+    """Легковесная запись измерения, хранящая сырые слова датчика. Поля T и RH преобразуются в float только при
+    обращении к ним, поля T_centi и RH_centi возвращают целые сотые доли °C и %.
+    Lightweight measurement record storing raw sensor words. The T and RH fields are converted to float only when
+    accessed, the T_centi and RH_centi fields return integer hundredths of °C and %."""
+
+    def __init__(self, co2: int, t_raw: int, rh_raw: int):
+        self.CO2 = co2
+        self.t_raw = t_raw
+        self.rh_raw = rh_raw
+
+    @property
+    def T(self) -> float:
+        return temperature_from_raw(self.t_raw)
+
+    @property
+    def RH(self) -> float:
+        return humidity_from_raw(self.rh_raw)
+
+    @property
+    def T_centi(self) -> int:
+        return temperature_centi(self.t_raw)
+
+    @property
+    def RH_centi(self) -> int:
+        return humidity_centi(self.rh_raw)
+
+    def __iter__(self):
+        yield self.CO2
+        yield self.T
+        yield self.RH
+
+    def __repr__(self) -> str:
+        return f"measured_raw_scd4x(CO2={self.CO2}, t_raw={self.t_raw}, rh_raw={self.rh_raw})"
 
 
 class SCD4xSensirion(IBaseSensorEx, Iterator):
     """Class for work with Sensirion SCD4x sensor"""
     def __init__(self, adapter: bus_service.BusAdapter, address=0x62,
-                 this_is_scd41: bool = True, check_crc: bool = True):
+                 this_is_scd41: bool = True, check_crc: bool = True, output_format: int = FMT_FLOAT,
+                 cache_config: bool = True):
         """Если check_crc в Истина, то каждый, принятый от датчика пакет данных, проверяется на правильность путем
         расчета контрольной суммы.
         Если this_is_scd41 == True, то будут доступны методы для SCD41, иначе будут доступны методы ОБЩИЕ для SCD40/41!
+        output_format - формат результата get_measurement_value: FMT_FLOAT, FMT_RAW или FMT_FIXED.
+        Если cache_config в Истина, то настройки (смещение температуры, высота, ASC) кэшируются в драйвере: геттеры
+        не обращаются к шине, а save_config не пишет в EEPROM, если настройки не изменились.
         If check_crs is True, then each data packet received from the sensor is checked for correctness by
         calculating the checksum.
         If this_is_scd41 == True then methods for SCD41 will be available,
-        otherwise GENERAL methods for SCD40/41 will be available!"""
+        otherwise GENERAL methods for SCD40/41 will be available!
+        output_format - get_measurement_value result format: FMT_FLOAT, FMT_RAW or FMT_FIXED.
+        If cache_config is True, then the settings (temperature offset, altitude, ASC) are cached in the driver: getters
+        do not access the bus, and save_config does not write to EEPROM if the settings have not changed."""
         self._connection = DeviceEx(adapter=adapter, address=address, big_byte_order=True)
-        self._buf_3 = bytearray((0 for _ in range(3)))
-        self._buf_9 = bytearray((0 for _ in range(9)))
+        # буфер передачи: код команды + слово + CRC (5 байт). Заполняется на месте! Команды без аргумента
+        # передаются готовыми байтами из дескриптора.
+        # transmit buffer: command code + word + CRC (5 bytes). Filled in place! Commands without an argument
+        # are sent as ready-made bytes from the descriptor.
+        self._tx_5 = bytearray(5)
+        # буфер приема и его представления на 3 и 9 байт. receive buffer and its 3 and 9 byte views
+        self._rx = bytearray(9)
+        self._buf_3 = memoryview(self._rx)[:3]
+        self._buf_9 = memoryview(self._rx)
         self.check_crc = check_crc
+        self.output_format = base_sensor.check_value(output_format, (FMT_FLOAT, FMT_RAW, FMT_FIXED),
+                                                     f"Invalid output format: {output_format}")
+        # кольцевой буфер истории измерений (например, scd4x_history.MeasurementRing) или None. Каждое считанное
+        # измерение добавляется в него прямо из буфера приема.
+        # measurement history ring buffer (for example, scd4x_history.MeasurementRing) or None. Each read
+        # measurement is added to it directly from the receive buffer.
+        self.history = None
+        # кэш настроек: сырое слово по идентификатору команды чтения (CMD_GET_*). Отсутствие ключа - значение
+        # неизвестно. _persisted - снимок настроек, сохраненных в EEPROM датчика.
+        # settings cache: raw word by read command ID (CMD_GET_*). Missing key - the value is unknown.
+        # _persisted - snapshot of the settings stored in the sensor EEPROM.
+        # статистика обменов (sensor_pack_2.bus_stats.BusStats) или None. Смотри enable_stats.
+        # transfer statistics (sensor_pack_2.bus_stats.BusStats) or None. See enable_stats.
+        self.stats = None
+        # политика повторов (sensor_pack_2.retry.RetryPolicy) или None - без повторов.
+        # retry policy (sensor_pack_2.retry.RetryPolicy) or None - no retries.
+        self.retry_policy = None
+        self.cache_config = cache_config
+        self._config = dict()
+        self._persisted = dict()
         # power mode
         self._low_power_mode = False
         # measurement mode (single shot, continuous)
@@ -41,10 +253,31 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         self._continuous_mode = False
         self._rht_only = False
         self._isSCD41 = this_is_scd41
+        # Истина, если датчик выключен командой power_down. True if the sensor is powered down by the power_down command
+        self._powered_down = False
+        # серийный номер после первого вызова get_id, иначе None. serial number after the first get_id call, else None
+        self.serial = None
+        # время (time.time()) последнего измерения и запуска однократного измерения, признак незавершенного однократного
+        # измерения. time (time.time()) of the last measurement and of the single shot start, flag of an unfinished
+        # single shot
+        self._sample_at = 0
+        # ticks_ms последнего измерения или None. В цикле измерений запоминается только он: time.time() на некоторых
+        # портах возвращает float и выделяет память. Переводится в time.time() в get_state.
+        # ticks_ms of the last measurement or None. Only it is stored in the measurement loop: time.time() returns
+        # a float on some ports and allocates memory. Converted to time.time() in get_state.
+        self._sample_tick = None
+        self._shot_at = 0
+        self._shot_pending = False
         # сохраняю, чтобы не вызывать 125 раз
         self.byte_order = self._connection._get_byteorder_as_str()
-
-    def _get_local_buf(self, bytes_for_read: int) -> [None, bytearray]:
+        # формат struct трех слов кадра Sensirion (смещения 0, 3, 6). Распаковка одним вызовом, без срезов! Только вне
+        # цикла измерений: unpack_from создает кортеж, а на MicroPython еще и разбирает формат при каждом вызове.
+        # struct format of three words of a Sensirion frame (offsets 0, 3, 6). Unpacking in one call, without slicing!
+        # Only outside the measurement loop: unpack_from creates a tuple, and on MicroPython also parses the format on
+        # every call.
+        self._words_3 = self._connection.get_codec("H", count=3, stride=3)
+
+    def _get_local_buf(self, bytes_for_read: int) -> [None, memoryview]:
         """возвращает локальный буфер для операции чтения"""
         if bytes_for_read not in (0, 3, 9):
             raise ValueError(f"Invalid value for bytes_for_read: {bytes_for_read}")
@@ -58,45 +291,353 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         byteorder = self.byte_order[0]
         return value.to_bytes(length, byteorder)
 
-    def _send_command(self, cmd: int, value: [bytes, None],
-                      wait_time: int = 0, bytes_for_read: int = 0,
-                      crc_index: range = None,
-                      value_index: tuple = None) -> [bytes, None]:
-        """Передает команду датчику по шине.
-        cmd - код команды.
-        value - последовательность, передаваемая после кода команды.
-        wait_time - время в мс. которое нужно подождать для обработки команды датчиком.
-        bytes_for_read - количество байт в ответе датчика, если не 0, то будет считан ответ,
-        проверена CRC (зависит от self.check_crc) и этот ответ будет возвращен, как результат.
-        crc_index_range - индексы crc в последовательности.
-        value_index_ranges- кортеж индексов (range) данных значений в
-        последовательности. (range(3), range(4,6), range(7,9))"""
-        _conn = self._connection
-        raw_cmd = self._to_bytes(cmd, 2)
-        raw_out = raw_cmd
-        if value:
-            raw_out += value    # добавляю value и его crc
-            raw_out += self._to_bytes(_calc_crc(value), length=1)     # crc считается только для данных!
+    def _get_tx_buf(self, desc: command_scd4x, value: [int, bytes, None]) -> [bytes, bytearray]:
+        """Возвращает буфер передачи команды desc с аргументом value. Память не выделяется!
+        Слово value должно быть в диапазоне 0..0xFFFF, иначе ValueError.
+        Returns the transmit buffer of the desc command with the value argument. No memory allocation!
+        The value word must be in the range 0..0xFFFF, otherwise ValueError."""
+        raw = desc.raw
+        if value is None:
+            return raw
+        tx = self._tx_5
+        tx[0] = raw[0]
+        tx[1] = raw[1]
+        if isinstance(value, int):
+            if value < 0 or value > 0xFFFF:
+                # сообщение создается только при ошибке. the message is created only on an error
+                raise ValueError(f"Invalid command argument: {value}! Command: {desc.code}")
+            tx[2] = value >> 8
+            tx[3] = value & 0xFF
+        else:
+            tx[2] = value[0]
+            tx[3] = value[1]
+        tx[4] = crc8_31(tx, 2, 4)   # crc считается только для данных! crc is calculated for data only!
+        return tx
+
+    def _send_command(self, cmd_id: int, value: [int, bytes, None] = None) -> [memoryview, None]:
+        """Передает команду датчику по шине. В установившемся режиме память не выделяется!
+        cmd_id - идентификатор команды (индекс в таблице _commands). Код команды, время ее обработки датчиком
+        и длина ответа берутся из дескриптора команды.
+        value - 16-ти битное слово (int) или два байта (bytes), передаваемые после кода команды, или None.
+        Если длина ответа не 0, то будет считан ответ, проверена CRC (зависит от self.check_crc) и этот ответ будет
+        возвращен, как результат.
+        cmd_id - command identifier (index in the _commands table). The command code, its execution time and
+        the response length are taken from the command descriptor.
+        value - 16-bit word (int) or two bytes (bytes) sent after the command code, or None.
+        При ошибке шины (OSError) или CRC (ValueError) команда повторяется согласно retry_policy, если это безопасно.
+        Неверный аргумент (ValueError) обнаруживается до передачи и не повторяется.
+        On a bus (OSError) or CRC (ValueError) error, the command is retried according to retry_policy, if it is safe.
+        An invalid argument (ValueError) is detected before sending and is not retried."""
+        desc = _commands[cmd_id]
+        # кадр собирается и проверяется до цикла повторов, в цикле ValueError - только ошибка CRC.
+        # the frame is built and checked before the retry loop, in the loop ValueError is only a CRC error.
+        tx = self._get_tx_buf(desc, value)
+        attempt = 1
+        while True:
+            try:
+                wait_time = desc.wait_time
+                if desc.read_len and wait_time <= _SHORT_WAIT_MS:
+                    # запись, короткое ожидание и чтение одним вызовом. write, short wait and read in one call
+                    b = self._get_local_buf(desc.read_len)
+                    self._connection.write_then_read_into(tx, b, 1000 * wait_time)
+                    return self._check_response(desc, b)
+                self._connection.write(tx)
+                if wait_time:
+                    time.sleep_ms(wait_time)   # ожидание
+                return self._read_response(desc)
+            except (OSError, ValueError) as e:
+                time.sleep_ms(self._get_retry_delay(cmd_id, attempt, e))
+                attempt += 1
+
+    def _get_retry_delay(self, cmd_id: int, attempt: int, exc: Exception) -> int:
+        """Вызывается из обработчика исключения после неудачной попытки номер attempt. Возвращает паузу перед
+        повтором в мс или повторно возбуждает исключение exc, если повтор невозможен или небезопасен.
+        Called from an exception handler after the failed attempt number attempt. Returns the pause before
+        a retry in ms or re-raises the exc exception if a retry is impossible or unsafe."""
+        policy = self.retry_policy
+        desc = _commands[cmd_id]
+        if policy is None or not desc.retry_safe or not policy.should_retry(attempt, exc):
+            raise exc
+        stats = self.stats
+        if stats is not None:
+            stats.record_retry(desc.code)
+        return policy.get_delay(attempt)
+
+    def _write_command(self, cmd_id: int, value: [int, bytes, None] = None) -> command_scd4x:
+        """Первая фаза _send_command. Выдает команду на шину и возвращает ее дескриптор.
+        The first phase of _send_command. Writes the command to the bus and returns its descriptor."""
+        desc = _commands[cmd_id]
         # выдача на шину
-        _conn.write(raw_out)
-        if wait_time:
-            time.sleep_ms(wait_time)   # ожидание
+        self._connection.write(self._get_tx_buf(desc, value))
+        return desc
+
+    def _read_response(self, desc: command_scd4x) -> [memoryview, None]:
+        """Вторая фаза _send_command, после ожидания desc.wait_time. Считывает ответ датчика и проверяет его CRC.
+        Возвращает None, если команда не имеет ответа.
+        The second phase of _send_command, after waiting desc.wait_time. Reads the sensor response and checks its CRC.
+        Returns None if the command has no response."""
+        bytes_for_read = desc.read_len
         if not bytes_for_read:
             return None
         b = self._get_local_buf(bytes_for_read)
         # читаю с шины в буфер
-        _conn.read_to_buf(buf=b)
-        base_sensor.check_value(len(b), (bytes_for_read,),
-                                f"Invalid buffer length for cmd: {cmd}. Received {len(b)} out of {bytes_for_read}")
-        if self.check_crc:
-            crc_from_buf = [b[i] for i in crc_index]  # build list of CRC from buf
-            calculated_crc = [_calc_crc(b[rng.start:rng.stop]) for rng in value_index]
-            if crc_from_buf != calculated_crc:
-                raise ValueError(f"Invalid CRC! Calculated{calculated_crc}. From buffer {crc_from_buf}")
-        return b    # возврат bytearray со считанными данными
+        self._connection.read_to_buf(buf=b)
+        return self._check_response(desc, b)
+
+    def _check_response(self, desc: command_scd4x, b: memoryview) -> memoryview:
+        """Проверяет CRC ответа b на команду desc (если check_crc Истина) и возвращает b.
+        Checks the CRC of the response b to the desc command (if check_crc is True) and returns b."""
+        # CRC каждого слова проверяется за один проход, по таблице. CRC of each word is checked in one pass, by table
+        if self.check_crc and not verify_words(b, desc.words):
+            stats = self.stats
+            if stats is not None:
+                stats.record_crc_error(desc.code)
+            raise ValueError(f"Invalid CRC! Command: {desc.code}. Buffer: {bytes(b)}")
+        return b    # возврат memoryview со считанными данными. return memoryview with the read data
+
+    @staticmethod
+    def _decode_word(cmd_id: int, b) -> int:
+        """Возвращает первое слово ответа b, со знаком или без, согласно дескриптору команды cmd_id.
+        Returns the first word of the response b, signed or not, according to the cmd_id command descriptor."""
+        word = (b[0] << 8) | b[1]
+        if _commands[cmd_id].signed and word & 0x8000:
+            return word - 0x10000
+        return word
+
+    def _read_word(self, cmd_id: int, value: [int, bytes, None] = None) -> int:
+        """Передает команду датчику и возвращает первое слово ответа, со знаком или без, согласно дескриптору.
+        Sends a command to the sensor and returns the first response word, signed or not, according to the descriptor."""
+        return self._decode_word(cmd_id, self._send_command(cmd_id, value))
+
+    def _decode_id(self, b) -> serial_number_scd4x:
+        """Разбор ответа на команду CMD_GET_ID. Parsing the response to the CMD_GET_ID command."""
+        self.serial = serial_number_scd4x(*struct.unpack_from(self._words_3, b))
+        return self.serial
+
+    def _store_measurement(self, b):
+        """Добавляет считанное измерение b в history и отмечает, что однократное измерение завершено.
+        Adds the read measurement b to history and marks the single shot as finished."""
+        history = self.history
+        if history is not None:
+            history.append_frame(b)
+        self._shot_pending = False
+        self._sample_tick = time.ticks_ms()
+
+    def _decode_measurement(self, b) -> [measured_values_scd4x, measured_raw_scd4x]:
+        """Разбор ответа на команду CMD_READ_MEASUREMENT, согласно output_format. Добавляет измерение в history.
+        Parsing the response to the CMD_READ_MEASUREMENT command, according to output_format.
+        Adds the measurement to history."""
+        self._store_measurement(b)
+        # слова считываются прямо из буфера приема, без срезов и кортежа. words are read directly from the rx buffer,
+        # without slices and a tuple
+        co2 = (b[0] << 8) | b[1]
+        t = (b[3] << 8) | b[4]
+        rh = (b[6] << 8) | b[7]
+        fmt = self.output_format
+        if FMT_RAW == fmt:
+            return measured_raw_scd4x(co2, t, rh)
+        if FMT_FIXED == fmt:
+            return measured_values_scd4x(CO2=co2, T=temperature_centi(t), RH=humidity_centi(rh))
+        #       CO2 [ppm]           T, Celsius              Relative Humidity, %
+        return measured_values_scd4x(CO2=co2, T=temperature_from_raw(t), RH=humidity_from_raw(rh))
+
+    def _set_mode(self, continuous: bool, single_shot: bool, rht_only: bool):
+        """Запоминает режим измерения после успешной передачи команды. Remembers the measurement mode after
+        the command was successfully sent."""
+        self._continuous_mode = continuous
+        self._single_shot_mode = single_shot
+        self._rht_only = rht_only
+        if single_shot:
+            self._shot_pending = True
+            self._shot_at = int(time.time())
+
+    def _get_periodic_cmd_id(self, start: bool) -> int:
+        """Возвращает идентификатор команды запуска (с учетом _low_power_mode) или остановки периодических измерений.
+        Returns the command ID to start (taking _low_power_mode into account) or stop periodic measurements."""
+        if start:
+            return CMD_START_LP_PERIODIC if self._low_power_mode else CMD_START_PERIODIC
+        return CMD_STOP_PERIODIC
+
+    def enable_stats(self, stats=None):
+        """Включает сбор статистики обменов по кодам команд: количество вызовов, байты, время на шине и время
+        ожидания, гистограмма задержек, ошибки CRC и OSError. Адаптер шины оборачивается InstrumentedAdapter.
+        Возвращает объект статистики (stats или новый BusStats).
+        Enables collection of transfer statistics by command codes: call count, bytes, bus time and wait time,
+        latency histogram, CRC and OSError errors. The bus adapter is wrapped in InstrumentedAdapter.
+        Returns the statistics object (stats or a new BusStats).
+        Модуль bus_stats загружается только здесь, без статистики он не занимает ОЗУ.
+        The bus_stats module is loaded only here, without statistics it takes no RAM."""
+        if self.stats is None:
+            from sensor_pack_2.bus_stats import BusStats, InstrumentedAdapter
+            if stats is None:
+                stats = BusStats()
+            conn = self._connection
+            conn.adapter = InstrumentedAdapter(conn.adapter, stats)
+            self.stats = stats
+        return self.stats
+
+    def disable_stats(self):
+        """Выключает сбор статистики и возвращает исходный адаптер шины. Возвращает собранную статистику.
+        Disables statistics collection and restores the original bus adapter. Returns the collected statistics."""
+        stats = self.stats
+        if stats is not None:
+            conn = self._connection
+            conn.adapter = conn.adapter.inner
+            self.stats = None
+        return stats
+
+    def get_state(self) -> bytes:
+        """Возвращает компактный (30 байт) снимок состояния драйвера: режим измерения, кэш настроек, серийный номер
+        и время последнего измерения. Снимок можно сохранить в памяти RTC (machine.RTC().memory) или в файле перед
+        глубоким сном, а после пробуждения восстановить драйвер методом resume_from, без обращений к датчику.
+        Returns a compact (30 bytes) snapshot of the driver state: measurement mode, settings cache, serial number
+        and the last measurement time. The snapshot can be stored in RTC memory (machine.RTC().memory) or in a file
+        before deep sleep, and after waking up the driver can be restored by the resume_from method, without accessing
+        the sensor."""
+        flags = (self._continuous_mode | self._single_shot_mode << 1 | self._rht_only << 2
+                 | self._low_power_mode << 3 | self._isSCD41 << 4 | (self.serial is not None) << 5
+                 | self._shot_pending << 6 | self._powered_down << 7)
+        mask = 0
+        words = [0] * 6
+        for index, cmd_id in enumerate(_STATE_CONFIG):
+            raw = self._config.get(cmd_id)
+            if raw is not None:
+                mask |= 1 << index
+                words[index] = raw
+            raw = self._persisted.get(cmd_id)
+            if raw is not None:
+                mask |= 8 << index
+                words[3 + index] = raw
+        serial = (0, 0, 0) if self.serial is None else self.serial
+        sample_at = self._sample_at
+        if self._sample_tick is not None:
+            # время измерения по ticks_ms, верно, если оно было не раньше половины периода ticks (дни).
+            # measurement time from ticks_ms, correct if it was no earlier than half the ticks period (days).
+            sample_at = int(time.time()) - time.ticks_diff(time.ticks_ms(), self._sample_tick) // 1000
+        buf = bytearray(struct.calcsize(_STATE_FORMAT))
+        struct.pack_into(_STATE_FORMAT, buf, 0, _STATE_VERSION, flags, mask, *words, *serial,
+                         sample_at & 0xFFFF_FFFF, self._shot_at & 0xFFFF_FFFF, 0)
+        buf[-1] = crc8_31(buf, 0, len(buf) - 1)
+        return bytes(buf)
+
+    def set_state(self, state: [bytes, bytearray]):
+        """Восстанавливает состояние драйвера из снимка get_state. К датчику не обращается!
+        Restores the driver state from a get_state snapshot. Does not access the sensor!"""
+        size = struct.calcsize(_STATE_FORMAT)
+        if len(state) != size or state[-1] != crc8_31(state, 0, size - 1) or _STATE_VERSION != state[0]:
+            raise ValueError("Invalid state snapshot!")
+        fields = struct.unpack(_STATE_FORMAT, state)
+        flags, mask = fields[1], fields[2]
+        self._continuous_mode = bool(flags & 0x01)
+        self._single_shot_mode = bool(flags & 0x02)
+        self._rht_only = bool(flags & 0x04)
+        self._low_power_mode = bool(flags & 0x08)
+        self._isSCD41 = bool(flags & 0x10)
+        self.serial = serial_number_scd4x(*fields[9:12]) if flags & 0x20 else None
+        self._shot_pending = bool(flags & 0x40)
+        self._powered_down = bool(flags & 0x80)
+        self._config = dict()
+        self._persisted = dict()
+        if self.cache_config:
+            for index, cmd_id in enumerate(_STATE_CONFIG):
+                if mask & (1 << index):
+                    self._config[cmd_id] = fields[3 + index]
+                if mask & (8 << index):
+                    self._persisted[cmd_id] = fields[6 + index]
+        self._sample_at = fields[12]
+        self._sample_tick = None
+        self._shot_at = fields[13]
+
+    @classmethod
+    def resume_from(cls, adapter: bus_service.BusAdapter, state: [bytes, bytearray], address=0x62, **kwargs):
+        """Создает драйвер по снимку get_state, без остановки измерений, чтения серийного номера и настроек.
+        Возбуждает ValueError, если снимок поврежден (тогда создайте драйвер обычным образом). Пример:
+        Creates a driver from a get_state snapshot, without stopping measurements, reading the serial number and
+        settings. Raises ValueError if the snapshot is corrupted (then create the driver in the usual way). Example:
+        sen = SCD4xSensirion.resume_from(adapter, rtc.memory())
+        if sen.time_to_data() == 0:
+            value = sen.get_measurement_value()"""
+        sen = cls(adapter, address, **kwargs)
+        sen.set_state(state)
+        return sen
+
+    def is_powered_down(self) -> bool:
+        """Возвращает Истина, если датчик выключен командой power_down. Returns True if the sensor is powered down."""
+        return self._powered_down
+
+    def time_to_data(self) -> int:
+        """Возвращает время в мс до готовности данных однократного измерения, запущенного (возможно, до глубокого
+        сна) и еще не прочитанного, 0 если данные готовы, -1 если такого измерения нет. Точность - 1 секунда
+        (time.time() переживает глубокий сон, а ticks_ms - нет).
+        Returns the time in ms until the data of a single shot started (possibly before deep sleep) and not yet read
+        is ready, 0 if the data is ready, -1 if there is no such measurement. Accuracy is 1 second (time.time()
+        survives deep sleep, but ticks_ms does not)."""
+        if not (self._single_shot_mode and self._shot_pending):
+            return -1
+        remaining = self.get_conversion_cycle_time() - 1000 * (int(time.time()) - self._shot_at)
+        return remaining if remaining > 0 else 0
+
+    def _get_cached(self, cmd_id: int) -> [int, None]:
+        """Возвращает сырое слово настройки из кэша или None, если оно неизвестно.
+        Returns the raw setting word from the cache or None if it is unknown."""
+        if not self.cache_config:
+            return None
+        return self._config.get(cmd_id)
+
+    def _put_cached(self, cmd_id: int, raw: int, written: bool):
+        """Запоминает сырое слово настройки cmd_id. written - Истина, если значение записано в датчик, Ложь - если
+        прочитано из него. Значение, прочитанное впервые, считается совпадающим с EEPROM, так как после включения
+        питания датчик загружает настройки из EEPROM.
+        Remembers the raw word of the cmd_id setting. written - True if the value was written to the sensor, False if
+        it was read from it. A value read for the first time is considered equal to the EEPROM value, since the sensor
+        loads the settings from EEPROM after power-up."""
+        if not self.cache_config:
+            return
+        self._config[cmd_id] = raw
+        if not written and cmd_id not in self._persisted:
+            self._persisted[cmd_id] = raw
+
+    def _read_config(self, cmd_id: int) -> int:
+        """Возвращает сырое слово настройки из кэша, а если оно неизвестно, то читает его из датчика.
+        Returns the raw setting word from the cache, and if it is unknown, reads it from the sensor."""
+        raw = self._get_cached(cmd_id)
+        if raw is None:
+            raw = self._read_word(cmd_id)
+            self._put_cached(cmd_id, raw, written=False)
+        return raw
+
+    def _config_saved(self):
+        """Вызывается после записи настроек в EEPROM. Called after the settings are written to EEPROM."""
+        self._persisted = dict(self._config)
+
+    def _config_reloaded(self, factory: bool):
+        """Вызывается после загрузки настроек датчиком из EEPROM (reinit) или сброса к заводским (factory).
+        Called after the sensor reloads the settings from EEPROM (reinit) or resets them to factory (factory)."""
+        if factory:
+            self._persisted = dict()
+        self._config = dict(self._persisted)
+
+    def is_config_dirty(self) -> bool:
+        """Возвращает Истина, если настройки изменены после последнего сохранения в EEPROM (или кэш выключен).
+        Returns True if the settings have been changed since the last save to EEPROM (or the cache is disabled)."""
+        if not self.cache_config:
+            return True
+        persisted = self._persisted
+        for cmd_id, raw in self._config.items():
+            if persisted.get(cmd_id) != raw:
+                return True
+        return False
+
+    def invalidate_config(self):
+        """Забывает кэшированные настройки, следующие геттеры прочитают их из датчика. Вызывайте, если датчик
+        перезапускался по питанию или его настройки менялись в обход драйвера.
+        Forgets the cached settings, the next getters will read them from the sensor. Call if the sensor was
+        power cycled or its settings were changed bypassing the driver."""
+        self._config = dict()
+        self._persisted = dict()
 
     # Advanced features
-    def save_config(self):
+    def save_config(self, force: bool = False) -> bool:
         """Настройки конфигурации, такие как смещение температуры, высота расположения датчика над уровнем моря
         по умолчанию сохраняются только в энергозависимой памяти (ОЗУ) и будут потеряны после выключения и включения
         питания. Метод сохраняет текущую конфигурацию в EEPROM SCD4x, сохраняя ее при отключении питания.
@@ -107,20 +648,23 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         (RAM) and will be lost after a power cycle. The method saves the current configuration in the EEPROM of the
         SCD4x, saving it when the power is turned off. To avoid unnecessary wear on the EEPROM, the method should only
         be called if necessary(!) and if actual configuration changes have been made.
-        EEPROM is guaranteed to withstand at least 2000 write cycles to failure (!)"""
-        cmd = 0x3615
-        self._send_command(cmd, None, 800)
+        EEPROM is guaranteed to withstand at least 2000 write cycles to failure (!)
+        Если настройки не изменились после последнего сохранения (смотри is_config_dirty) и force Ложь, то метод
+        ничего не делает. Возвращает Истина, если настройки записаны в EEPROM.
+        If the settings have not changed since the last save (see is_config_dirty) and force is False, then the method
+        does nothing. Returns True if the settings were written to EEPROM."""
+        if not force and not self.is_config_dirty():
+            return False
+        self._send_command(CMD_SAVE_CONFIG)
+        self._config_saved()
+        return True
 
     def get_id(self) -> serial_number_scd4x:
         """Return 3 words of unique serial number can be used to identify
         the chip and to verify the presence of the sensor."""
         # создатели датчика 'обрадовали'. вместо подсчета одного байта CRC на 6 байт (3 двухбайтных слова)
         # они считают CRC для каждого из 3-х двухбайтных слов!
-        cmd = 0x3682
-        b = self._send_command(cmd, None, 0, bytes_for_read=9,
-                               crc_index=range(2, 9, 3), value_index=(range(2), range(3, 5), range(6, 8)))
-        _gen = ((b[i] << 8) | b[i+1] for i in range(0, 9, 3))
-        return serial_number_scd4x(word_0=next(_gen), word_1=next(_gen), word_2=next(_gen))
+        return self._decode_id(self._send_command(CMD_GET_ID))
 
     def soft_reset(self):
         """Я сознательно не стал использовать команду perfom_factory_reset, чтобы было невозможно испортить датчик
@@ -129,20 +673,15 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         sensor programmatically, since the number of write cycles to the internal FLASH memory of the
         sensor is limited!
         09.09.2024. Добавил. Под вашу ответственность!"""
-        cmd = 0x3632
-        self._send_command(cmd, None, 1200)
+        self._send_command(CMD_SOFT_RESET)
+        self._config_reloaded(factory=True)
 
     def exec_self_test(self) -> bool:
         """"Этот метод можно использовать в качестве конечного теста для проверки работоспособности датчика и
         проверки подачи питания на датчик. Возвращает Истина, когда тест пройден успешно.
         The feature can be used as an end-of-line test to check sensor functionality and the customer power
         supply to the sensor. Returns True when the test is successful."""
-        cmd = 0x3639
-        length = 3
-        b = self._send_command(cmd, None, wait_time=10_000,     # да, ждать 10 секунд! yes, wait 10 seconds!
-                               bytes_for_read=length, crc_index=range(2, 3), value_index=(range(2),))
-        res = self._connection.unpack("H", b)[0]
-        return 0 == res
+        return 0 == self._read_word(CMD_SELF_TEST)     # да, ждать 10 секунд! yes, wait 10 seconds!
 
     def reinit(self) -> None:
         """Команда reinit повторно инициализирует датчик, загружая пользовательские настройки из EEPROM.
@@ -152,8 +691,8 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         Before sending the reinit command, the stop_measurement method must be called.
         If the reinit command does not trigger the desired re-initialization,
         a power-cycle should be applied to the SCD4x."""
-        cmd = 0x3646
-        self._send_command(cmd, None, 20)
+        self._send_command(CMD_REINIT)
+        self._config_reloaded(factory=False)
 
     # On-chip output signal compensation
     def set_temperature_offset(self, offset: float):    # вызов нужно делать только в IDLE режиме датчика!
@@ -172,17 +711,14 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         The method should be called only in IDLE sensor mode!
 
         𝑇 𝑜𝑓𝑓𝑠𝑒𝑡_𝑎𝑐𝑡𝑢𝑎𝑙 = 𝑇 𝑆𝐶𝐷40 − 𝑇 𝑅𝑒𝑓𝑒𝑟𝑒𝑛𝑐𝑒 + 𝑇 𝑜𝑓𝑓𝑠𝑒𝑡_ 𝑝𝑟𝑒𝑣𝑖𝑜𝑢𝑠"""
-        cmd = 0x241D
-        offset_raw = self._to_bytes(int(374.49142857 * offset), 2)
-        self._send_command(cmd, offset_raw, 1)
+        raw = t_offset_to_raw(offset)
+        self._send_command(CMD_SET_T_OFFSET, raw)
+        self._put_cached(CMD_GET_T_OFFSET, raw, written=True)
 
     def get_temperature_offset(self) -> float:
-        """Метод нужно вызывать только в IDLE режиме датчика!
-        The method should be called only in IDLE sensor mode!"""
-        cmd = 0x2318
-        b = self._send_command(cmd, None, wait_time=1, bytes_for_read=3, crc_index=range(2, 3), value_index=(range(2),))
-        temp_offs = self._connection.unpack("H", b)[0]
-        return 0.0026702880859375 * temp_offs
+        """Метод нужно вызывать только в IDLE режиме датчика, если значение не кэшировано!
+        The method should be called only in IDLE sensor mode if the value is not cached!"""
+        return t_offset_from_raw(self._read_config(CMD_GET_T_OFFSET))
 
     def set_altitude(self, masl: int):  # вызов нужно делать только в IDLE режиме датчика!
         """Чтение и запись высоты датчика должны выполняться, когда SCD4x находится в режиме ожидания.
@@ -194,16 +730,13 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         the save_config method. By default, the sensor height is set to 0 meters above sea level (masl).
         Метод нужно вызывать только в IDLE режиме датчика!
         The method should be called only in IDLE sensor mode!"""
-        cmd = 0x2427
-        masl_raw = self._to_bytes(masl, 2)
-        self._send_command(cmd, masl_raw, 1)
+        self._send_command(CMD_SET_ALTITUDE, masl)
+        self._put_cached(CMD_GET_ALTITUDE, masl, written=True)
 
     def get_altitude(self) -> int:
-        """Метод нужно вызывать только в IDLE режиме датчика!
-        The method should be called only in IDLE sensor mode!"""
-        cmd = 0x2322
-        b = self._send_command(cmd, None, wait_time=1, bytes_for_read=3, crc_index=range(2, 3), value_index=(range(2),))
-        return self._connection.unpack("H", b)[0]
+        """Метод нужно вызывать только в IDLE режиме датчика, если значение не кэшировано!
+        The method should be called only in IDLE sensor mode if the value is not cached!"""
+        return self._read_config(CMD_GET_ALTITUDE)
 
     def set_ambient_pressure(self, pressure: float):
         """Метод может быть вызван во время периодических измерений, чтобы включить непрерывную компенсацию давления.
@@ -216,31 +749,23 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         Note that setting the ambient pressure using set_ambient_pressure overrides any pressure compensation based
         on the previously set sensor height. The use of this command is highly recommended for applications with
         significant changes in ambient pressure to ensure sensor accuracy."""
-        cmd = 0xE000
-        press_raw = self._to_bytes(int(pressure // 100), 2)     # Pascal // 100
-        self._send_command(cmd, press_raw, 1)
+        self._send_command(CMD_SET_PRESSURE, int(pressure // 100))     # Pascal // 100
 
     # Field calibration
     def force_recalibration(self, target_co2_concentration: int) -> int:
         """Please read '3.7.1 perform_forced_recalibration'. target_co2_concentration [ppm CO2]"""
         base_sensor.check_value(target_co2_concentration, range(2**16),
                                 f"Invalid target CO2 concentration: {target_co2_concentration} ppm")
-        cmd = 0x362F
-        target_raw = self._to_bytes(target_co2_concentration, 2)
-        b = self._send_command(cmd, target_raw, 400, 3, crc_index=range(2, 3), value_index=(range(2),))
-        return self._connection.unpack("h", b)[0]
+        return self._read_word(CMD_FORCED_RECALIBRATION, target_co2_concentration)
 
     def is_auto_calibration(self) -> bool:
         """Please read '3.7.3 get_automatic_self_calibration_enabled'"""
-        cmd = 0x2313
-        b = self._send_command(cmd, None, 1, 3, crc_index=range(2, 3), value_index=(range(2),))
-        return 0 != self._connection.unpack("H", b)[0]
+        return 0 != self._read_config(CMD_GET_ASC)
 
     def set_auto_calibration(self, value: bool):
         """Please read '3.7.2 set_automatic_self_calibration_enabled'"""
-        cmd = 0x2416
-        value_raw = self._to_bytes(int(value), length=2)
-        self._send_command(cmd, value_raw, wait_time=1)
+        self._send_command(CMD_SET_ASC, int(value))
+        self._put_cached(CMD_GET_ASC, int(value), written=True)
 
     def start_measurement(self, start: bool, single_shot: bool = False, rht_only: bool = False):
         """Используется для запуска или остановки периодических измерений.
@@ -264,36 +789,37 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         If start == True then measurement started, else stopped.
         Для чтения результатов используйте метод get_meas_data.
         To read the results, use the get_meas_data method."""
-        wt = 0
-        if start:
-            cmd = 0x21AC if self._low_power_mode else 0x21B1
-        else:   # stop periodic measurement
-            cmd = 0x3F86
-            wt = 500
-        self._send_command(cmd, None, wt)
-        self._continuous_mode = start
-        self._single_shot_mode = False
-        self._rht_only = False
+        self._send_command(self._get_periodic_cmd_id(start))
+        self._set_mode(continuous=start, single_shot=False, rht_only=False)
 
-    def get_measurement_value(self, value_index: int = 0) -> [None, measured_values_scd4x]:
+    def get_measurement_value(self, value_index: int = 0) -> [None, measured_values_scd4x, measured_raw_scd4x]:
         """Чтение выходных данных датчика. Данные измерения могут быть считаны только один раз за интервал
         обновления сигнала, так как буфер очищается при считывании. Смотри get_conversion_cycle_time()!
+        Формат результата задается полем output_format.
         Read sensor data output. The measurement data can only be read out once per signal update interval
-        as the buffer is emptied upon read-out. See get_conversion_cycle_time()!"""
-        cmd = 0xEC05
-        val_index = (range(2), range(3, 5), range(6, 8))
-        b = self._send_command(cmd, None, 1, bytes_for_read=9,
-                               crc_index=range(2, 9, 3), value_index=val_index)
-        words = [self._connection.unpack("H", b[val_rng.start:val_rng.stop])[0] for val_rng in val_index]
-        #       CO2 [ppm]           T, Celsius              Relative Humidity, %
-        return measured_values_scd4x(CO2=words[0], T=-45 + 0.0026703288 * words[1], RH=0.0015259022 * words[2])
+        as the buffer is emptied upon read-out. See get_conversion_cycle_time()!
+        The result format is set by the output_format field."""
+        return self._decode_measurement(self._send_command(CMD_READ_MEASUREMENT))
+
+    def read_measurement_into(self, out):
+        """Считывает измерение и записывает сырые слова CO2, T, RH в out[0], out[1], out[2] (например,
+        array('H', (0, 0, 0)), созданный один раз). Измерение добавляется в history. В установившемся режиме память
+        не выделяется, в отличие от get_measurement_value, создающего объект результата! Для преобразования
+        используйте temperature_centi и humidity_centi. Возвращает out.
+        Reads a measurement and writes the raw CO2, T, RH words to out[0], out[1], out[2] (for example,
+        array('H', (0, 0, 0)) created once). The measurement is added to history. In steady state, no memory is
+        allocated, unlike get_measurement_value, which creates a result object! For conversion, use temperature_centi
+        and humidity_centi. Returns out."""
+        b = self._send_command(CMD_READ_MEASUREMENT)
+        self._store_measurement(b)
+        out[0] = (b[0] << 8) | b[1]
+        out[1] = (b[3] << 8) | b[4]
+        out[2] = (b[6] << 8) | b[7]
+        return out
 
     def get_data_status(self) -> bool:
         """Return data ready status. Возвращает Истина, когда данные готовы для считывания."""
-        cmd = 0xE4B8
-        b = self._send_command(cmd, None, 1, 3, crc_index=range(2, 3), value_index=(range(2),))
-        result = 0 != (self._connection.unpack(fmt_char="H", source=b)[0] & 0x7FF)
-        return result
+        return 0 != (self._read_word(CMD_GET_DATA_STATUS) & 0x7FF)
 
     @micropython.native
     def get_conversion_cycle_time(self) -> int:
@@ -301,6 +827,8 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         returns the data conversion time of the sensor, depending on its settings. ms."""
         if self.is_single_shot_mode() and self.is_rht_only():
             return 50
+        if self.is_continuously_mode() and self._low_power_mode:
+            return 30_000
         return 5000
 
     # SCD41 only
@@ -308,9 +836,11 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         """Please read '3.10.3 power_down' and '3.10.4 wake_up'"""
         if not self._isSCD41:
             return
-        cmd = 0x36F6 if value else 0x36E0
-        wt = 20 if value else 1
-        self._send_command(cmd, None, wt)
+        if value:
+            # датчик просыпается, даже не подтвердив команду. the sensor wakes up even without acknowledging
+            self._powered_down = False
+        self._send_command(CMD_WAKE_UP if value else CMD_POWER_DOWN)
+        self._powered_down = not value
 
     def _single_shot_meas(self, rht_only: bool = False):
         """Only for SCD41. Single shot measurement!
@@ -323,11 +853,8 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         Please see '3.10 Low power single shot (SCD41)'"""
         if not self._isSCD41:
             return
-        cmd = 0x2196 if rht_only else 0x219D
-        self._send_command(cmd, None, 0)
-        self._continuous_mode = False
-        self._single_shot_mode = True
-        self._rht_only = rht_only
+        self._send_command(CMD_SINGLE_SHOT_RHT if rht_only else CMD_SINGLE_SHOT)
+        self._set_mode(continuous=False, single_shot=True, rht_only=rht_only)
 
     def is_single_shot_mode(self) -> bool:
         """Возвращает Истина, если установлен режим однократных измерений."""
@@ -337,17 +864,154 @@ class SCD4xSensirion(IBaseSensorEx, Iterator):
         """Возвращает Истина, если установлен режим автоматических периодических измерений."""
         return self._continuous_mode and not self.is_single_shot_mode()
 
+    def set_low_power_mode(self, value: bool):
+        """Выбирает экономичный (период 30 с) или обычный (период 5 с) режим периодических измерений. Действует при
+        следующем запуске периодических измерений (start_measurement)!
+        Selects the low power (30 s period) or normal (5 s period) periodic measurement mode. Takes effect on the next
+        start of periodic measurements (start_measurement)!"""
+        self._low_power_mode = value
+
+    def is_low_power_mode(self) -> bool:
+        """Возвращает Истина, если выбран экономичный режим периодических измерений.
+        Returns True if the low power periodic measurement mode is selected."""
+        return self._low_power_mode
+
     def is_rht_only(self) -> bool:
         """Возвращает Истина, если установлен режим измерения только относительной влажности и температуры."""
         return self._rht_only
 
+    def transaction(self, verify: bool = False, persist: bool = False):
+        """Возвращает пакетную транзакцию настроек (смотри ConfigTransaction). Пример:
+        Returns a batched settings transaction (see ConfigTransaction). Example:
+        with sensor.transaction(persist=True) as tr:
+            tr.set_altitude(160)
+            tr.set_temperature_offset(4.5)"""
+        return ConfigTransaction(self, verify, persist)
+
     # Iterator
     def __iter__(self):
         return self
 
-    def __next__(self) -> [None, measured_values_scd4x]:
+    def __next__(self) -> [None, measured_values_scd4x, measured_raw_scd4x]:
         if self.is_single_shot_mode():
             return None
         if self.is_continuously_mode() and self.get_data_status():
             return self.get_measurement_value(0)
         return None
+
+
+class ConfigTransaction:
+    """Пакетное изменение настроек датчика. Сеттеры транзакции только ставят изменения в очередь. При выходе из блока
+    with (или при вызове commit) периодические измерения останавливаются один раз, все изменения применяются,
+    при необходимости проверяются чтением, сохраняются в EEPROM не более одного раза, после чего предыдущий режим
+    измерения (периодический, экономичный, незавершенное однократное) восстанавливается, даже при исключении!
+    Изменения, совпадающие с кэшем настроек датчика, пропускаются. Если изменять нечего, то измерения не прерываются.
+    Если блок with завершился исключением, то очередь отбрасывается, а датчик не затрагивается.
+    Batched change of sensor settings. The transaction setters only queue changes. On exiting the with block
+    (or on calling commit), periodic measurements are stopped once, all changes are applied, optionally verified
+    by reading, saved to EEPROM at most once, and then the previous measurement mode (periodic, low power,
+    unfinished single shot) is restored, even on an exception!
+    Changes that match the sensor settings cache are skipped. If there is nothing to change, measurements are not
+    interrupted. If the with block ends with an exception, the queue is discarded and the sensor is not touched."""
+
+    def __init__(self, sensor: SCD4xSensirion, verify: bool = False, persist: bool = False):
+        """verify - если Истина, то примененные настройки читаются из датчика и сравниваются с записанными.
+        persist - если Истина, то настройки сохраняются в EEPROM (только если они изменены, смотри save_config).
+        verify - if True, the applied settings are read from the sensor and compared with the written ones.
+        persist - if True, the settings are saved to EEPROM (only if they are changed, see save_config)."""
+        self._sensor = sensor
+        self.verify = verify
+        self.persist = persist
+        # очередь: сырое слово по идентификатору команды записи. queue: raw word by write command ID
+        self._queue = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._queue.clear()
+        return False
+
+    def set_temperature_offset(self, offset: float):
+        """Смотри SCD4xSensirion.set_temperature_offset. See SCD4xSensirion.set_temperature_offset."""
+        self._queue[CMD_SET_T_OFFSET] = _check_word(t_offset_to_raw(offset))
+
+    def set_altitude(self, masl: int):
+        """Смотри SCD4xSensirion.set_altitude. See SCD4xSensirion.set_altitude."""
+        self._queue[CMD_SET_ALTITUDE] = _check_word(masl)
+
+    def set_auto_calibration(self, value: bool):
+        """Смотри SCD4xSensirion.set_auto_calibration. See SCD4xSensirion.set_auto_calibration."""
+        self._queue[CMD_SET_ASC] = int(value)
+
+    @staticmethod
+    def _get_read_cmd_id(cmd_id: int) -> int:
+        """Идентификатор команды чтения настройки по идентификатору команды записи.
+        Setting read command ID by write command ID."""
+        if CMD_SET_T_OFFSET == cmd_id:
+            return CMD_GET_T_OFFSET
+        if CMD_SET_ALTITUDE == cmd_id:
+            return CMD_GET_ALTITUDE
+        return CMD_GET_ASC
+
+    def _get_changes(self) -> list:
+        """Возвращает изменения, не совпадающие с кэшем, как список (write_cmd_id, read_cmd_id, raw).
+        Returns the changes that do not match the cache, as a list of (write_cmd_id, read_cmd_id, raw)."""
+        sen = self._sensor
+        changes = []
+        for cmd_id, raw in self._queue.items():
+            read_id = self._get_read_cmd_id(cmd_id)
+            if sen._get_cached(read_id) != raw:
+                changes.append((cmd_id, read_id, raw))
+        return changes
+
+    def commit(self) -> int:
+        """Применяет очередь изменений и очищает ее. Возвращает количество примененных изменений. Вызывается
+        автоматически при выходе из блока with. При ошибке проверки возбуждает ValueError, настройки в EEPROM
+        при этом не сохраняются.
+        Applies the change queue and clears it. Returns the number of applied changes. Called automatically
+        on exiting the with block. Raises ValueError on a verification failure, the settings are not saved
+        to EEPROM in this case."""
+        sen = self._sensor
+        changes = self._get_changes()
+        self._queue.clear()
+        if not changes and not (self.persist and sen.is_config_dirty()):
+            return 0
+        # запоминаю режим измерения. remembering the measurement mode
+        periodic = sen.is_continuously_mode()
+        # однократное измерение перезапускается, только если оно было начато и не прочитано.
+        # the single shot is restarted only if it was started and not read.
+        shot_pending = sen.is_single_shot_mode() and sen._shot_pending
+        rht_only = sen.is_rht_only()
+        # используются синхронные примитивы, поэтому транзакция работает и с асинхронным драйвером (блокируя его).
+        # synchronous primitives are used, so the transaction also works with the asynchronous driver (blocking it).
+        if periodic:
+            sen._send_command(CMD_STOP_PERIODIC)
+            sen._set_mode(continuous=False, single_shot=False, rht_only=False)
+        try:
+            for cmd_id, read_id, raw in changes:
+                sen._send_command(cmd_id, raw)
+                sen._put_cached(read_id, raw, written=True)
+            if self.verify:
+                for cmd_id, read_id, raw in changes:
+                    value = sen._read_word(read_id)
+                    if value != raw:
+                        raise ValueError(f"Verification failed! Command: {_commands[cmd_id].code}. "
+                                         f"Written: {raw}. Read: {value}")
+            if self.persist and sen.is_config_dirty():
+                sen._send_command(CMD_SAVE_CONFIG)
+                sen._config_saved()
+        finally:
+            # восстановление режима измерения. restoring the measurement mode
+            if periodic:
+                sen._send_command(sen._get_periodic_cmd_id(start=True))
+                sen._set_mode(continuous=True, single_shot=False, rht_only=False)
+            elif shot_pending:
+                # начатое однократное измерение могло быть потеряно, запускаю новое
+                # the started single shot measurement could be lost, starting a new one
+                sen._send_command(CMD_SINGLE_SHOT_RHT if rht_only else CMD_SINGLE_SHOT)
+                sen._set_mode(continuous=False, single_shot=True, rht_only=rht_only)
+        return len(changes)
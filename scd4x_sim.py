@@ -0,0 +1,341 @@
+"""SCD4x Sensirion simulator module.
+Имитатор датчика SCD4x в виде адаптера шины: драйвер работает с ним так же, как с настоящим датчиком на шине I2C.
+Позволяет проверять драйвер и измерять пропускную способность и задержки способов опроса без датчика, в том числе
+на ПК (CPython) с заглушками из каталога host: PYTHONPATH=host:. python3 ...
+SCD4x sensor simulator as a bus adapter: the driver works with it just as with a real sensor on the I2C bus.
+Allows testing the driver and measuring the throughput and latency of polling strategies without a sensor, including
+on a PC (CPython) with the stubs from the host directory: PYTHONPATH=host:. python3 ..."""
+
+from micropython import const
+from sensor_pack_2.bus_service import BusAdapter
+from sensor_pack_2.crc_mod import crc8_31
+import random
+import time
+
+# режимы датчика. sensor modes
+MODE_IDLE = const(0)
+MODE_PERIODIC = const(1)
+MODE_LOW_POWER = const(2)
+MODE_SLEEP = const(3)
+
+# коды ошибок MicroPython. MicroPython error codes
+# датчик не подтвердил адрес (NACK). the sensor did not acknowledge the address (NACK)
+_ENODEV = const(19)
+# ошибка ввода/вывода шины. bus I/O error
+_EIO = const(5)
+
+# коды команд датчика. sensor command codes
+_START_PERIODIC = const(0x21B1)
+_START_LP_PERIODIC = const(0x21AC)
+_STOP_PERIODIC = const(0x3F86)
+_READ_MEASUREMENT = const(0xEC05)
+_GET_DATA_STATUS = const(0xE4B8)
+_SET_T_OFFSET = const(0x241D)
+_GET_T_OFFSET = const(0x2318)
+_SET_ALTITUDE = const(0x2427)
+_GET_ALTITUDE = const(0x2322)
+_AMBIENT_PRESSURE = const(0xE000)
+_FORCED_RECALIBRATION = const(0x362F)
+_SET_ASC = const(0x2416)
+_GET_ASC = const(0x2313)
+_SAVE_CONFIG = const(0x3615)
+_GET_ID = const(0x3682)
+_SELF_TEST = const(0x3639)
+_FACTORY_RESET = const(0x3632)
+_REINIT = const(0x3646)
+_SINGLE_SHOT = const(0x219D)
+_SINGLE_SHOT_RHT = const(0x2196)
+_POWER_DOWN = const(0x36E0)
+_WAKE_UP = const(0x36F6)
+
+# время выполнения команд по документации, мс. Не указанные (1 мс) укладываются во время обмена по шине.
+# command execution times from the datasheet, ms. Not listed ones (1 ms) fit into the bus transfer time.
+_exec_ms = {_STOP_PERIODIC: 500, _SAVE_CONFIG: 800, _SELF_TEST: 10_000, _FACTORY_RESET: 1200, _REINIT: 20,
+            _FORCED_RECALIBRATION: 400, _WAKE_UP: 20}
+
+# команды, допустимые во время периодических измерений. commands valid during periodic measurements
+_periodic_cmds = (_READ_MEASUREMENT, _GET_DATA_STATUS, _AMBIENT_PRESSURE, _STOP_PERIODIC)
+# команды, допустимые во время однократного измерения. commands valid during a single shot
+_shot_cmds = (_READ_MEASUREMENT, _GET_DATA_STATUS)
+# команды только SCD41. SCD41 only commands
+_scd41_cmds = (_SINGLE_SHOT, _SINGLE_SHOT_RHT, _POWER_DOWN, _WAKE_UP)
+
+# настройки по умолчанию: смещение температуры (4 °C), высота, давление (гПа), ASC.
+# default settings: temperature offset (4 °C), altitude, pressure (hPa), ASC.
+_default_config = (1498, 0, 1013, 1)
+
+
+def _frame(words) -> bytes:
+    """Ответ датчика: каждое слово и его CRC. Sensor response: each word and its CRC."""
+    out = bytearray(3 * len(words))
+    for i, word in enumerate(words):
+        j = 3 * i
+        out[j] = (word >> 8) & 0xFF
+        out[j + 1] = word & 0xFF
+        out[j + 2] = crc8_31(out, j, j + 2)
+    return bytes(out)
+
+
+class SCD4xSimulator(BusAdapter):
+    """Адаптер шины, имитирующий SCD4x: режимы IDLE, периодических и экономичных периодических измерений,
+    однократных измерений и сна (power_down), флаг готовности данных и буфер измерения, очищаемый чтением,
+    ответы с CRC, NACK на команды, недопустимые в текущем режиме, и на команды во время выполнения предыдущей,
+    настройки и их сохранение в EEPROM. Время берется из time.ticks_ms, поэтому на ПК удобно использовать
+    виртуальные часы (host_time.use_virtual_clock).
+    Отказы: crc_error_rate, eio_rate - вероятности искажения CRC ответа и ошибки ввода/вывода на обмен;
+    fail_next - детерминированные отказы следующих обменов.
+    A bus adapter simulating SCD4x: IDLE, periodic and low power periodic measurement, single shot and sleep
+    (power_down) modes, the data ready flag and the measurement buffer emptied on read, responses with CRC, NACK on
+    commands not valid in the current mode and on commands while the previous one is executing, settings and saving
+    them to EEPROM. The time is taken from time.ticks_ms, so on a PC it is convenient to use the virtual clock
+    (host_time.use_virtual_clock).
+    Faults: crc_error_rate, eio_rate - probabilities of a corrupted response CRC and of an I/O error per transfer;
+    fail_next - deterministic faults of the next transfers."""
+
+    def __init__(self, address: int = 0x62, scd41: bool = True, period_ms: int = 5000, lp_period_ms: int = 30_000,
+                 shot_ms: int = 5000, rht_shot_ms: int = 50, bus_freq: int = 400_000,
+                 serial: tuple = (0x1234, 0x5678, 0x9ABC), environment=None, seed: int = None):
+        """period_ms, lp_period_ms - периоды обновления данных в периодическом и экономичном режимах, мс (у настоящих
+        датчиков они отличаются от номинальных на несколько процентов).
+        shot_ms, rht_shot_ms - время однократного измерения и однократного измерения только T и RH, мс.
+        bus_freq - частота шины, Гц, для имитации времени передачи (0 - передача мгновенная).
+        environment - функция без параметров, возвращающая (CO2 ppm, T °C, RH %), иначе используются поля co2,
+        temperature, humidity.
+        seed - начальное значение генератора случайных чисел для отказов.
+        period_ms, lp_period_ms - data update periods in periodic and low power modes, ms (for real sensors they
+        differ from the nominal ones by a few percent).
+        shot_ms, rht_shot_ms - single shot and T and RH only single shot times, ms.
+        bus_freq - bus frequency, Hz, for simulating the transfer time (0 - instant transfer).
+        environment - a function without parameters returning (CO2 ppm, T °C, RH %), otherwise the co2, temperature,
+        humidity fields are used.
+        seed - random number generator seed for faults."""
+        super().__init__(None)
+        self.address = address
+        self.scd41 = scd41
+        self.period_ms = period_ms
+        self.lp_period_ms = lp_period_ms
+        self.shot_ms = shot_ms
+        self.rht_shot_ms = rht_shot_ms
+        self.bus_freq = bus_freq
+        self.serial = serial
+        self.environment = environment
+        self.co2 = 600
+        self.temperature = 25.0
+        self.humidity = 50.0
+        # отказы. faults
+        self.crc_error_rate = 0.0
+        self.eio_rate = 0.0
+        self._fail_crc = 0
+        self._fail_eio = 0
+        if seed is not None:
+            random.seed(seed)
+        # счетчики. counters
+        self.writes = 0
+        self.reads = 0
+        self.nacks = 0
+        self.injected_crc = 0
+        self.injected_eio = 0
+        self.eeprom_writes = 0
+        self.measurements = 0
+        self._eeprom = list(_default_config)
+        self.power_on()
+
+    def power_on(self):
+        """Включение питания: IDLE, настройки из EEPROM. Power on: IDLE, settings from EEPROM."""
+        self._config = list(self._eeprom)
+        self.mode = MODE_IDLE
+        now = time.ticks_ms()
+        self._busy_until = now
+        self._busy_cmds = ()
+        self._next_data = now
+        # однократное измерение: момент готовности или None, только T и RH. single shot: ready moment or None, T and RH
+        # only
+        self._shot_at = None
+        self._shot_rht = False
+        # буфер измерения (3 слова) или None. measurement buffer (3 words) or None
+        self._data = None
+        self._response = None
+        self._response_at = now
+
+    def fail_next(self, crc: int = 0, eio: int = 0):
+        """Следующие crc ответов придут с неверным CRC, следующие eio обменов завершатся ошибкой ввода/вывода.
+        The next crc responses will come with a wrong CRC, the next eio transfers will fail with an I/O error."""
+        self._fail_crc += crc
+        self._fail_eio += eio
+
+    def is_data_ready(self) -> bool:
+        self._update(time.ticks_ms())
+        return self._data is not None
+
+    # модель датчика. sensor model
+    def _measure(self, rht_only: bool) -> tuple:
+        """Новое измерение в словах датчика. A new measurement in sensor words."""
+        env = self.environment
+        co2, t, rh = (self.co2, self.temperature, self.humidity) if env is None else env()
+        # смещение температуры уменьшает показания относительно смещения по умолчанию
+        # the temperature offset decreases the readings relative to the default offset
+        t += 175 * (_default_config[0] - self._config[0]) / 65535
+        t_word = int((t + 45) * 65535 / 175 + 0.5)
+        rh_word = int(rh * 65535 / 100 + 0.5)
+        self.measurements += 1
+        return (0 if rht_only else int(co2) & 0xFFFF, min(max(t_word, 0), 0xFFFF), min(max(rh_word, 0), 0xFFFF))
+
+    def _update(self, now: int):
+        """Продвигает состояние датчика до момента now. Advances the sensor state to the moment now."""
+        if MODE_PERIODIC == self.mode or MODE_LOW_POWER == self.mode:
+            if time.ticks_diff(now, self._next_data) >= 0:
+                period = self.period_ms if MODE_PERIODIC == self.mode else self.lp_period_ms
+                # непрочитанные данные заменяются новыми. unread data is replaced by new data
+                while time.ticks_diff(now, self._next_data) >= 0:
+                    self._next_data = time.ticks_add(self._next_data, period)
+                self._data = self._measure(False)
+        if self._shot_at is not None and time.ticks_diff(now, self._shot_at) >= 0:
+            self._shot_at = None
+            self._data = self._measure(self._shot_rht)
+
+    def _nack(self):
+        self.nacks += 1
+        raise OSError(_ENODEV)
+
+    def _transfer(self, device_addr, n_bytes: int):
+        """Общая часть обменов: адрес, отказ ввода/вывода, время передачи.
+        Common part of transfers: address, I/O fault, transfer time."""
+        if device_addr != self.address:
+            self._nack()
+        if self._fail_eio or (self.eio_rate and random.random() < self.eio_rate):
+            if self._fail_eio:
+                self._fail_eio -= 1
+            self.injected_eio += 1
+            raise OSError(_EIO)
+        if self.bus_freq:
+            # адрес и данные, 9 бит на байт. address and data, 9 bits per byte
+            time.sleep_us(9 * (n_bytes + 1) * 1_000_000 // self.bus_freq)
+
+    def _execute(self, now: int, code: int, param: [int, None]) -> [tuple, None]:
+        """Выполняет команду. Возвращает слова ответа или None. Executes the command. Returns the response words or None."""
+        cfg = self._config
+        if _START_PERIODIC == code or _START_LP_PERIODIC == code:
+            self.mode = MODE_PERIODIC if _START_PERIODIC == code else MODE_LOW_POWER
+            period = self.period_ms if MODE_PERIODIC == self.mode else self.lp_period_ms
+            self._next_data = time.ticks_add(now, period)
+            return None
+        if _STOP_PERIODIC == code:
+            self.mode = MODE_IDLE
+            return None
+        if _READ_MEASUREMENT == code:
+            data = self._data
+            if data is None:
+                return None     # нет данных: NACK при чтении. no data: NACK on read
+            self._data = None
+            return data
+        if _GET_DATA_STATUS == code:
+            return (0x8006 if self._data is not None else 0x8000),
+        if _AMBIENT_PRESSURE == code:
+            if param is None:
+                return cfg[2],
+            cfg[2] = param
+            return None
+        if _SET_T_OFFSET == code:
+            cfg[0] = param
+            return None
+        if _GET_T_OFFSET == code:
+            return cfg[0],
+        if _SET_ALTITUDE == code:
+            cfg[1] = param
+            return None
+        if _GET_ALTITUDE == code:
+            return cfg[1],
+        if _SET_ASC == code:
+            cfg[3] = param
+            return None
+        if _GET_ASC == code:
+            return cfg[3],
+        if _FORCED_RECALIBRATION == code:
+            # поправка + 0x8000. correction + 0x8000
+            return (0x8000 + param - self._measure(False)[0]) & 0xFFFF,
+        if _SAVE_CONFIG == code:
+            self._eeprom = list(cfg)
+            self.eeprom_writes += 1
+            return None
+        if _GET_ID == code:
+            return self.serial
+        if _SELF_TEST == code:
+            return 0,
+        if _FACTORY_RESET == code:
+            self._eeprom = list(_default_config)
+            self._config = list(_default_config)
+            self.eeprom_writes += 1
+            return None
+        if _REINIT == code:
+            self._config = list(self._eeprom)
+            return None
+        if _SINGLE_SHOT == code or _SINGLE_SHOT_RHT == code:
+            self._shot_rht = _SINGLE_SHOT_RHT == code
+            shot = self.rht_shot_ms if self._shot_rht else self.shot_ms
+            self._shot_at = time.ticks_add(now, shot)
+            self._busy_until = self._shot_at
+            self._busy_cmds = _shot_cmds
+            return None
+        if _POWER_DOWN == code:
+            self.mode = MODE_SLEEP
+            self._data = None
+            self._shot_at = None
+            return None
+        self._nack()    # неизвестная команда. unknown command
+
+    # BusAdapter
+    def write(self, device_addr, buf: bytes):
+        self._transfer(device_addr, len(buf))
+        self.writes += 1
+        now = time.ticks_ms()
+        self._update(now)
+        self._response = None
+        code = (buf[0] << 8) | buf[1]
+        if MODE_SLEEP == self.mode:
+            if _WAKE_UP == code and self.scd41:
+                # датчик просыпается, но команду не подтверждает. the sensor wakes up but does not acknowledge
+                self.mode = MODE_IDLE
+                self._busy_cmds = ()
+                self._busy_until = time.ticks_add(now, _exec_ms[_WAKE_UP])
+            self._nack()
+        if time.ticks_diff(self._busy_until, now) > 0 and code not in self._busy_cmds:
+            self._nack()
+        if (MODE_PERIODIC == self.mode or MODE_LOW_POWER == self.mode) and code not in _periodic_cmds:
+            self._nack()
+        if code in _scd41_cmds and not self.scd41:
+            self._nack()
+        param = None
+        if len(buf) >= 5:
+            if crc8_31(buf, 2, 4) != buf[4]:
+                self._nack()    # неверный CRC параметра. wrong parameter CRC
+            param = (buf[2] << 8) | buf[3]
+        words = self._execute(now, code, param)
+        wait = _exec_ms.get(code, 0)
+        if _SINGLE_SHOT != code and _SINGLE_SHOT_RHT != code:
+            self._busy_until = time.ticks_add(now, wait)
+            self._busy_cmds = ()
+        if words is not None:
+            self._response = _frame(words)
+            self._response_at = time.ticks_add(now, wait)
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        self._transfer(device_addr, len(buf))
+        self.reads += 1
+        response = self._response
+        # ответа нет или команда еще выполняется. no response or the command is still executing
+        if response is None or time.ticks_diff(time.ticks_ms(), self._response_at) < 0:
+            self._nack()
+        self._response = None
+        n = len(buf)
+        buf[:n] = response[:n]
+        if self._fail_crc or (self.crc_error_rate and random.random() < self.crc_error_rate):
+            if self._fail_crc:
+                self._fail_crc -= 1
+            self.injected_crc += 1
+            buf[2] ^= 0x01      # CRC первого слова. CRC of the first word
+        return buf
+
+    def read(self, device_addr, n_bytes: int) -> bytes:
+        buf = bytearray(n_bytes)
+        self.read_to_buf(device_addr, buf)
+        return bytes(buf)
@@ -0,0 +1,188 @@
+"""SCD4x Sensirion split-phase module.
+Двухфазное (выдача/завершение) выполнение команд датчика для кооперативного цикла без sleep_ms.
+Split-phase (issue/complete) execution of sensor commands for a cooperative loop without sleep_ms."""
+
+from scd4x_sensirion import SCD4xSensirion, command_scd4x, CMD_GET_ID, CMD_READ_MEASUREMENT, CMD_GET_DATA_STATUS, \
+    CMD_SINGLE_SHOT_RHT, CMD_SINGLE_SHOT, _commands
+import micropython
+import time
+
+
+class PendingCommand:
+    """Ожидающая завершения команда датчика. Хранит дескриптор команды и крайний срок (ticks_ms), после которого
+    ответ датчика можно считывать. Экземпляр принадлежит SplitPhaseSCD4x и используется повторно!
+    A sensor command pending completion. Stores the command descriptor and the deadline (ticks_ms) after which
+    the sensor response can be read. The instance belongs to SplitPhaseSCD4x and is reused!"""
+
+    def __init__(self, sensor: SCD4xSensirion):
+        self._sensor = sensor
+        self.cmd_id = -1
+        self.value = None
+        self.desc = None
+        # номер попытки и признак повторной выдачи команды после паузы (смотри SCD4xSensirion.retry_policy).
+        # attempt number and the flag of re-sending the command after a pause (see SCD4xSensirion.retry_policy).
+        self.attempt = 1
+        self._rewrite = False
+        self.deadline = 0
+        # Истина, пока команда не завершена. True until the command is completed
+        self.active = False
+        # результат команды после завершения. command result after completion
+        self.result = None
+        # режим измерения (continuous, single_shot, rht_only), запоминаемый драйвером после выдачи команды, или None.
+        # measurement mode (continuous, single_shot, rht_only) stored by the driver after the command is sent, or None.
+        self._mode = None
+
+    def _start(self, cmd_id: int, value: [int, bytes, None], mode: [tuple, None] = None):
+        self.cmd_id = cmd_id
+        self.value = value
+        self._mode = mode
+        self.desc = None
+        self.result = None
+        self.attempt = 1
+        self._rewrite = False
+        self.active = False
+
+    def _written(self, desc: command_scd4x):
+        """Команда выдана на шину (датчик ее подтвердил). The command has been sent to the bus (the sensor has
+        acknowledged it)."""
+        self.desc = desc
+        mode = self._mode
+        if mode is not None:
+            self._sensor._set_mode(*mode)
+            self._mode = None
+        self._rewrite = False
+        self.deadline = time.ticks_add(time.ticks_ms(), desc.wait_time)
+        # команда без ожидания и без ответа завершается сразу. a command without waiting and response completes at once
+        self.active = bool(desc.wait_time or desc.read_len)
+
+    def _retry(self, exc: Exception) -> bool:
+        """Планирует повторную выдачу команды после паузы политики повторов, не ожидая. Повторно возбуждает exc,
+        если повтор невозможен или небезопасен.
+        Schedules re-sending the command after the retry policy pause, without waiting. Re-raises exc
+        if a retry is impossible or unsafe."""
+        self.active = False
+        delay = self._sensor._get_retry_delay(self.cmd_id, self.attempt, exc)
+        self.attempt += 1
+        self._rewrite = True
+        self.deadline = time.ticks_add(time.ticks_ms(), delay)
+        self.active = True
+        return False
+
+    @micropython.native
+    def remaining(self) -> int:
+        """Возвращает время в мс до крайнего срока, 0 если срок наступил.
+        Returns the time in ms until the deadline, 0 if the deadline has come."""
+        if not self.active:
+            return 0
+        diff = time.ticks_diff(self.deadline, time.ticks_ms())
+        return diff if diff > 0 else 0
+
+    def try_complete(self) -> bool:
+        """Никогда не ждет! Если крайний срок наступил, считывает и разбирает ответ датчика (если он есть) в result
+        и возвращает Истина. Иначе возвращает Ложь.
+        Never waits! If the deadline has come, reads and parses the sensor response (if any) into result
+        and returns True. Otherwise, returns False.
+        При ошибке, допускающей повтор, команда выдается заново после паузы, а метод возвращает Ложь.
+        On an error that allows a retry, the command is sent again after a pause, and the method returns False."""
+        if not self.active:
+            return True
+        if time.ticks_diff(time.ticks_ms(), self.deadline) < 0:
+            return False
+        sen = self._sensor
+        cmd_id = self.cmd_id
+        if self._rewrite:
+            try:
+                self._written(sen._write_command(cmd_id, self.value))
+            except OSError as e:
+                return self._retry(e)
+            if self.desc.wait_time:
+                return False
+        # команда завершается даже при ошибке чтения/CRC, иначе датчик останется "занятым" навсегда
+        # the command is completed even on a read/CRC error, otherwise the sensor would remain "busy" forever
+        self.active = False
+        try:
+            b = sen._read_response(self.desc)
+        except (OSError, ValueError) as e:
+            return self._retry(e)
+        if b is None:
+            return True
+        if CMD_READ_MEASUREMENT == cmd_id:
+            self.result = sen._decode_measurement(b)
+        elif CMD_GET_DATA_STATUS == cmd_id:
+            self.result = 0 != (sen._decode_word(cmd_id, b) & 0x7FF)
+        elif CMD_GET_ID == cmd_id:
+            self.result = sen._decode_id(b)
+        else:
+            self.result = sen._decode_word(cmd_id, b)
+        return True
+
+    # короткое имя для опроса в цикле. short name for polling in a loop
+    poll = try_complete
+
+
+class SplitPhaseSCD4x:
+    """Выполнение команд SCD4xSensirion в две фазы. Метод issue выдает команду на шину немедленно и возвращает
+    PendingCommand с крайним сроком. Завершение - PendingCommand.try_complete(), который никогда не ждет.
+    Один главный цикл может обслуживать несколько датчиков и другие устройства, не вызывая sleep_ms.
+    Execution of SCD4xSensirion commands in two phases. The issue method sends a command to the bus immediately
+    and returns a PendingCommand with a deadline. Completion - PendingCommand.try_complete(), which never waits.
+    One super-loop can serve several sensors and other peripherals without calling sleep_ms."""
+
+    def __init__(self, sensor: SCD4xSensirion):
+        self.sensor = sensor
+        self._pending = PendingCommand(sensor)
+
+    @property
+    def pending(self) -> PendingCommand:
+        return self._pending
+
+    def is_busy(self) -> bool:
+        """Возвращает Истина, если предыдущая команда еще не завершена.
+        Returns True if the previous command is not yet completed."""
+        return self._pending.active
+
+    def issue(self, cmd_id: int, value: [int, bytes, None] = None) -> PendingCommand:
+        """Выдает команду cmd_id (смотри CMD_* в scd4x_sensirion) на шину и возвращает ожидающую команду.
+        Датчик выполняет одну команду за раз, поэтому предыдущая команда должна быть завершена!
+        Sends the cmd_id command (see CMD_* in scd4x_sensirion) to the bus and returns the pending command.
+        The sensor executes one command at a time, so the previous command must be completed!"""
+        return self._issue(cmd_id, value)
+
+    def _issue(self, cmd_id: int, value: [int, bytes, None] = None, mode: [tuple, None] = None) -> PendingCommand:
+        """issue с режимом измерения mode, который запоминается только после успешной выдачи команды.
+        issue with the mode measurement mode, which is stored only after the command is successfully sent."""
+        pending = self._pending
+        if pending.active:
+            raise ValueError(f"Previous command is not completed! Command ID: {pending.cmd_id}")
+        # неверный аргумент - ValueError сразу, без повторов. an invalid argument is a ValueError at once, no retries
+        self.sensor._get_tx_buf(_commands[cmd_id], value)
+        pending._start(cmd_id, value, mode)
+        try:
+            desc = self.sensor._write_command(cmd_id, value)
+        except OSError as e:
+            # повтор без ожидания, или исключение, если повтор невозможен. retry without waiting, or an exception
+            # if a retry is impossible
+            pending._retry(e)
+            return pending
+        pending._written(desc)
+        return pending
+
+    def start_measurement(self, start: bool, single_shot: bool = False, rht_only: bool = False) -> PendingCommand:
+        """Аналог SCD4xSensirion.start_measurement. Режим измерения запоминается, когда датчик подтвердил команду,
+        в том числе при ее повторной выдаче из try_complete.
+        Analogue of SCD4xSensirion.start_measurement. The measurement mode is stored when the sensor has acknowledged
+        the command, including when it is re-sent from try_complete."""
+        sen = self.sensor
+        if single_shot:
+            return self._issue(CMD_SINGLE_SHOT_RHT if rht_only else CMD_SINGLE_SHOT, mode=(False, True, rht_only))
+        return self._issue(sen._get_periodic_cmd_id(start), mode=(start, False, False))
+
+    def read_measurement(self) -> PendingCommand:
+        """Выдает команду чтения измерения. result - как у get_measurement_value.
+        Issues the read measurement command. result - as in get_measurement_value."""
+        return self.issue(CMD_READ_MEASUREMENT)
+
+    def data_status(self) -> PendingCommand:
+        """Выдает команду чтения готовности данных. result - bool.
+        Issues the data ready status command. result - bool."""
+        return self.issue(CMD_GET_DATA_STATUS)
@@ -57,6 +57,8 @@ class Device:
         # передавать первым битом старший или младший
         # для каждого устройства!
         self.msb_first = True
+        # кэш подготовленных форматов struct. cache of prepared struct formats
+        self._codecs = dict()
 
     def _get_byteorder_as_str(self) -> tuple:
         """Return byteorder as string"""
@@ -64,22 +66,49 @@ class Device:
             return 'big', '>'
         return 'little', '<'
 
-    def pack(self, fmt_char: str, *values) -> bytes:
+    def get_codec(self, fmt_char: str, count: int = 1, stride: int = 0, redefine_byte_order: str = None) -> str:
+        """Возвращает подготовленный формат struct для count значений fmt_char, начала которых отстоят друг от друга
+        на stride байт (промежутки пропускаются байтами заполнения 'x'). Если stride равен 0, значения идут подряд.
+        Формат создается один раз для каждого сочетания параметров и затем берется из кэша!
+        Returns a prepared struct format for count fmt_char values whose starts are stride bytes apart
+        (gaps are skipped with 'x' pad bytes). If stride is 0, the values are contiguous.
+        The format is created once for each combination of parameters and then taken from the cache!"""
         if not fmt_char:
             raise ValueError("Invalid fmt_char parameter!")
         bo = self._get_byteorder_as_str()[1]
-        return struct.pack(bo + fmt_char, values)
+        if redefine_byte_order is not None:
+            bo = redefine_byte_order[0]
+        key = fmt_char, count, stride, bo
+        codec = self._codecs.get(key)
+        if codec is None:
+            gap = 0
+            if stride:
+                gap = stride - struct.calcsize(bo + fmt_char)
+                if gap < 0:
+                    raise ValueError(f"Invalid stride: {stride}")
+            item = fmt_char + "x" * gap
+            codec = bo + item * (count - 1) + fmt_char
+            self._codecs[key] = codec
+        return codec
+
+    def pack(self, fmt_char: str, *values) -> bytes:
+        return struct.pack(self.get_codec(fmt_char), *values)
 
     def unpack(self, fmt_char: str, source: bytes, redefine_byte_order: str = None) -> tuple:
         """распаковка массива, считанного из датчика.
         Если redefine_byte_order != None, то bo (смотри ниже) = redefine_byte_order
         fmt_char: c, b, B, h, H, i, I, l, L, q, Q. pls see: https://docs.python.org/3/library/struct.html"""
-        if not fmt_char:
-            raise ValueError("Invalid fmt_char parameter!")
-        bo = self._get_byteorder_as_str()[1]
-        if redefine_byte_order is not None:
-            bo = redefine_byte_order[0]
-        return struct.unpack(bo + fmt_char, source)
+        return struct.unpack(self.get_codec(fmt_char, redefine_byte_order=redefine_byte_order), source)
+
+    def unpack_from(self, fmt_char: str, source, offset: int = 0, count: int = 1, stride: int = 0,
+                    redefine_byte_order: str = None) -> tuple:
+        """Распаковка count значений из source, начиная со смещения offset, без создания срезов, одним вызовом.
+        Начала значений отстоят друг от друга на stride байт. Например, три слова кадра Sensirion (смещения 0, 3, 6):
+        unpack_from("H", buf, 0, 3, 3).
+        Unpacks count values from source, starting at offset, without slicing, in a single call.
+        The starts of the values are stride bytes apart. For example, three words of a Sensirion frame (offsets 0, 3, 6):
+        unpack_from("H", buf, 0, 3, 3)."""
+        return struct.unpack_from(self.get_codec(fmt_char, count, stride, redefine_byte_order), source, offset)
 
     @micropython.native
     def is_big_byteorder(self) -> bool:
@@ -125,6 +154,13 @@ class DeviceEx(Device):
         """Записывает в устройство информацию из buf. Добавил 25.01.2024"""
         return self.adapter.write(self.address, buf)
 
+    def write_then_read_into(self, out_buf, in_buf, delay_us: int = 0):
+        """Запись out_buf, пауза delay_us мкс и чтение в in_buf одним вызовом адаптера шины.
+        Смотри BusAdapter.write_then_read_into.
+        Writing out_buf, a pause of delay_us microseconds and reading into in_buf with a single bus adapter call.
+        See BusAdapter.write_then_read_into."""
+        return self.adapter.write_then_read_into(self.address, out_buf, in_buf, delay_us)
+
     def read_buf_from_mem(self, address: int, buf, address_size: int = 1):
         """Читает из устройства, начиная с адреса address в буфер.
         Кол-во читаемых байт равно "длине" буфера в байтах!
@@ -0,0 +1,172 @@
+# micropython
+# MIT license
+"""Разделение одной шины между потоками (например, два ядра RP2040 или потоки CPython).
+Sharing one bus between threads (for example, two RP2040 cores or CPython threads)."""
+
+try:
+    import _thread
+except ImportError:
+    # порт без потоков: блокировка не нужна. a port without threads: no locking is needed
+    _thread = None
+import time
+from sensor_pack_2.bus_service import BusAdapter, I2cAdapter
+
+
+def _get_base_adapter(adapter: BusAdapter) -> BusAdapter:
+    """Возвращает адаптер под всеми обертками (адаптерами с полем inner).
+    Returns the adapter under all wrappers (adapters with the inner field)."""
+    inner = getattr(adapter, "inner", None)
+    while inner is not None:
+        adapter = inner
+        inner = getattr(adapter, "inner", None)
+    return adapter
+
+
+class FairLock:
+    """Справедливая (FIFO) повторно входимая блокировка. Ожидающие потоки получают блокировку строго в порядке
+    очереди, владение передается освобождающим потоком напрямую, поэтому ни один поток не может захватывать шину
+    снова и снова, оставляя других голодать. На порте без _thread ничего не делает.
+    A fair (FIFO) reentrant lock. Waiting threads get the lock strictly in queue order, ownership is handed over
+    directly by the releasing thread, so no thread can grab the bus again and again, starving the others.
+    Does nothing on a port without _thread."""
+
+    def __init__(self):
+        self._mutex = None if _thread is None else _thread.allocate_lock()
+        self._owner = None
+        self._depth = 0
+        # очередь ожидающих: (идентификатор потока, блокировка ожидания). waiters queue: (thread ID, wait lock)
+        self._queue = []
+        # количество захватов, которым пришлось ждать. number of acquisitions that had to wait
+        self.contended = 0
+
+    def acquire(self):
+        mutex = self._mutex
+        if mutex is None:
+            return
+        me = _thread.get_ident()
+        mutex.acquire()
+        if self._owner == me:
+            self._depth += 1
+            mutex.release()
+            return
+        if self._owner is None:
+            self._owner = me
+            self._depth = 1
+            mutex.release()
+            return
+        waiter = _thread.allocate_lock()
+        waiter.acquire()
+        self._queue.append((me, waiter))
+        self.contended += 1
+        mutex.release()
+        # освобождающий поток передаст владение и откроет waiter. the releasing thread hands over ownership
+        # and opens waiter
+        waiter.acquire()
+
+    def release(self):
+        mutex = self._mutex
+        if mutex is None:
+            return
+        mutex.acquire()
+        try:
+            if self._owner != _thread.get_ident():
+                raise ValueError("The lock is not owned by the current thread!")
+            self._depth -= 1
+            if self._depth:
+                return
+            if self._queue:
+                ident, waiter = self._queue.pop(0)
+                self._owner = ident
+                self._depth = 1
+                waiter.release()
+            else:
+                self._owner = None
+        finally:
+            mutex.release()
+
+    def locked(self) -> bool:
+        return self._owner is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class LockedAdapter(BusAdapter):
+    """Адаптер-обертка, захватывающий блокировку шины только на время самих обменов. Все драйверы, работающие с
+    шиной из разных потоков, должны использовать один экземпляр LockedAdapter (или одну блокировку lock)!
+    Ожидание обработки команды устройством (например, 10 секунд самотеста SCD4x) выполняется драйвером между
+    write и read_to_buf, то есть без блокировки, и не задерживает другие устройства на шине.
+    Для атомарной последовательности обменов (например, выбор канала мультиплексора и команда) используйте
+    with adapter.lock: ... - блокировка повторно входимая.
+    Wrapper adapter that holds the bus lock only during the transfers themselves. All drivers working with
+    the bus from different threads must use one LockedAdapter instance (or one lock)!
+    Waiting for the device to process a command (for example, 10 seconds of the SCD4x self test) is done by the driver
+    between write and read_to_buf, that is, without the lock, and does not delay other devices on the bus.
+    For an atomic sequence of transfers (for example, multiplexer channel selection and a command), use
+    with adapter.lock: ... - the lock is reentrant."""
+
+    def __init__(self, adapter: BusAdapter, lock: FairLock = None):
+        super().__init__(adapter.bus)
+        self.inner = adapter
+        self.lock = FairLock() if lock is None else lock
+        # Истина, если под оберткой (InstrumentedAdapter, RecordingAdapter и т.д.) шина I2C: пауза write_then_read_into
+        # выполняется без блокировки. True if there is an I2C bus under the wrappers (InstrumentedAdapter,
+        # RecordingAdapter, etc.): the write_then_read_into pause is done without the lock.
+        self._unlocked_delay = isinstance(_get_base_adapter(adapter), I2cAdapter)
+
+    def read_register(self, device_addr, reg_addr: int, bytes_count: int) -> bytes:
+        with self.lock:
+            return self.inner.read_register(device_addr, reg_addr, bytes_count)
+
+    def write_register(self, device_addr, reg_addr: int, value: [int, bytes, bytearray], bytes_count: int,
+                       byte_order: str):
+        with self.lock:
+            return self.inner.write_register(device_addr, reg_addr, value, bytes_count, byte_order)
+
+    def read(self, device_addr, n_bytes: int) -> bytes:
+        with self.lock:
+            return self.inner.read(device_addr, n_bytes)
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        with self.lock:
+            return self.inner.read_to_buf(device_addr, buf)
+
+    def write(self, device_addr, buf: bytes):
+        with self.lock:
+            return self.inner.write(device_addr, buf)
+
+    def write_const(self, device_addr, val: int, count: int):
+        with self.lock:
+            return self.inner.write_const(device_addr, val, count)
+
+    def write_then_read_into(self, device_addr, out_buf, in_buf, delay_us: int = 0):
+        """Без паузы обмен атомарный (повторный старт). С паузой на шине I2C блокировка на время паузы
+        освобождается, так как I2cAdapter все равно освобождает шину (STOP). Это верно и для I2cAdapter в обертках
+        с полем inner.
+        Without a pause, the exchange is atomic (repeated start). With a pause on the I2C bus, the lock is released
+        for the pause time, since I2cAdapter releases the bus (STOP) anyway. This also holds for an I2cAdapter inside
+        wrappers with the inner field."""
+        inner = self.inner
+        if not delay_us or not self._unlocked_delay:
+            with self.lock:
+                return inner.write_then_read_into(device_addr, out_buf, in_buf, delay_us)
+        if isinstance(out_buf, (tuple, list)):
+            out_buf = b"".join(out_buf)
+        with self.lock:
+            inner.write(device_addr, out_buf)
+        time.sleep_us(delay_us)
+        with self.lock:
+            return inner.read_to_buf(device_addr, in_buf)
+
+    def read_buf_from_memory(self, device_addr, mem_addr, buf, address_size: int = 1):
+        with self.lock:
+            return self.inner.read_buf_from_memory(device_addr, mem_addr, buf, address_size)
+
+    def write_buf_to_memory(self, device_addr, mem_addr, buf):
+        with self.lock:
+            return self.inner.write_buf_to_memory(device_addr, mem_addr, buf)
@@ -0,0 +1,262 @@
+# micropython
+# MIT license
+"""Запись обменов по шине в компактный двоичный журнал и их воспроизведение.
+Recording bus transfers into a compact binary log and replaying them."""
+
+from sensor_pack_2.bus_service import BusAdapter
+import struct
+import time
+
+# начало журнала. log start
+_MAGIC = b"BUSR"
+# заголовок записи: вид, адрес, ticks_us, длина данных. record header: kind, address, ticks_us, data length
+_HEADER = ">BBIH"
+_HEADER_LEN = 8
+
+# виды записей. record kinds
+REC_WRITE = 0
+REC_READ = 1
+# флаг: запись - первая половина write_then_read_into. flag: the write is the first half of write_then_read_into
+REC_COMBINED = 0x40
+# флаг: обмен завершился OSError, данные - код ошибки (1 байт). flag: the transfer failed with OSError, data - error
+# code (1 byte)
+REC_ERROR = 0x80
+
+# адрес устройства на шине SPI (вывод MCU) в журнале. device address on the SPI bus (MCU pin) in the log
+_NO_ADDR = 0xFF
+
+
+def _addr_byte(device_addr) -> int:
+    return device_addr & 0x7F if isinstance(device_addr, int) else _NO_ADDR
+
+
+def read_records(data):
+    """Генератор записей журнала data (bytes, bytearray или memoryview): (вид, адрес, ticks_us, данные).
+    Данные - memoryview без копирования. Неполная последняя запись (обрыв питания) пропускается.
+    Generator of the log data records (bytes, bytearray or memoryview): (kind, address, ticks_us, data).
+    Data is a memoryview without copying. An incomplete last record (power loss) is skipped."""
+    mv = memoryview(data)
+    if bytes(mv[:4]) != _MAGIC:
+        raise ValueError("Invalid bus log!")
+    pos = 4
+    end = len(mv)
+    while pos + _HEADER_LEN <= end:
+        kind, addr, ticks, n = struct.unpack_from(_HEADER, mv, pos)
+        pos += _HEADER_LEN
+        if pos + n > end:
+            return
+        yield kind, addr, ticks, mv[pos:pos + n]
+        pos += n
+
+
+class RecordingAdapter(BusAdapter):
+    """Адаптер-обертка, записывающий каждый обмен другого адаптера (вид, адрес, ticks_us, данные) в журнал.
+    Записи копируются в буфер, выделенный в конструкторе, и передаются в sink целыми буферами, поэтому запись
+    можно оставлять включенной в рабочем устройстве. Заголовок записи - 8 байт.
+    sink - объект с методом write (например, файл, открытый в режиме "wb"). Не забывайте вызывать flush/close!
+    Wrapper adapter recording every transfer of another adapter (kind, address, ticks_us, data) into a log.
+    Records are copied into a buffer allocated in the constructor and passed to sink in whole buffers, so recording
+    can be left enabled on a production device. The record header is 8 bytes.
+    sink - an object with the write method (for example, a file opened in "wb" mode). Do not forget to call
+    flush/close!"""
+
+    def __init__(self, adapter: BusAdapter, sink, buf_size: int = 1024):
+        super().__init__(adapter.bus)
+        self.inner = adapter
+        self.sink = sink
+        self._buf = bytearray(buf_size)
+        self._mv = memoryview(self._buf)
+        self._buf[:4] = _MAGIC
+        self._pos = 4
+        # счетчики. counters
+        self.records = 0
+        self.flushes = 0
+
+    def flush(self):
+        """Передает накопленные записи в sink. Passes the accumulated records to sink."""
+        if self._pos:
+            self.sink.write(self._mv[:self._pos])
+            self._pos = 0
+            self.flushes += 1
+
+    def close(self):
+        self.flush()
+        flush = getattr(self.sink, "flush", None)
+        if flush is not None:
+            flush()
+
+    def _reserve(self, n: int) -> int:
+        """Освобождает место для n байт. Возвращает позицию или -1, если запись больше буфера.
+        Frees space for n bytes. Returns the position or -1 if the record is larger than the buffer."""
+        if self._pos + n > len(self._buf):
+            self.flush()
+            if n > len(self._buf):
+                return -1
+        return self._pos
+
+    def _record(self, kind: int, device_addr, data, ticks: int):
+        n = len(data)
+        pos = self._reserve(_HEADER_LEN + n)
+        self.records += 1
+        if pos < 0:
+            # больше буфера: напрямую в sink. larger than the buffer: directly to sink
+            self.sink.write(struct.pack(_HEADER, kind, _addr_byte(device_addr), ticks, n))
+            self.sink.write(data)
+            return
+        struct.pack_into(_HEADER, self._buf, pos, kind, _addr_byte(device_addr), ticks, n)
+        pos += _HEADER_LEN
+        self._mv[pos:pos + n] = data
+        self._pos = pos + n
+
+    def _record_parts(self, kind: int, device_addr, parts, ticks: int):
+        """Запись из нескольких буферов без их объединения. A record from several buffers without joining them."""
+        n = 0
+        for part in parts:
+            n += len(part)
+        pos = self._reserve(_HEADER_LEN + n)
+        if pos < 0:
+            return self._record(kind, device_addr, b"".join(parts), ticks)
+        self.records += 1
+        struct.pack_into(_HEADER, self._buf, pos, kind, _addr_byte(device_addr), ticks, n)
+        pos += _HEADER_LEN
+        for part in parts:
+            k = len(part)
+            self._mv[pos:pos + k] = part
+            pos += k
+        self._pos = pos
+
+    def _record_error(self, kind: int, device_addr, exc: OSError, ticks: int):
+        code = exc.args[0] if exc.args and isinstance(exc.args[0], int) else 0
+        self._record(kind | REC_ERROR, device_addr, bytes((code & 0xFF,)), ticks)
+
+    def write(self, device_addr, buf: bytes):
+        ticks = time.ticks_us()
+        try:
+            result = self.inner.write(device_addr, buf)
+        except OSError as e:
+            self._record_error(REC_WRITE, device_addr, e, ticks)
+            raise
+        self._record(REC_WRITE, device_addr, buf, ticks)
+        return result
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        ticks = time.ticks_us()
+        try:
+            result = self.inner.read_to_buf(device_addr, buf)
+        except OSError as e:
+            self._record_error(REC_READ, device_addr, e, ticks)
+            raise
+        self._record(REC_READ, device_addr, buf, ticks)
+        return result
+
+    def read(self, device_addr, n_bytes: int) -> bytes:
+        ticks = time.ticks_us()
+        try:
+            result = self.inner.read(device_addr, n_bytes)
+        except OSError as e:
+            self._record_error(REC_READ, device_addr, e, ticks)
+            raise
+        self._record(REC_READ, device_addr, result, ticks)
+        return result
+
+    def write_then_read_into(self, device_addr, out_buf, in_buf, delay_us: int = 0):
+        """Записывается парой записей: запись с флагом REC_COMBINED и чтение. При ошибке - одна запись с флагом
+        REC_ERROR.
+        Recorded as a pair of records: a write with the REC_COMBINED flag and a read. On an error - one record with
+        the REC_ERROR flag."""
+        ticks = time.ticks_us()
+        parts = out_buf if isinstance(out_buf, (tuple, list)) else (out_buf,)
+        try:
+            result = self.inner.write_then_read_into(device_addr, out_buf, in_buf, delay_us)
+        except OSError as e:
+            self._record_error(REC_WRITE | REC_COMBINED, device_addr, e, ticks)
+            raise
+        self._record_parts(REC_WRITE | REC_COMBINED, device_addr, parts, ticks)
+        self._record(REC_READ, device_addr, in_buf, time.ticks_add(ticks, delay_us))
+        return result
+
+    # остальные методы передаются без записи. the other methods are passed through without recording
+    def read_register(self, device_addr, reg_addr: int, bytes_count: int) -> bytes:
+        return self.inner.read_register(device_addr, reg_addr, bytes_count)
+
+    def write_register(self, device_addr, reg_addr: int, value: [int, bytes, bytearray], bytes_count: int,
+                       byte_order: str):
+        return self.inner.write_register(device_addr, reg_addr, value, bytes_count, byte_order)
+
+    def read_buf_from_memory(self, device_addr, mem_addr, buf, address_size: int = 1):
+        return self.inner.read_buf_from_memory(device_addr, mem_addr, buf, address_size)
+
+    def write_buf_to_memory(self, device_addr, mem_addr, buf):
+        return self.inner.write_buf_to_memory(device_addr, mem_addr, buf)
+
+
+class ReplayAdapter(BusAdapter):
+    """Адаптер, воспроизводящий журнал RecordingAdapter: возвращает записанные ответы и записанные ошибки
+    и проверяет, что драйвер выдает те же записи (если check Истина), иначе ValueError. Не ждет, поэтому
+    воспроизведение идет с наибольшей скоростью; ожидания самого драйвера на ПК убирают виртуальные часы
+    (host_time). on_tick(ticks_us) - необязательная функция, вызываемая с записанным временем каждого обмена.
+    Adapter replaying a RecordingAdapter log: returns the recorded responses and recorded errors and checks that
+    the driver issues the same writes (if check is True), otherwise ValueError. It does not wait, so replay runs
+    as fast as possible; the driver's own waits on a PC are removed by the virtual clock (host_time).
+    on_tick(ticks_us) - an optional function called with the recorded time of each transfer."""
+
+    def __init__(self, data, check: bool = True, on_tick=None):
+        super().__init__(None)
+        self._records = read_records(data)
+        self.check = check
+        self.on_tick = on_tick
+        # номер текущей записи. current record number
+        self.position = 0
+
+    def _next(self, kind: int, device_addr) -> memoryview:
+        """Следующая запись вида kind. Записанная ошибка возбуждается снова.
+        The next record of kind. A recorded error is raised again."""
+        try:
+            rec_kind, addr, ticks, data = next(self._records)
+        except StopIteration:
+            raise ValueError(f"Bus log is over! Record: {self.position}") from None
+        self.position += 1
+        if self.on_tick is not None:
+            self.on_tick(ticks)
+        if (rec_kind & ~REC_ERROR) != kind or (self.check and addr != _addr_byte(device_addr)):
+            raise ValueError(f"Replay mismatch! Record: {self.position - 1}, kind: {rec_kind}, expected: {kind}, "
+                             f"address: {addr}")
+        if rec_kind & REC_ERROR:
+            raise OSError(data[0])
+        return data
+
+    def _check_write(self, data: memoryview, parts):
+        if not self.check:
+            return
+        pos = 0
+        for part in parts:
+            n = len(part)
+            if bytes(data[pos:pos + n]) != bytes(part):
+                raise ValueError(f"Replay mismatch! Record: {self.position - 1}, data: {bytes(data).hex()}")
+            pos += n
+        if pos != len(data):
+            raise ValueError(f"Replay mismatch! Record: {self.position - 1}, length: {len(data)}")
+
+    def _fill(self, data: memoryview, buf):
+        if len(data) != len(buf):
+            raise ValueError(f"Replay mismatch! Record: {self.position - 1}, length: {len(data)}")
+        buf[:] = data
+
+    def write(self, device_addr, buf: bytes):
+        self._check_write(self._next(REC_WRITE, device_addr), (buf,))
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        self._fill(self._next(REC_READ, device_addr), buf)
+        return buf
+
+    def read(self, device_addr, n_bytes: int) -> bytes:
+        data = self._next(REC_READ, device_addr)
+        if len(data) != n_bytes:
+            raise ValueError(f"Replay mismatch! Record: {self.position - 1}, length: {len(data)}")
+        return bytes(data)
+
+    def write_then_read_into(self, device_addr, out_buf, in_buf, delay_us: int = 0):
+        parts = out_buf if isinstance(out_buf, (tuple, list)) else (out_buf,)
+        self._check_write(self._next(REC_WRITE | REC_COMBINED, device_addr), parts)
+        self._fill(self._next(REC_READ, device_addr), in_buf)
+        return in_buf
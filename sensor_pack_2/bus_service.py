@@ -4,6 +4,7 @@
 """MicroPython модуль для работы с шинами ввода/вывода"""
 
 import math
+import time
 from machine import I2C, SPI, Pin
 
 
@@ -52,6 +53,22 @@ class BusAdapter:
         """Записывает в устройство на шине все байты из буфера buf"""
         raise NotImplementedError
 
+    def write_then_read_into(self, device_addr: [int, Pin], out_buf, in_buf, delay_us: int = 0):
+        """Записывает в устройство out_buf, ждет delay_us мкс и читает из устройства в буфер in_buf количество байт,
+        равное его длине. out_buf - буфер или кортеж/список буферов, передаваемых подряд, одной посылкой.
+        Реализация по умолчанию - через write и read_to_buf. Наследники выполняют обмен одной транзакцией.
+        Возвращает ссылку на in_buf.
+        Writes out_buf to the device, waits delay_us microseconds and reads from the device into in_buf a number of
+        bytes equal to its length. out_buf - a buffer or a tuple/list of buffers sent back to back, in one packet.
+        The default implementation uses write and read_to_buf. Descendants perform the exchange in one transaction.
+        Returns a reference to in_buf."""
+        if isinstance(out_buf, (tuple, list)):
+            out_buf = b"".join(out_buf)
+        self.write(device_addr, out_buf)
+        if delay_us:
+            time.sleep_us(delay_us)
+        return self.read_to_buf(device_addr, in_buf)
+
     def write_const(self, device_addr: [int, Pin], val: int, count: int):
         """Отправляет пакет байт со значение val количеством count на шину.
         Часто, при работе с дисплеями или памятью, требуется заполнение экрана/области
@@ -122,6 +139,24 @@ class I2cAdapter(BusAdapter):
     def write(self, device_addr: int, buf: bytes):
         return self.bus.writeto(device_addr, buf)
 
+    def write_then_read_into(self, device_addr: int, out_buf, in_buf, delay_us: int = 0):
+        """Без паузы чтение идет после повторного старта (repeated start), без STOP между записью и чтением.
+        С паузой шина на время ожидания освобождается (STOP), чтобы не блокировать другие устройства.
+        Кортеж/список буферов передается через writevto, без склеивания.
+        Without a pause, the read follows a repeated start, without STOP between the write and the read.
+        With a pause, the bus is released (STOP) for the wait time so as not to block other devices.
+        A tuple/list of buffers is sent via writevto, without concatenation."""
+        bus = self.bus
+        stop = 0 != delay_us
+        if isinstance(out_buf, (tuple, list)):
+            bus.writevto(device_addr, out_buf, stop)
+        else:
+            bus.writeto(device_addr, out_buf, stop)
+        if delay_us:
+            time.sleep_us(delay_us)
+        bus.readfrom_into(device_addr, in_buf)
+        return in_buf
+
     def read_buf_from_memory(self, device_addr: int, mem_addr, buf, address_size: int = 1):
         """Читает из устройства с адресом device_addr в буфер buf, начиная с адреса в устройстве mem_addr.
         Количество считываемых байт определяется длинной буфера buf.
@@ -227,6 +262,31 @@ class SpiAdapter(BusAdapter):
         finally:
             device_addr.value(1)
 
+    def write_then_read_into(self, device_addr: Pin, out_buf, in_buf, delay_us: int = 0):
+        """Запись и последующее чтение при одном выборе устройства (chip select). Без паузы и при равной длине
+        буферов обмен выполняется одним вызовом write_readinto (полный дуплекс).
+        Write followed by a read within one device selection (chip select). Without a pause and with equal buffer
+        lengths, the exchange is performed by a single write_readinto call (full duplex)."""
+        bus = self.bus
+        try:
+            device_addr.value(0)   # chip select
+            if self.use_data_mode_pin and self.data_mode_pin:
+                self.data_mode_pin.value(self.data_packet)
+            if not delay_us and not isinstance(out_buf, (tuple, list)) and len(out_buf) == len(in_buf):
+                bus.write_readinto(out_buf, in_buf)
+                return in_buf
+            if isinstance(out_buf, (tuple, list)):
+                for part in out_buf:
+                    bus.write(part)
+            else:
+                bus.write(out_buf)
+            if delay_us:
+                time.sleep_us(delay_us)
+            bus.readinto(in_buf, 0x00)
+            return in_buf
+        finally:
+            device_addr.value(1)
+
     def read_buf_from_memory(self, device_addr: Pin, mem_addr, buf, address_size: int):
         """Читает из устройства с адресом device_addr в буфер buf, начиная с адреса в устройстве mem_addr.
         Количество считываемых байт определяется длинной буфера buf."""
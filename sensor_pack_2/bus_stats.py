@@ -0,0 +1,263 @@
+# micropython
+# MIT license
+"""Инструментирование шины: счетчики, время на шине, время ожидания и гистограммы задержек по командам.
+Bus instrumentation: counters, bus time, wait time and latency histograms per command."""
+
+from collections import namedtuple
+from array import array
+from sensor_pack_2.bus_service import BusAdapter
+import micropython
+import time
+
+# верхние границы корзин гистограммы задержки команды, мкс. Последняя корзина - все, что больше.
+# upper bounds of the command latency histogram buckets, us. The last bucket is everything greater.
+_bounds_us = (500, 1000, 2000, 5000, 10_000, 20_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+HIST_BUCKETS = len(_bounds_us) + 1
+
+# статистика одной команды. key - ключ команды (код) или None для неопознанных обменов.
+# statistics of one command. key - command key (code) or None for unattributed transfers.
+command_stats = namedtuple("command_stats", "key calls tx_bytes rx_bytes bus_us wait_ms crc_errors os_errors "
+                                            "retries histogram")
+
+
+def get_bucket_bounds() -> tuple:
+    """Возвращает верхние границы корзин гистограммы, мкс. Returns the upper bounds of the histogram buckets, us."""
+    return _bounds_us
+
+
+def _zeros(typecode: str, count: int) -> array:
+    return array(typecode, (0 for _ in range(count)))
+
+
+class BusStats:
+    """Статистика обменов по шине, по ключам команд. Вся память под счетчики выделяется в конструкторе, на каждый
+    ключ отводится слот. Ключи сверх max_keys учитываются в общем слоте неопознанных обменов (key None).
+    Суммы времени 32-х битные: bus_us переполняется примерно через 71 минуту суммарного времени на шине,
+    делайте снимок и сброс периодически!
+    Bus transfer statistics, by command keys. All counter memory is allocated in the constructor, each key gets
+    a slot. Keys beyond max_keys are counted in the common slot of unattributed transfers (key None).
+    Time sums are 32-bit: bus_us overflows after about 71 minutes of total bus time, take a snapshot and reset
+    periodically!"""
+
+    def __init__(self, max_keys: int = 24):
+        self.max_keys = max_keys
+        # ключ -> слот. Слот max_keys - неопознанные обмены. key -> slot. Slot max_keys - unattributed transfers
+        self._slots = dict()
+        n = max_keys + 1
+        self._calls = _zeros("I", n)
+        self._tx = _zeros("I", n)
+        self._rx = _zeros("I", n)
+        self._bus_us = _zeros("I", n)
+        self._wait_ms = _zeros("I", n)
+        self._crc = _zeros("I", n)
+        self._os = _zeros("I", n)
+        self._retries = _zeros("I", n)
+        self._hist = _zeros("I", n * HIST_BUCKETS)
+
+    def slot(self, key: [int, None]) -> int:
+        """Возвращает слот ключа key, назначая его при первом обращении.
+        Returns the slot of the key, assigning it on the first access."""
+        if key is None:
+            return self.max_keys
+        s = self._slots.get(key)
+        if s is None:
+            s = len(self._slots)
+            if s >= self.max_keys:
+                return self.max_keys
+            self._slots[key] = s
+        return s
+
+    @micropython.native
+    def record_transfer(self, slot: int, tx_bytes: int, rx_bytes: int, bus_us: int, call: bool):
+        """Учитывает один обмен по шине. call - Истина, если обмен начинает новую команду.
+        Counts one bus transfer. call - True if the transfer starts a new command."""
+        if call:
+            self._calls[slot] += 1
+        self._tx[slot] += tx_bytes
+        self._rx[slot] += rx_bytes
+        self._bus_us[slot] += bus_us
+
+    def record_wait(self, slot: int, wait_ms: int):
+        """Учитывает ожидание между записью команды и чтением ответа.
+        Counts the wait between writing a command and reading the response."""
+        self._wait_ms[slot] += wait_ms
+
+    @micropython.native
+    def record_latency(self, slot: int, latency_us: int):
+        """Добавляет полную задержку команды (от начала записи до конца чтения ответа) в гистограмму.
+        Adds the full command latency (from the write start to the response read end) to the histogram."""
+        i = 0
+        for bound in _bounds_us:
+            if latency_us < bound:
+                break
+            i += 1
+        self._hist[slot * HIST_BUCKETS + i] += 1
+
+    def record_os_error(self, slot: int):
+        self._os[slot] += 1
+
+    def record_crc_error(self, key: [int, None]):
+        self._crc[self.slot(key)] += 1
+
+    def record_retry(self, key: [int, None]):
+        self._retries[self.slot(key)] += 1
+
+    def _get(self, key: [int, None], s: int) -> command_stats:
+        base = s * HIST_BUCKETS
+        return command_stats(key=key, calls=self._calls[s], tx_bytes=self._tx[s], rx_bytes=self._rx[s],
+                             bus_us=self._bus_us[s], wait_ms=self._wait_ms[s], crc_errors=self._crc[s],
+                             os_errors=self._os[s], retries=self._retries[s], histogram=tuple(self._hist[base:base + HIST_BUCKETS]))
+
+    def get(self, key: [int, None]) -> [command_stats, None]:
+        """Возвращает статистику команды key или None, если команда не встречалась.
+        Returns the statistics of the key command or None if the command has not occurred."""
+        if key is None:
+            return self._get(None, self.max_keys)
+        s = self._slots.get(key)
+        if s is None:
+            return None
+        return self._get(key, s)
+
+    def snapshot(self) -> tuple:
+        """Возвращает статистику всех встреченных команд, включая неопознанные обмены (key None), если они были.
+        Returns the statistics of all occurred commands, including unattributed transfers (key None), if any."""
+        result = [self._get(key, s) for key, s in self._slots.items()]
+        other = self._get(None, self.max_keys)
+        if other.calls or other.tx_bytes or other.rx_bytes or other.crc_errors or other.os_errors:
+            result.append(other)
+        return tuple(result)
+
+    def reset(self):
+        """Обнуляет все счетчики на месте. Слоты ключей сохраняются. Resets all counters in place. Key slots are kept."""
+        for arr in (self._calls, self._tx, self._rx, self._bus_us, self._wait_ms, self._crc, self._os, self._retries,
+                    self._hist):
+            for i in range(len(arr)):
+                arr[i] = 0
+
+
+class InstrumentedAdapter(BusAdapter):
+    """Адаптер-обертка, измеряющий обмены другого адаптера. Ключ команды - первые key_len байт записи (код команды
+    Sensirion). Чтение после записи по тому же адресу относится к этой команде, промежуток между ними учитывается
+    как время ожидания. Когда статистика не нужна, адаптер просто не используется, поэтому накладные расходы
+    выключенной статистики равны нулю!
+    Wrapper adapter measuring the transfers of another adapter. The command key is the first key_len bytes of a write
+    (Sensirion command code). A read after a write to the same address belongs to that command, the gap between them
+    is counted as wait time. When statistics are not needed, the adapter is simply not used, so the overhead
+    of disabled statistics is zero!"""
+
+    def __init__(self, adapter: BusAdapter, stats: BusStats, key_len: int = 2):
+        super().__init__(adapter.bus)
+        self.inner = adapter
+        self.stats = stats
+        self.key_len = key_len
+        # последняя записанная команда, ожидающая ответа. the last written command awaiting a response
+        self._open = False
+        self._addr = None
+        self._slot = 0
+        self._start = 0
+        self._write_end = 0
+
+    @micropython.native
+    def _get_key(self, buf) -> int:
+        n = self.key_len
+        if n > len(buf):
+            n = len(buf)
+        key = 0
+        for i in range(n):
+            key = (key << 8) | buf[i]
+        return key
+
+    def write(self, device_addr, buf: bytes):
+        stats = self.stats
+        slot = stats.slot(self._get_key(buf))
+        t0 = time.ticks_us()
+        if self._open:
+            # предыдущая команда завершилась без ответа, ее задержка - время записи
+            # the previous command completed without a response, its latency is the write time
+            stats.record_latency(self._slot, time.ticks_diff(self._write_end, self._start))
+            self._open = False
+        try:
+            result = self.inner.write(device_addr, buf)
+        except OSError:
+            stats.record_os_error(slot)
+            raise
+        t1 = time.ticks_us()
+        stats.record_transfer(slot, len(buf), 0, time.ticks_diff(t1, t0), True)
+        self._open = True
+        self._addr = device_addr
+        self._slot = slot
+        self._start = t0
+        self._write_end = t1
+        return result
+
+    def _read(self, device_addr, n_bytes: int, func, arg):
+        """Общая часть read и read_to_buf. Common part of read and read_to_buf."""
+        stats = self.stats
+        t0 = time.ticks_us()
+        matched = self._open and device_addr == self._addr
+        self._open = False
+        if matched:
+            slot = self._slot
+            stats.record_wait(slot, time.ticks_diff(t0, self._write_end) // 1000)
+        else:
+            slot = stats.slot(None)
+        try:
+            result = func(device_addr, arg)
+        except OSError:
+            stats.record_os_error(slot)
+            raise
+        t1 = time.ticks_us()
+        stats.record_transfer(slot, 0, n_bytes, time.ticks_diff(t1, t0), not matched)
+        if matched:
+            stats.record_latency(slot, time.ticks_diff(t1, self._start))
+        return result
+
+    def read(self, device_addr, n_bytes: int) -> bytes:
+        return self._read(device_addr, n_bytes, self.inner.read, n_bytes)
+
+    def read_to_buf(self, device_addr, buf) -> bytes:
+        return self._read(device_addr, len(buf), self.inner.read_to_buf, buf)
+
+    def write_then_read_into(self, device_addr, out_buf, in_buf, delay_us: int = 0):
+        """Обмен одной транзакцией внутреннего адаптера. Время на шине - полное время без паузы delay_us.
+        Exchange in one transaction of the inner adapter. Bus time is the full time without the delay_us pause."""
+        stats = self.stats
+        if isinstance(out_buf, (tuple, list)):
+            key_buf = out_buf[0]
+            tx_bytes = 0
+            for part in out_buf:
+                tx_bytes += len(part)
+        else:
+            key_buf = out_buf
+            tx_bytes = len(out_buf)
+        slot = stats.slot(self._get_key(key_buf))
+        t0 = time.ticks_us()
+        if self._open:
+            stats.record_latency(self._slot, time.ticks_diff(self._write_end, self._start))
+            self._open = False
+        try:
+            result = self.inner.write_then_read_into(device_addr, out_buf, in_buf, delay_us)
+        except OSError:
+            stats.record_transfer(slot, 0, 0, 0, True)
+            stats.record_os_error(slot)
+            raise
+        latency = time.ticks_diff(time.ticks_us(), t0)
+        bus_us = latency - delay_us
+        stats.record_transfer(slot, tx_bytes, len(in_buf), bus_us if bus_us > 0 else 0, True)
+        stats.record_wait(slot, delay_us // 1000)
+        stats.record_latency(slot, latency)
+        return result
+
+    # остальные методы передаются без измерения. the other methods are passed through without measurement
+    def read_register(self, device_addr, reg_addr: int, bytes_count: int) -> bytes:
+        return self.inner.read_register(device_addr, reg_addr, bytes_count)
+
+    def write_register(self, device_addr, reg_addr: int, value: [int, bytes, bytearray], bytes_count: int,
+                       byte_order: str):
+        return self.inner.write_register(device_addr, reg_addr, value, bytes_count, byte_order)
+
+    def read_buf_from_memory(self, device_addr, mem_addr, buf, address_size: int = 1):
+        return self.inner.read_buf_from_memory(device_addr, mem_addr, buf, address_size)
+
+    def write_buf_to_memory(self, device_addr, mem_addr, buf):
+        return self.inner.write_buf_to_memory(device_addr, mem_addr, buf)
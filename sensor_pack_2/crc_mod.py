@@ -16,6 +16,8 @@ Copyright (c) 2022 Roman Shevchik
     Входная последовательность: 0 1 2 3 4 5 6 7 8 9
     CRC-8: 0x52"""
 
+import micropython
+
 
 def crc8(sequence: bytes, polynomial: int, init_value: int = 0x00, final_xor = 0x00):
     mask = 0xFF
@@ -28,3 +30,41 @@ def crc8(sequence: bytes, polynomial: int, init_value: int = 0x00, final_xor = 0
             else:
                 crc = mask & (crc << 1)
     return crc ^ final_xor
+
+
+def make_crc8_table(polynomial: int) -> bytes:
+    """Возвращает таблицу из 256 значений CRC-8 для полинома polynomial. Вычисляется один раз!
+    Returns a 256-entry CRC-8 lookup table for the polynomial. Computed once!"""
+    return bytes(crc8((i,), polynomial) for i in range(256))
+
+
+# таблица для полинома 0x31 (Sensirion). table for polynomial 0x31 (Sensirion)
+_crc8_31_table = make_crc8_table(0x31)
+
+
+@micropython.native
+def crc8_31(sequence, start: int = 0, stop: int = -1) -> int:
+    """Табличное вычисление CRC-8, полином 0x31, начальное значение 0xFF, для sequence[start:stop] без создания среза.
+    sequence - bytes, bytearray или memoryview. Если stop < 0, то stop = len(sequence).
+    Table-driven CRC-8, polynomial 0x31, init value 0xFF, over sequence[start:stop] without slicing.
+    sequence - bytes, bytearray or memoryview. If stop < 0, then stop = len(sequence)."""
+    tbl = _crc8_31_table
+    if stop < 0:
+        stop = len(sequence)
+    crc = 0xFF
+    for i in range(start, stop):
+        crc = tbl[crc ^ sequence[i]]
+    return crc
+
+
+@micropython.native
+def verify_words(buf, n_words: int) -> bool:
+    """Проверяет за один проход все тройки (старший байт, младший байт, CRC) в кадре датчика Sensirion (3 или 9 байт).
+    Память не выделяет. Возвращает Истина, если все CRC верны.
+    Checks all (MSB, LSB, CRC) triplets of a Sensirion frame (3 or 9 bytes) in a single pass.
+    No memory allocation. Returns True if all CRCs are correct."""
+    tbl = _crc8_31_table
+    for i in range(0, 3 * n_words, 3):
+        if buf[i + 2] != tbl[tbl[0xFF ^ buf[i]] ^ buf[i + 1]]:
+            return False
+    return True
@@ -0,0 +1,46 @@
+# micropython
+# MIT license
+"""Политика повторов обменов по шине при ошибках CRC и ввода/вывода.
+Retry policy for bus transfers on CRC and I/O errors."""
+
+
+class RetryPolicy:
+    """Ограниченное количество попыток с экспоненциально растущей паузой между ними. Сама политика не ждет, она
+    только решает, повторять ли попытку, и сколько ждать перед ней. Ждет драйвер: time.sleep_ms, asyncio.sleep_ms
+    или крайний срок в кооперативном цикле.
+    A bounded number of attempts with an exponentially growing pause between them. The policy itself does not wait,
+    it only decides whether to retry and how long to wait before that. The driver waits: time.sleep_ms,
+    asyncio.sleep_ms or a deadline in a cooperative loop."""
+
+    def __init__(self, max_attempts: int = 3, backoff_ms: int = 5, backoff_factor: int = 2, max_backoff_ms: int = 100,
+                 retry_on: tuple = (OSError, ValueError)):
+        """max_attempts - наибольшее количество попыток, включая первую.
+        backoff_ms - пауза перед первым повтором, мс. Каждая следующая пауза в backoff_factor раз больше,
+        но не более max_backoff_ms.
+        retry_on - типы исключений, при которых допустим повтор (OSError - NACK/EIO, ValueError - ошибка CRC).
+        max_attempts - the maximum number of attempts, including the first one.
+        backoff_ms - pause before the first retry, ms. Each next pause is backoff_factor times longer,
+        but no more than max_backoff_ms.
+        retry_on - exception types on which a retry is allowed (OSError - NACK/EIO, ValueError - CRC error)."""
+        if max_attempts < 1:
+            raise ValueError(f"Invalid max_attempts: {max_attempts}")
+        self.max_attempts = max_attempts
+        self.backoff_ms = backoff_ms
+        self.backoff_factor = backoff_factor
+        self.max_backoff_ms = max_backoff_ms
+        self.retry_on = retry_on
+
+    def should_retry(self, attempt: int, exc: Exception) -> bool:
+        """Возвращает Истина, если после неудачной попытки номер attempt (с 1) с исключением exc нужен повтор.
+        Returns True if a retry is needed after the failed attempt number attempt (from 1) with the exc exception."""
+        return attempt < self.max_attempts and isinstance(exc, self.retry_on)
+
+    def get_delay(self, attempt: int) -> int:
+        """Возвращает паузу в мс перед повтором после неудачной попытки номер attempt (с 1).
+        Returns the pause in ms before a retry after the failed attempt number attempt (from 1)."""
+        delay = self.backoff_ms
+        for _ in range(attempt - 1):
+            delay *= self.backoff_factor
+            if delay >= self.max_backoff_ms:
+                return self.max_backoff_ms
+        return delay if delay < self.max_backoff_ms else self.max_backoff_ms